@@ -10,6 +10,29 @@ from aiogram.filters import CommandObject
 import asyncpg
 
 from .config import settings
+from .constants import BOT_STATUS_CACHE_TTL
+from .utils.cache import TTLCache
+
+# Множество ID администраторов для проверки за O(1); список ADMINS читается один раз
+ADMIN_IDS: frozenset[int] = frozenset(settings.ADMINS)
+# Супер-админ - это первый ID в списке ADMINS (None, если список пуст)
+SUPER_ADMIN_ID: int | None = settings.ADMINS[0] if settings.ADMINS else None
+
+# Проверка статуса выполняется на каждое сообщение, поэтому текст запроса общий
+SQL_BOT_STATUS = "SELECT is_active FROM bot_status ORDER BY id DESC LIMIT 1"
+
+# Все счётчики админ-статистики за один проход по logs
+# (COUNT(DISTINCT ...) и так пропускает NULL в username)
+SQL_ADMIN_STATS = """
+    SELECT COUNT(DISTINCT username) AS count_users,
+           COUNT(*) AS count_msgs,
+           COUNT(*) FILTER (WHERE answer LIKE '❌%') AS count_errors
+    FROM logs
+"""
+
+# Флаг активности бота меняется только командами /bot_on и /bot_off,
+# поэтому между ними достаточно короткого кеша
+_bot_status_cache = TTLCache(ttl=BOT_STATUS_CACHE_TTL, maxsize=1)
 
 
 def is_admin(user_id: int) -> bool:
@@ -19,7 +42,7 @@ def is_admin(user_id: int) -> bool:
     :param user_id: ID пользователя Telegram
     :return: True, если пользователь является администратором
     """
-    return user_id in settings.ADMINS
+    return user_id in ADMIN_IDS
 
 
 def is_super_admin(user_id: int) -> bool:
@@ -35,13 +58,8 @@ def is_super_admin(user_id: int) -> bool:
     :param user_id: ID пользователя Telegram
     :return: True, если пользователь является супер-администратором
     """
-    if settings.ADMINS:
-        # Супер-админ - это первый ID в списке ADMINS
-        super_admin_id = settings.ADMINS[0]
-        return user_id == super_admin_id
-    else:
-        # Если список ADMINS пуст - отказываем в доступе
-        return False
+    # Если список ADMINS пуст, SUPER_ADMIN_ID равен None - отказываем в доступе
+    return SUPER_ADMIN_ID is not None and user_id == SUPER_ADMIN_ID
 
 
 async def is_bot_active(pool: asyncpg.pool.Pool) -> bool:
@@ -53,29 +71,24 @@ async def is_bot_active(pool: asyncpg.pool.Pool) -> bool:
     """
     if not pool:
         return True  # Если нет подключения к БД, бот считается активным
+    
+    is_active = _bot_status_cache.get("is_active")
+    if is_active is not None:
+        return is_active
         
     try:
         async with pool.acquire() as conn:
-            # Проверяем существование таблицы bot_status
-            table_exists = await conn.fetchval("""
-                SELECT EXISTS (
-                    SELECT FROM information_schema.tables 
-                    WHERE table_name = 'bot_status'
-                )
-            """)
-            
-            if not table_exists:
-                # Если таблицы нет, бот активен по умолчанию
-                return True
-                
-            row = await conn.fetchrow("SELECT is_active FROM bot_status ORDER BY id DESC LIMIT 1")
-            if row is None:
-                # Если записей нет, бот активен по умолчанию
-                return True
-            return row["is_active"]
+            # Таблица bot_status создаётся из schema.sql при запуске; если её всё же
+            # нет, запрос упадёт и бот будет считаться активным (см. except ниже)
+            row = await conn.fetchrow(SQL_BOT_STATUS)
     except Exception:
-        # В случае ошибки считаем бот активным
+        # В случае ошибки считаем бот активным (и не кешируем результат)
         return True
+    
+    # Если записей нет, бот активен по умолчанию
+    is_active = True if row is None else row["is_active"]
+    _bot_status_cache.set("is_active", is_active)
+    return is_active
 
 
 async def cmd_admin_stats(message: types.Message, pool: asyncpg.pool.Pool):
@@ -91,18 +104,14 @@ async def cmd_admin_stats(message: types.Message, pool: asyncpg.pool.Pool):
 
     try:
         async with pool.acquire() as conn:
-            # Получаем количество уникальных пользователей
-            count_users = await conn.fetchval("SELECT COUNT(DISTINCT username) FROM logs WHERE username IS NOT NULL")
-            # Получаем общее количество сообщений
-            count_msgs = await conn.fetchval("SELECT COUNT(*) FROM logs")
-            # Получаем количество ошибок (сообщений с ошибками)
-            count_errors = await conn.fetchval("SELECT COUNT(*) FROM logs WHERE answer LIKE '❌%'")
+            # Пользователи, сообщения и ошибки одним запросом
+            row = await conn.fetchrow(SQL_ADMIN_STATS)
 
         await message.answer(
             f"👑 Админ-панель:\n"
-            f"📊 Пользователей: {count_users}\n"
-            f"💬 Сообщений в базе: {count_msgs}\n"
-            f"💥 Ошибок: {count_errors}"
+            f"📊 Пользователей: {row['count_users']}\n"
+            f"💬 Сообщений в базе: {row['count_msgs']}\n"
+            f"💥 Ошибок: {row['count_errors']}"
         )
     except Exception as e:
         await message.answer(f"❌ Ошибка при получении статистики: {e}")
@@ -149,24 +158,9 @@ async def cmd_bot_on(message: types.Message, pool: asyncpg.pool.Pool):
 
     try:
         async with pool.acquire() as conn:
-            # Проверяем существование таблицы bot_status
-            table_exists = await conn.fetchval("""
-                SELECT EXISTS (
-                    SELECT FROM information_schema.tables 
-                    WHERE table_name = 'bot_status'
-                )
-            """)
-            
-            if not table_exists:
-                # Создаем таблицу, если её нет
-                await conn.execute("""
-                    CREATE TABLE IF NOT EXISTS bot_status (
-                        id SERIAL PRIMARY KEY,
-                        is_active BOOLEAN DEFAULT TRUE
-                    )
-                """)
-            
+            # Таблица bot_status создаётся из schema.sql при запуске
             await conn.execute("INSERT INTO bot_status (is_active) VALUES (TRUE)")
+        _bot_status_cache.set("is_active", True)
         await message.answer("✅ Бот включён!")
     except Exception as e:
         await message.answer(f"❌ Ошибка при включении бота: {e}")
@@ -185,24 +179,9 @@ async def cmd_bot_off(message: types.Message, pool: asyncpg.pool.Pool):
 
     try:
         async with pool.acquire() as conn:
-            # Проверяем существование таблицы bot_status
-            table_exists = await conn.fetchval("""
-                SELECT EXISTS (
-                    SELECT FROM information_schema.tables 
-                    WHERE table_name = 'bot_status'
-                )
-            """)
-            
-            if not table_exists:
-                # Создаем таблицу, если её нет
-                await conn.execute("""
-                    CREATE TABLE IF NOT EXISTS bot_status (
-                        id SERIAL PRIMARY KEY,
-                        is_active BOOLEAN DEFAULT TRUE
-                    )
-                """)
-            
+            # Таблица bot_status создаётся из schema.sql при запуске
             await conn.execute("INSERT INTO bot_status (is_active) VALUES (FALSE)")
+        _bot_status_cache.set("is_active", False)
         await message.answer("🛑 Бот выключен!")
     except Exception as e:
         await message.answer(f"❌ Ошибка при выключении бота: {e}")
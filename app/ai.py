@@ -5,12 +5,63 @@
 """
 
 import base64
+from typing import IO, Optional, Tuple, Union
+
+import httpx
 import openai
 from .config import settings
+from .constants import OPENAI_KEEPALIVE_EXPIRY, OPENAI_MAX_CONNECTIONS, OPENAI_MAX_KEEPALIVE_CONNECTIONS
 
 # Инициализация асинхронного клиента OpenAI. Требуется API‑ключ, который
 # должен быть задан в переменной окружения OPENAI_API_KEY.
-client = openai.AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
+# Клиент один на процесс: его пул держит HTTPS-соединения открытыми между
+# сообщениями, поэтому TLS-рукопожатие не повторяется на каждый запрос
+# (по умолчанию httpx закрывает простаивающее соединение через 5 секунд).
+client = openai.AsyncOpenAI(
+    api_key=settings.OPENAI_API_KEY,
+    http_client=openai.DefaultAsyncHttpxClient(
+        limits=httpx.Limits(
+            max_connections=OPENAI_MAX_CONNECTIONS,
+            max_keepalive_connections=OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY,
+        )
+    ),
+)
+
+
+# Модели с рассуждением (o1/o3/o4, gpt-5) не принимают max_tokens и temperature:
+# лимит задаётся max_completion_tokens и включает токены рассуждения,
+# поэтому к нему добавляется запас, чтобы на сам ответ что-то осталось
+REASONING_MODEL_PREFIXES = ("o1", "o3", "o4", "gpt-5")
+REASONING_TOKENS_HEADROOM = 4096
+
+# Приписка к ответу, который модель оборвала по лимиту токенов. Добавляется
+# только к сообщению в Telegram: в историю диалога и кеши ответов не попадает
+LENGTH_LIMIT_NOTE = "\n\n✂️ Ответ достиг лимита длины. Напишите «продолжи», чтобы получить окончание."
+
+
+def _generation_params(model: str, max_tokens: Optional[int] = None) -> dict:
+    """Параметры генерации с учётом семейства модели."""
+    if model.startswith(REASONING_MODEL_PREFIXES):
+        if max_tokens is None:
+            return {}
+        return {"max_completion_tokens": max_tokens + REASONING_TOKENS_HEADROOM}
+
+    params = {"temperature": settings.TEMPERATURE}
+    if max_tokens is not None:
+        params["max_tokens"] = max_tokens
+    return params
+
+
+def _reply_text(response) -> Tuple[str, bool]:
+    """Текст ответа модели и признак того, что он оборван по лимиту токенов."""
+    choice = response.choices[0]
+    return (choice.message.content or "").strip(), choice.finish_reason == "length"
+
+
+async def close_openai_client() -> None:
+    """Закрывает соединения клиента OpenAI (вызывается при остановке бота)."""
+    await client.close()
 
 
 async def openai_chat(system_prompt: str, user_message: str, model: str = None) -> str:
@@ -24,40 +75,46 @@ async def openai_chat(system_prompt: str, user_message: str, model: str = None)
     :raises Exception: При ошибке взаимодействия с API.
     """
     try:
+        model = model or settings.OPENAI_MODEL
         response = await client.chat.completions.create(
-            model=model or settings.OPENAI_MODEL,
+            model=model,
             messages=[
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": user_message},
             ],
-            temperature=settings.TEMPERATURE,
             timeout=settings.REQUEST_TIMEOUT,
+            **_generation_params(model),
         )
-        return response.choices[0].message.content.strip()
+        text, _ = _reply_text(response)
+        return text
     except Exception as e:
         raise Exception(f"Ошибка при вызове OpenAI API: {str(e)}")
 
 
-async def openai_chat_with_history(system_prompt: str, messages: list, model: str = None) -> str:
+async def openai_chat_with_history(
+    system_prompt: str, messages: list, model: str = None, max_tokens: Optional[int] = None
+) -> Tuple[str, bool]:
     """
     Отправляет запрос к модели OpenAI с историей сообщений.
 
     :param system_prompt: Системный промпт для управления поведением ИИ.
     :param messages: Список сообщений с полями 'role' и 'content'.
     :param model: Модель OpenAI для использования (по умолчанию из настроек).
-    :return: Ответ модели.
+    :param max_tokens: Лимит токенов ответа (None - без ограничения).
+    :return: Ответ модели и признак обрыва по лимиту токенов.
     :raises Exception: При ошибке взаимодействия с API.
     """
     try:
+        model = model or settings.OPENAI_MODEL
         full_messages = [{"role": "system", "content": system_prompt}]
         full_messages.extend(messages)
         response = await client.chat.completions.create(
-            model=model or settings.OPENAI_MODEL,
+            model=model,
             messages=full_messages,
-            temperature=settings.TEMPERATURE,
             timeout=settings.REQUEST_TIMEOUT,
+            **_generation_params(model, max_tokens),
         )
-        return response.choices[0].message.content.strip()
+        return _reply_text(response)
     except Exception as e:
         raise Exception(f"Ошибка при вызове OpenAI API: {str(e)}")
 
@@ -143,56 +200,27 @@ async def openai_tts(text: str, voice: str = "alloy") -> bytes:
         raise Exception(f"Ошибка при синтезе речи: {str(e)}")
 
 
-async def openai_stt(audio_path: str) -> str:
+async def openai_stt(audio: Union[bytes, IO[bytes]], filename: str = "voice.ogg") -> str:
     """
     Преобразует аудио в текст с помощью OpenAI Whisper.
 
-    :param audio_path: Путь к аудиофайлу для распознавания.
+    Whisper принимает OGG/Opus из Telegram напрямую, поэтому аудио
+    передаётся из памяти без конвертации и временных файлов.
+
+    :param audio: Содержимое аудиофайла (байты или файловый объект).
+    :param filename: Имя файла; по расширению API определяет формат.
     :return: Распознанный текст.
     :raises Exception: При ошибке взаимодействия с API.
     """
-    import tempfile
-    import os
-    
-    converted_path = None
     try:
-        # Проверяем формат файла и конвертируем при необходимости
-        if audio_path.endswith('.ogg'):
-            try:
-                from pydub import AudioSegment
-                # Конвертируем OGG в WAV для лучшей совместимости
-                audio = AudioSegment.from_ogg(audio_path)
-                
-                # Создаем временный WAV файл
-                with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as temp_file:
-                    converted_path = temp_file.name
-                    
-                audio.export(converted_path, format="wav")
-                file_to_use = converted_path
-            except ImportError:
-                # Если pydub не установлен, используем оригинальный файл
-                file_to_use = audio_path
-        else:
-            file_to_use = audio_path
-            
-        # Отправляем на распознавание в OpenAI Whisper
-        with open(file_to_use, "rb") as audio_file:
-            response = await client.audio.transcriptions.create(
-                model="whisper-1",
-                file=audio_file,
-                response_format="text"
-            )
+        response = await client.audio.transcriptions.create(
+            model="whisper-1",
+            file=(filename, audio),
+            response_format="text"
+        )
         return response.strip() if hasattr(response, 'strip') else str(response).strip()
-        
     except Exception as e:
         raise Exception(f"Ошибка при распознавании речи: {str(e)}")
-    finally:
-        # Удаляем временный файл если он был создан
-        if converted_path and os.path.exists(converted_path):
-            try:
-                os.unlink(converted_path)
-            except Exception:
-                pass  # Игнорируем ошибки удаления
 
 
 async def openai_embeddings(text: str) -> list:
@@ -217,7 +245,10 @@ async def openai_embeddings(text: str) -> list:
         raise Exception(f"Ошибка при создании эмбеддинга: {str(e)}")
 
 
-async def openai_chat_with_personal_context(system_prompt: str, messages: list, user_context: str = "", model: str = None) -> str:
+async def openai_chat_with_personal_context(
+    system_prompt: str, messages: list, user_context: str = "", model: str = None,
+    max_tokens: Optional[int] = None
+) -> Tuple[str, bool]:
     """
     Отправляет запрос к модели OpenAI с учетом персонального контекста пользователя.
     
@@ -225,7 +256,8 @@ async def openai_chat_with_personal_context(system_prompt: str, messages: list,
     :param messages: История сообщений
     :param user_context: Персональный контекст пользователя из векторной памяти
     :param model: Модель для использования
-    :return: Ответ модели
+    :param max_tokens: Лимит токенов ответа (None - без ограничения)
+    :return: Ответ модели и признак обрыва по лимиту токенов
     :raises Exception: При ошибке взаимодействия с API
     """
     try:
@@ -238,12 +270,13 @@ async def openai_chat_with_personal_context(system_prompt: str, messages: list,
         full_messages = [{"role": "system", "content": enhanced_system_prompt}]
         full_messages.extend(messages)
         
+        model = model or settings.OPENAI_MODEL
         response = await client.chat.completions.create(
-            model=model or settings.OPENAI_MODEL,
+            model=model,
             messages=full_messages,
-            temperature=settings.TEMPERATURE,
-            timeout=settings.REQUEST_TIMEOUT
+            timeout=settings.REQUEST_TIMEOUT,
+            **_generation_params(model, max_tokens),
         )
-        return response.choices[0].message.content.strip()
+        return _reply_text(response)
     except Exception as e:
         raise Exception(f"Ошибка при вызове OpenAI API с персональным контекстом: {str(e)}")
@@ -33,8 +33,17 @@ class Settings:
     REQUEST_TIMEOUT: int = int(os.getenv("REQUEST_TIMEOUT", "30"))
     # Максимальная длина ответа, который бот может отправить в Telegram
     MAX_TG_REPLY: int = int(os.getenv("MAX_TG_REPLY", "3500"))
+    # Лимит токенов ответа в основном чате: около трёх символов на токен, чтобы
+    # генерация заканчивалась примерно на длине MAX_TG_REPLY (для моделей
+    # с рассуждением к нему добавляется запас на токены рассуждения)
+    MAX_RESPONSE_TOKENS: int = int(os.getenv("MAX_RESPONSE_TOKENS", str(MAX_TG_REPLY // 3)))
+    # Максимальный размер изображения для анализа, байты (Bot API отдаёт файлы до 20 МБ)
+    MAX_IMAGE_BYTES: int = int(os.getenv("MAX_IMAGE_BYTES", str(20 * 1024 * 1024)))
     # Строка подключения к базе данных PostgreSQL
     DATABASE_URL: str = os.getenv("DATABASE_URL", "")
+    # Размер пула подключений к базе (по умолчанию максимум = 2 * CPU + 1)
+    DB_POOL_MIN_SIZE: int = int(os.getenv("DB_POOL_MIN_SIZE", "2"))
+    DB_POOL_MAX_SIZE: int = int(os.getenv("DB_POOL_MAX_SIZE", str((os.cpu_count() or 1) * 2 + 1)))
     # Список администраторов бота (через запятую)
     ADMINS: list = [int(x) for x in os.getenv("ADMINS", "").split(",") if x.strip().isdigit()] or []
 
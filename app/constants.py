@@ -11,6 +11,37 @@ MAX_NEWS_RESULTS = 3
 MAX_CONTENT_PREVIEW_LENGTH = 200
 MAX_TTS_LENGTH = 4000
 
+# Интервал обновления популярных команд для /stats (секунды)
+POPULAR_COMMANDS_REFRESH_INTERVAL = 300
+
+# Время жизни кеша строки user_settings в памяти процесса (секунды)
+USER_SETTINGS_CACHE_TTL = 60
+
+# Время жизни кеша флага активности бота (секунды)
+BOT_STATUS_CACHE_TTL = 5
+
+# Пакетная запись логов: максимум строк в пакете, пауза на накопление
+# пакета (секунды) и ёмкость очереди, сверх которой записи отбрасываются
+LOG_BATCH_SIZE = 500
+LOG_FLUSH_INTERVAL = 0.2
+LOG_QUEUE_MAXSIZE = 10000
+
+# Максимум одновременных фоновых запросов к OpenAI из кнопок и команд
+MAX_CONCURRENT_LLM_CALLS = 8
+
+# Пул HTTPS-соединений к OpenAI: общий лимит, число удерживаемых
+# keep-alive соединений и время их простоя (секунды)
+OPENAI_MAX_CONNECTIONS = 100
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = 30
+OPENAI_KEEPALIVE_EXPIRY = 75
+
+# Размер блока при потоковом скачивании файлов из Telegram (байты)
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+# Минимальный интервал между одинаковыми chat action в одном чате (секунды);
+# Telegram показывает статус около 5 секунд
+CHAT_ACTION_INTERVAL = 4
+
 # Голоса TTS
 TTS_VOICES: List[str] = [
     "alloy", "echo", "fable", "onyx", "nova", "shimmer"
@@ -21,7 +21,7 @@ async def handle_ai_agent_pro(callback_query: types.CallbackQuery) -> None:
         await callback_query.answer()
         
     except Exception as e:
-        logger.error(f"❌ Error in handle_ai_agent_pro: {e}")
+        logger.error("❌ Error in handle_ai_agent_pro: %s", e)
         await callback_query.answer("❌ Произошла ошибка", show_alert=True)
 
 
@@ -33,7 +33,7 @@ async def handle_back_to_main(callback_query: types.CallbackQuery) -> None:
         await callback_query.answer()
         
     except Exception as e:
-        logger.error(f"❌ Error in handle_back_to_main: {e}")
+        logger.error("❌ Error in handle_back_to_main: %s", e)
         await callback_query.answer("❌ Произошла ошибка", show_alert=True)
 
 
@@ -45,7 +45,7 @@ async def handle_change_language(callback_query: types.CallbackQuery) -> None:
         await callback_query.answer()
         
     except Exception as e:
-        logger.error(f"❌ Error in handle_change_language: {e}")
+        logger.error("❌ Error in handle_change_language: %s", e)
         await callback_query.answer("❌ Произошла ошибка", show_alert=True)
 
 
@@ -67,7 +67,7 @@ async def handle_set_language(callback_query: types.CallbackQuery, lang_code: st
             await callback_query.answer("❌ Ошибка установки языка", show_alert=True)
             
     except Exception as e:
-        logger.error(f"❌ Error in handle_set_language: {e}")
+        logger.error("❌ Error in handle_set_language: %s", e)
         await callback_query.answer("❌ Произошла ошибка", show_alert=True)
 
 
@@ -100,7 +100,7 @@ async def handle_web_search_menu(callback_query: types.CallbackQuery) -> None:
         await callback_query.answer()
         
     except Exception as e:
-        logger.error(f"❌ Error in handle_web_search_menu: {e}")
+        logger.error("❌ Error in handle_web_search_menu: %s", e)
         await callback_query.answer("❌ Произошла ошибка", show_alert=True)
 
 
@@ -134,7 +134,7 @@ async def handle_news_search_menu(callback_query: types.CallbackQuery) -> None:
         await callback_query.answer()
         
     except Exception as e:
-        logger.error(f"❌ Error in handle_news_search_menu: {e}")
+        logger.error("❌ Error in handle_news_search_menu: %s", e)
         await callback_query.answer("❌ Произошла ошибка", show_alert=True)
 
 
@@ -147,7 +147,7 @@ async def handle_toggle_versions_lang(callback_query: types.CallbackQuery) -> No
         await message_flow.show_pro_versions(callback_query, new_lang)
         await callback_query.answer()
     except Exception as e:
-        logger.error(f"❌ Error in handle_toggle_versions_lang: {e}")
+        logger.error("❌ Error in handle_toggle_versions_lang: %s", e)
         await callback_query.answer("❌ Произошла ошибка", show_alert=True)
 
 
@@ -158,7 +158,7 @@ async def handle_show_welcome(callback_query: types.CallbackQuery) -> None:
         await message_flow.show_welcome_screen(callback_query, user_lang)
         await callback_query.answer()
     except Exception as e:
-        logger.error(f"❌ Error in handle_show_welcome: {e}")
+        logger.error("❌ Error in handle_show_welcome: %s", e)
         await callback_query.answer("❌ Произошла ошибка", show_alert=True)
 
 
@@ -188,8 +188,8 @@ async def route_callback(callback_query: types.CallbackQuery) -> None:
         try:
             await handler(callback_query)
         except Exception as e:
-            logger.error(f"❌ Error in callback handler {handler_name}: {e}")
+            logger.error("❌ Error in callback handler %s: %s", handler_name, e)
             await callback_query.answer("❌ Произошла ошибка", show_alert=True)
     else:
-        logger.warning(f"⚠️ Unhandled callback: {handler_name}")
+        logger.warning("⚠️ Unhandled callback: %s", handler_name)
         await callback_query.answer("⚠️ Неизвестная команда", show_alert=True)
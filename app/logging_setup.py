@@ -0,0 +1,61 @@
+"""
+Настройка логирования для Telegram‑бота.
+
+Записи логов не пишутся в stderr прямо из обработчиков: корневой логгер
+получает только `QueueHandler`, который кладёт запись в очередь, а вывод
+выполняет `QueueListener` в отдельном потоке. Так запись в поток вывода
+не блокирует цикл событий asyncio под нагрузкой.
+"""
+
+import atexit
+import logging
+import logging.handlers
+import queue
+from typing import Optional
+
+# Формат по умолчанию: время, логгер и уровень, как в run_bot.py
+DEFAULT_LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+# Слушатель очереди (создаётся один раз за процесс)
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def setup_logging(level: int = logging.INFO, fmt: str = DEFAULT_LOG_FORMAT) -> None:
+    """
+    Переводит корневой логгер на неблокирующую запись через очередь.
+
+    Повторные вызовы ничего не делают, поэтому функцию можно безопасно
+    вызывать и из run_bot.py, и из app.main.
+
+    :param level: Уровень логирования корневого логгера
+    :param fmt: Формат записей для итогового обработчика вывода
+    """
+    global _listener
+
+    if _listener is not None:
+        return
+
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter(fmt))
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+
+    root = logging.getLogger()
+    # Убираем синхронные обработчики (например, от basicConfig)
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.setLevel(level)
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging() -> None:
+    """Останавливает поток вывода логов, дописав оставшиеся записи."""
+    global _listener
+
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -13,32 +13,46 @@ TODO: Этот файл слишком большой (2300+ строк) и тр
 import logging
 import os
 import asyncio
+import contextlib
+import io
+import itertools
+import re
+import signal
 from datetime import datetime
-from typing import Dict, Any, Optional
+from functools import lru_cache
+from typing import Dict, Any, Optional, Callable, Awaitable
 
-from aiogram import Bot, Dispatcher, types
+from aiogram import Bot, Dispatcher, F, types
 from aiogram.enums import ParseMode
 from aiogram.filters import Command, CommandObject
 from aiogram.client.default import DefaultBotProperties
-from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.types import BufferedInputFile, InlineKeyboardMarkup, InlineKeyboardButton
 import asyncpg
 
 from .config import settings
 from .constants import (
-    SEARCH_KEYWORDS, IMAGE_KEYWORDS, DEFAULT_SYSTEM_PROMPT, 
-    ERROR_MESSAGES, MAX_TTS_LENGTH
+    IMAGE_KEYWORDS, DEFAULT_SYSTEM_PROMPT, 
+    ERROR_MESSAGES, MAX_TTS_LENGTH, POPULAR_COMMANDS_REFRESH_INTERVAL,
+    MAX_CONCURRENT_LLM_CALLS, DOWNLOAD_CHUNK_SIZE, CHAT_ACTION_INTERVAL
 )
 from .services.search_service import search_service
 from .services.database_service import database_service
+from .services.user_service import user_service
 from .suggest import generate_prompt_from_logs
-from .ai import openai_chat, openai_image, openai_vision, openai_tts, openai_stt, openai_chat_with_history, openai_chat_with_personal_context
+from .ai import LENGTH_LIMIT_NOTE, close_openai_client, openai_chat, openai_image, openai_vision, openai_tts, openai_stt, openai_chat_with_history, openai_chat_with_personal_context
 from .admin import is_admin, is_super_admin, cmd_admin_stats, cmd_errors, cmd_bot_on, cmd_bot_off, is_bot_active
 from .handlers import route_callback
 from .webhook import WebhookManager
 from .vector_memory import personal_assistant
-
-# Настройка логирования
-logging.basicConfig(level=logging.INFO)
+from .logging_setup import setup_logging
+from .schema import SCHEMA_INDEXES, SCHEMA_SQL
+from .utils.cache import TTLCache
+from .utils.message_editor import WELCOME_IMAGE_AVAILABLE, answer_welcome_photo
+from .utils.text import truncate_reply
+
+# Настройка логирования (неблокирующая запись через очередь)
+setup_logging(logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Удалено: Tavily integration - теперь в services/search_service.py
@@ -46,8 +60,23 @@ logger = logging.getLogger(__name__)
 
 
 # Инициализация бота и диспетчера
+def create_bot_session() -> AiohttpSession:
+    """Создаёт HTTP-сессию бота; если установлен orjson, JSON разбирается через него."""
+    try:
+        import orjson
+    except ImportError:
+        # orjson не установлен, используем стандартный json
+        return AiohttpSession()
+
+    return AiohttpSession(
+        json_loads=orjson.loads,
+        json_dumps=lambda obj: orjson.dumps(obj).decode(),
+    )
+
+
 bot = Bot(
     token=settings.TELEGRAM_BOT_TOKEN,
+    session=create_bot_session(),
     default=DefaultBotProperties(parse_mode=ParseMode.HTML)
 )
 dp = Dispatcher()
@@ -55,11 +84,15 @@ dp = Dispatcher()
 # Пул подключений к базе данных (инициализируется при запуске)
 pool: asyncpg.pool.Pool | None = None
 
+# Ключи кешей для callback_data: счётчик вместо hash(text), чтобы разные
+# тексты не перетирали друг друга
+_cache_key_counter = itertools.count(1)
+
 # Кеш для хранения распознанных голосовых сообщений
-voice_messages_cache = {}
+voice_messages_cache = TTLCache(ttl=3600, maxsize=10000)
 
 # Кеш для хранения описаний изображений для генерации арта
-art_prompts_cache = {}
+art_prompts_cache = TTLCache(ttl=3600, maxsize=10000)
 
 # Кеш для хранения выбранных размеров арта пользователей
 user_art_sizes = {}
@@ -67,13 +100,82 @@ user_art_sizes = {}
 # Состояния пользователей для обработки персонального ассистента
 user_states = {}
 
-# Кеш ответов для кнопки "Переформулировать"
-response_cache: Dict[str, str] = {}
-# Кеш полнотекстовых ответов для кнопки "Показать полностью"
-full_response_cache: Dict[str, str] = {}
+# Кеш перефразов для цепочки кнопок "Переформулировать"
+response_cache = TTLCache(ttl=3600, maxsize=10000)
+# Кеш полных ответов ИИ для кнопок под ответом ("Показать полностью",
+# "Переформулировать", "Упростить", "Примеры"); каждый ответ хранится один раз
+full_response_cache = TTLCache(ttl=3600, maxsize=10000)
 # Выбранный режим ответа пользователя
 user_modes: Dict[int, str] = {}
 
+# SQL-запросы статистики. Текст запроса держим в константах: asyncpg кеширует
+# подготовленные выражения на соединении по тексту запроса, поэтому
+# повторные вызовы не тратят время на разбор и планирование.
+SQL_BOT_STATS = """
+    WITH totals AS (
+        -- Общее число записей берём из оценки планировщика (pg_class),
+        -- чтобы не сканировать всю таблицу; пока таблица ни разу не
+        -- анализировалась (reltuples < 0), считаем точно
+        SELECT CASE
+                   WHEN c.reltuples >= 0 THEN c.reltuples::bigint
+                   ELSE (SELECT COUNT(*) FROM logs)
+               END AS total_logs,
+               -- Уникальных пользователей считает фоновое обновление
+               (SELECT unique_users FROM logs_unique_users) AS unique_users
+        FROM pg_class c
+        WHERE c.oid = 'logs'::regclass
+    ),
+    popular AS (
+        -- Топ команд заранее посчитан в материализованном представлении
+        SELECT command, count FROM logs_popular_commands
+    )
+    SELECT totals.total_logs,
+           totals.unique_users,
+           (SELECT array_agg(command ORDER BY count DESC) FROM popular) AS commands,
+           (SELECT array_agg(count ORDER BY count DESC) FROM popular) AS counts
+    FROM totals
+"""
+
+# Материализованные представления статистики, которые обновляются в фоне
+SQL_REFRESH_STATS_VIEWS = (
+    "REFRESH MATERIALIZED VIEW CONCURRENTLY logs_popular_commands",
+    "REFRESH MATERIALIZED VIEW CONCURRENTLY logs_unique_users",
+)
+
+SQL_USER_STATS = """
+    SELECT c.user_logs, us.user_id, us.preferred_model, us.tts_enabled, us.personal_assistant_enabled
+    FROM (SELECT COUNT(*) AS user_logs FROM logs WHERE username = $1) c
+    LEFT JOIN user_settings us ON us.user_id = $2
+"""
+
+# Ключевые слова генерации изображений одним регулярным выражением:
+# один проход по тексту без копии в нижнем регистре. Короткие слова
+# ищутся целиком, иначе «арт» срабатывает на «старт», «карта», «март»
+IMAGE_KEYWORDS_RE = re.compile(
+    "|".join(
+        rf"\b{re.escape(word)}\b" if len(word) <= 3 else re.escape(word)
+        for word in IMAGE_KEYWORDS
+    ),
+    re.IGNORECASE
+)
+
+# Фоновая задача обновления популярных команд
+_popular_commands_task: asyncio.Task | None = None
+
+# Кеш текста общей статистики (/stats) и блокировка от одновременного пересчёта
+_stats_cache = TTLCache(ttl=30)
+_stats_lock = asyncio.Lock()
+# Кеш персональной статистики по user_id
+_personal_stats_cache = TTLCache(ttl=10, maxsize=10000)
+
+# Ограничение одновременных фоновых запросов к OpenAI
+_llm_semaphore = asyncio.Semaphore(MAX_CONCURRENT_LLM_CALLS)
+# Ссылки на фоновые задачи, чтобы их не удалил сборщик мусора
+_background_tasks: set[asyncio.Task] = set()
+# Недавно отправленные chat action по (chat_id, action): повтор, пока
+# статус ещё виден, лишь тратит запрос к Telegram
+_recent_chat_actions = TTLCache(ttl=CHAT_ACTION_INTERVAL, maxsize=10000)
+
 # Удалено: DEFAULT_SYSTEM_PROMPT перенесен в constants.py
 
 # Словари для локализации
@@ -182,6 +284,60 @@ def get_text(key: str, language: str = "ru", **kwargs) -> str:
     return text.format(**kwargs) if kwargs else text
 
 
+def get_texts(language: str, *keys: str) -> tuple[str, ...]:
+    """Получает несколько локализованных текстов за один выбор словаря языка."""
+    texts = LOCALIZATION.get(language, LOCALIZATION["ru"])
+    return tuple(texts.get(key, key) for key in keys)
+
+
+@lru_cache(maxsize=8)
+def get_language_menu_text(user_lang: str = "ru") -> str:
+    """Текст меню выбора языка (кешируется по языку)."""
+    title, prompt = get_texts(user_lang, "language_interface", "select_language")
+    return f"<b>{title}</b>\n\n{prompt}"
+
+
+def spawn(coro: Awaitable[Any]) -> asyncio.Task:
+    """Запускает корутину в фоне, сохраняя ссылку на задачу до её завершения."""
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+
+def run_in_background(coro: Awaitable[None]) -> asyncio.Task:
+    """
+    Запускает долгий запрос к ИИ в фоне, чтобы обработчик завершился сразу.
+
+    Количество одновременно выполняемых задач ограничено семафором.
+    """
+    async def runner() -> None:
+        async with _llm_semaphore:
+            try:
+                await coro
+            except Exception:
+                logger.exception("Ошибка в фоновой задаче")
+
+    return spawn(runner())
+
+
+async def send_chat_action(chat_id: int, action: str) -> None:
+    """Показывает статус («печатает», «отправляет фото»), не повторяя его чаще CHAT_ACTION_INTERVAL."""
+    key = (chat_id, action)
+    if key in _recent_chat_actions:
+        return
+    _recent_chat_actions.set(key, True)
+    await bot.send_chat_action(chat_id, action)
+
+
+def next_cache_key(user_id: int | None = None) -> str:
+    """Возвращает уникальный ключ для кешей, на которые ссылаются кнопки."""
+    # Ограничиваем 32 битами, чтобы callback_data не превысила лимит Telegram в 64 байта;
+    # к моменту повтора старые записи давно вытеснены из TTL-кешей
+    key = str(next(_cache_key_counter) & 0xFFFFFFFF)
+    return f"{user_id}_{key}" if user_id is not None else key
+
+
 def format_answer(language: str, content: str, title: str | None = None) -> str:
     """Унифицированное оформление ответов бота (HTML-верстка)."""
     header = title or ("💬 Ответ" if language == "ru" else "💬 Response")
@@ -195,21 +351,42 @@ def format_answer(language: str, content: str, title: str | None = None) -> str:
     ]
     return "\n".join(parts)
 
-def get_mode_instruction(user_id: int) -> str:
-    """Возвращает инструкцию для выбранного режима пользователя."""
-    mode = user_modes.get(user_id)
-    if mode == "seo":
-        return "\n\nРежим: Эксперт по SEO. Пиши структурировано, с H2/H3, списками, примерами ключевых слов."
-    if mode == "lawyer":
-        return "\n\nРежим: Юрист. Пиши аккуратно, с оговорками, ссылками на нормы (если известны)."
-    if mode == "teacher":
-        return "\n\nРежим: Учитель. Объясняй просто, по шагам, с примерами."
-    if mode == "code":
-        return "\n\nРежим: Редактор кода. Дай пример кода, поясни кратко, укажи шаги."
-    return ""
 
+def with_length_note(text: str, cut_off: bool) -> str:
+    """Добавляет к отправляемому тексту приписку, если модель оборвала ответ по лимиту."""
+    return text + LENGTH_LIMIT_NOTE if cut_off else text
+
+
+def voice_caption(text: str, cut_off: bool) -> str:
+    """Подпись к голосовому ответу: начало текста (не длиннее лимита подписи) и приписка."""
+    note = LENGTH_LIMIT_NOTE if cut_off else ""
+    room = 1000 - len(note)
+    if len(text) > room:
+        text = text[:room] + "..."
+    return text + note
+
+# Инструкции режимов ответа (/mode)
+MODE_INSTRUCTIONS: Dict[str, str] = {
+    "seo": "\n\nРежим: Эксперт по SEO. Пиши структурировано, с H2/H3, списками, примерами ключевых слов.",
+    "lawyer": "\n\nРежим: Юрист. Пиши аккуратно, с оговорками, ссылками на нормы (если известны).",
+    "teacher": "\n\nРежим: Учитель. Объясняй просто, по шагам, с примерами.",
+    "code": "\n\nРежим: Редактор кода. Дай пример кода, поясни кратко, укажи шаги.",
+}
+
+# Полные системные промпты собираются один раз при загрузке модуля,
+# а не склеиваются заново на каждое сообщение
+MODE_SYSTEM_PROMPTS: Dict[str, str] = {
+    mode: DEFAULT_SYSTEM_PROMPT + instruction for mode, instruction in MODE_INSTRUCTIONS.items()
+}
+
+
+def get_system_prompt(user_id: int) -> str:
+    """Возвращает системный промпт с учётом выбранного режима пользователя."""
+    return MODE_SYSTEM_PROMPTS.get(user_modes.get(user_id), DEFAULT_SYSTEM_PROMPT)
+
+@lru_cache(maxsize=8)
 def get_main_menu(user_lang: str = "ru") -> InlineKeyboardMarkup:
-    """Создаёт главное меню на соответствующем языке."""
+    """Создаёт главное меню на соответствующем языке (кешируется по языку)."""
     return InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text=get_text("ai_chat", user_lang), callback_data="ai_chat_menu"),
          InlineKeyboardButton(text=get_text("creativity", user_lang), callback_data="creative_menu")],
@@ -219,8 +396,9 @@ def get_main_menu(user_lang: str = "ru") -> InlineKeyboardMarkup:
     ])
 
 
+@lru_cache(maxsize=8)
 def get_admin_menu(user_lang: str = "ru") -> InlineKeyboardMarkup:
-    """Создаёт админское меню на соответствующем языке."""
+    """Создаёт админское меню на соответствующем языке (кешируется по языку)."""
     return InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text=get_text("ai_chat", user_lang), callback_data="ai_chat_menu"),
          InlineKeyboardButton(text=get_text("creativity", user_lang), callback_data="creative_menu")],
@@ -311,36 +489,200 @@ model_selection_menu = InlineKeyboardMarkup(inline_keyboard=[
     [InlineKeyboardButton(text="⬅️ Назад", callback_data="back_to_main")],
 ])
 
+# Отметки включено/выключено в статистике
+CHECK_YES, CHECK_NO = "✅", "❌"
+
+# Названия типов записей персональной памяти
+MEMORY_TYPE_NAMES = {
+    "dialogue": "💬 Диалоги",
+    "preference": "❤️ Предпочтения",
+    "fact": "📝 Факты",
+    "custom": "🏷️ Пользовательские"
+}
+
+# Текст меню создания изображения (/art и раздел творчества)
+ART_MENU_TEXT = (
+    "🎨 <b>Создание изображения</b>\n\n"
+    "Опишите, что вы хотите нарисовать:\n\n"
+    "🎆 <i>Пример: котенок на скейте в очках, стиль аниме</i>\n\n"
+    "Выберите размер изображения:"
+)
+
+# Упрощённая справка по интерфейсу
+HELP_TEXT = (
+    "ℹ️ <b>Интерфейс бота:</b>\n\n"
+    "📋 <b>Основные разделы:</b>\n"
+    "💬 ИИ Чат - Общение с ИИ\n"
+    "🎨 Творчество - Создание изображений\n"
+    "🔧 Настройки - Персонализация\n\n"
+    "🚀 <b>Начните с /start</b> для возвращения в главное меню!"
+)
+
+# Подсказка при добавлении записи в персональную память
+PA_ADD_MEMORY_TEXT = (
+    "🧠 <b>Добавить память</b>\n\n"
+    "📝 Напишите что-то, что вы хотите, чтобы я запомнил о вас:\n\n"
+    "💡 <i>Примеры:</i>\n"
+    "• Мне нравится стиль минимализм\n"
+    "• Я работаю программистом\n"
+    "• Предпочитаю краткие ответы\n"
+    "• Я изучаю Python"
+)
+
+# Текст админ-панели для команды /admin
+ADMIN_PANEL_TEXT = (
+    "👑 <b>Админ-панель</b>\n\n"
+    "Доступные команды:\n"
+    "/admin_stats - Статистика бота\n"
+    "/errors - Последние ошибки\n"
+    "/bot_on - Включить бота\n"
+    "/bot_off - Выключить бота\n\n"
+    "Используйте эти команды для управления ботом."
+)
+
+# Меню выбора размера изображения (из раздела творчества)
+art_size_menu = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="📱 512x512 (быстро)", callback_data="art_size_512")],
+    [InlineKeyboardButton(text="🖼️ 1024x1024 (качество)", callback_data="art_size_1024")],
+    [InlineKeyboardButton(text="⬅️ Назад", callback_data="creative_menu")]
+])
+
+# Меню выбора размера изображения для /art без описания
+art_size_cancel_menu = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="📱 512x512 (быстро)", callback_data="art_size_512")],
+    [InlineKeyboardButton(text="🖼️ 1024x1024 (качество)", callback_data="art_size_1024")],
+    [InlineKeyboardButton(text="❌ Отмена", callback_data="back_to_main")]
+])
+
+# Меню выбора голоса TTS
+tts_voice_menu = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="Alloy", callback_data="set_voice_alloy")],
+    [InlineKeyboardButton(text="Echo", callback_data="set_voice_echo")],
+    [InlineKeyboardButton(text="Fable", callback_data="set_voice_fable")],
+    [InlineKeyboardButton(text="Onyx", callback_data="set_voice_onyx")],
+    [InlineKeyboardButton(text="Nova", callback_data="set_voice_nova")],
+    [InlineKeyboardButton(text="Shimmer", callback_data="set_voice_shimmer")],
+    [InlineKeyboardButton(text="⬅️ Назад", callback_data="tts_settings")],
+])
+
+# Подтверждение очистки персональной памяти
+pa_clear_confirm_menu = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="✅ Да, очистить всё", callback_data="pa_confirm_clear")],
+    [InlineKeyboardButton(text="❌ Отмена", callback_data="personal_assistant")]
+])
+
+# Возврат из статистики памяти в меню персонального ассистента
+pa_stats_back_menu = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="⬅️ Назад к меню", callback_data="back_to_pa")]
+])
+
+# Строка со сбросом диалога, которую добавляют к динамическим меню
+RESET_CONTEXT_ROW = [InlineKeyboardButton(text="🔄 Сбросить диалог", callback_data="reset_context")]
+
+# Подписи кнопок под ответом ИИ: показать полностью, переформулировать, упростить, примеры
+ANSWER_MENU_LABELS = {
+    "ru": ("🔎 Показать полностью", "🔁 Переформулировать", "✨ Упростить", "📌 Примеры"),
+    "en": ("🔎 Show full", "🔁 Rephrase", "✨ Simplify", "📌 Examples"),
+}
+
+
+def get_answer_menu(user_lang: str, key: str, show_full: bool = False) -> InlineKeyboardMarkup:
+    """Создаёт меню действий под ответом ИИ для закешированного ответа key."""
+    show_full_label, rephrase, simplify, examples = ANSWER_MENU_LABELS["ru" if user_lang == "ru" else "en"]
+    buttons = [
+        [InlineKeyboardButton(text=rephrase, callback_data=f"rephrase_{key}")],
+        [InlineKeyboardButton(text=simplify, callback_data=f"edit_simplify_{key}"),
+         InlineKeyboardButton(text=examples, callback_data=f"edit_examples_{key}")]
+    ]
+    if show_full:
+        buttons.insert(0, [InlineKeyboardButton(text=show_full_label, callback_data=f"show_full_{key}")])
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
+
+
+@lru_cache(maxsize=8)
+def get_language_menu(user_lang: str = "ru") -> InlineKeyboardMarkup:
+    """Создаёт меню выбора языка (кешируется по языку)."""
+    russian, english, back = get_texts(user_lang, "russian", "english", "back")
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text=russian, callback_data="set_lang_ru"),
+         InlineKeyboardButton(text=english, callback_data="set_lang_en")],
+        [InlineKeyboardButton(text=back, callback_data="settings_menu")]
+    ])
+
+
+@lru_cache(maxsize=32)
+def get_tts_settings_menu(tts_enabled: bool, tts_voice: str) -> InlineKeyboardMarkup:
+    """Создаёт меню настроек TTS (кешируется по состоянию и голосу)."""
+    status = "Включены" if tts_enabled else "Выключены"
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text=f"🔊 Голосовые ответы: {status}", callback_data="toggle_tts")],
+        [InlineKeyboardButton(text=f"🗣 Голос: {tts_voice.title()}", callback_data="change_tts_voice")],
+        [InlineKeyboardButton(text="⬅️ Назад", callback_data="back_to_main")],
+    ])
+
+
+async def apply_schema() -> None:
+    """
+    Применяет схему базы данных.
+
+    schema.sql уходит одним запросом простого протокола (один round-trip);
+    затем по одному строятся индексы из SCHEMA_INDEXES, которые нельзя
+    выполнять внутри транзакции.
+    """
+    applied = bool(SCHEMA_SQL) and await database_service.execute_query(SCHEMA_SQL)
+    if not applied:
+        logger.error("❌ Не удалось применить schema.sql")
+    
+    for statement in SCHEMA_INDEXES:
+        if not await database_service.execute_query(statement):
+            applied = False
+            logger.error("❌ Не удалось создать индекс: %s", statement)
+    
+    if applied:
+        logger.info("✅ Схема базы данных применена")
+
 
 async def on_startup() -> None:
     """Функция, вызываемая при запуске бота."""
     # Инициализируем сервисы
+    global pool, _popular_commands_task
+    
     await database_service.initialize_pool()
+    # Обработчики этого модуля работают с тем же пулом, что и сервисы
+    pool = database_service.pool
     
     if database_service.is_available():
         logger.info("✅ База данных подключена успешно")
         
         # Применяем схему базы данных
         try:
-            with open("schema.sql", "r", encoding="utf-8") as f:
-                schema_sql = f.read()
-                commands = schema_sql.split(";")
-                for command in commands:
-                    command = command.strip()
-                    if command:
-                        try:
-                            await database_service.execute_query(command)
-                        except Exception as e:
-                            logger.warning(f"Не удалось выполнить команду: {command[:50]}... Ошибка: {e}")
-            logger.info("✅ Схема базы данных применена")
+            await apply_schema()
         except Exception as e:
-            logger.error(f"❌ Ошибка при применении схемы БД: {e}")
+            logger.error("❌ Ошибка при применении схемы БД: %s", e)
+        
+        _popular_commands_task = asyncio.create_task(refresh_popular_commands_loop())
     else:
         logger.warning("⚠️ База данных недоступна, продолжаем без неё")
 
 
+async def refresh_popular_commands_loop() -> None:
+    """Периодически обновляет материализованные представления статистики."""
+    while True:
+        await asyncio.sleep(POPULAR_COMMANDS_REFRESH_INTERVAL)
+        if not pool:
+            continue
+        try:
+            async with pool.acquire() as conn:
+                for statement in SQL_REFRESH_STATS_VIEWS:
+                    await conn.execute(statement)
+        except Exception as e:
+            logger.warning("Не удалось обновить статистику: %s", e)
+
+
 async def on_shutdown() -> None:
     """Функция, вызываемая при остановке бота."""
+    if _popular_commands_task:
+        _popular_commands_task.cancel()
     await database_service.close_pool()
     logger.info("✅ Сервисы остановлены")
 
@@ -351,43 +693,34 @@ async def cmd_start(message: types.Message) -> None:
     # Получаем предпочитаемый язык пользователя
     user_lang = await get_user_language(message.from_user.id)
     
-    try:
-        # Пытаемся отправить изображение приветствия
-        await send_welcome_image_start(message, user_lang)
-    except Exception as e:
-        logger.error(f"Ошибка при отправке изображения приветствия: {e}")
-        # Fallback на текстовое приветствие
-        welcome_text = get_text("welcome", user_lang)
-        
-        # Показываем расширенное меню для супер-администратора, обычное для остальных
-        if is_super_admin(message.from_user.id):
-            await message.answer(welcome_text, reply_markup=get_admin_menu(user_lang))
-        else:
-            await message.answer(welcome_text, reply_markup=get_main_menu(user_lang))
+    if WELCOME_IMAGE_AVAILABLE:
+        try:
+            # Пытаемся отправить изображение приветствия
+            await send_welcome_image_start(message, user_lang)
+            return
+        except Exception as e:
+            logger.error("Ошибка при отправке изображения приветствия: %s", e)
+    
+    # Fallback на текстовое приветствие
+    welcome_text = get_text("welcome", user_lang)
+    
+    # Показываем расширенное меню для супер-администратора, обычное для остальных
+    if is_super_admin(message.from_user.id):
+        await message.answer(welcome_text, reply_markup=get_admin_menu(user_lang))
+    else:
+        await message.answer(welcome_text, reply_markup=get_main_menu(user_lang))
 
 
 async def send_welcome_image_start(message: types.Message, user_lang: str = "ru"):
     """Отправить изображение приветствия для команды /start."""
-    import os
-    
-    # Путь к изображению приветствия
-    image_path = "assets/images/welcome_screen.png"
-    
-    if not os.path.exists(image_path):
-        raise FileNotFoundError("Изображение приветствия не найдено")
-    
     # Формируем кнопки в зависимости от роли пользователя
     if is_super_admin(message.from_user.id):
         reply_markup = get_admin_menu(user_lang)
     else:
         reply_markup = get_main_menu(user_lang)
     
-    # Отправляем изображение
-    with open(image_path, "rb") as photo:
-        await message.answer_photo(
-            photo,
-            reply_markup=reply_markup
-        )
+    # Отправляем изображение (после первой отправки - по file_id)
+    await answer_welcome_photo(message, reply_markup)
 
 
 # ============================================================================
@@ -399,47 +732,81 @@ async def send_welcome_image_start(message: types.Message, user_lang: str = "ru"
 
 # Вспомогательные функции для callback обработчиков
 
-async def show_user_personal_stats(message: types.Message, user_id: int) -> None:
-    """Показывает персональную статистику пользователя."""
+async def show_user_personal_stats(message: types.Message, user_id: int, username: str | None = None) -> None:
+    """
+    Показывает персональную статистику пользователя.
+
+    username передаётся явно: при вызове из callback message.from_user — это бот.
+    """
     global pool
     
     if not pool:
         await message.answer("⛔ База данных недоступна.")
         return
     
+    stats_text = _personal_stats_cache.get(user_id)
+    if stats_text is not None:
+        await message.answer(stats_text, parse_mode="HTML")
+        return
+    
     try:
         async with pool.acquire() as conn:
-            user_logs = await conn.fetchval(
-                "SELECT COUNT(*) FROM logs WHERE username = $1",
-                message.from_user.username or str(user_id)
-            )
-            
+            # Количество сообщений и настройки пользователя за один запрос
             user_settings = await conn.fetchrow(
-                "SELECT preferred_model, tts_enabled, personal_assistant_enabled FROM user_settings WHERE user_id = $1",
+                SQL_USER_STATS,
+                username or str(user_id),
                 user_id
             )
             
-        stats_text = f"📈 <b>Моя активность</b>\n\n"
-        stats_text += f"💬 Сообщений: {user_logs}\n"
+        parts = [
+            "📈 <b>Моя активность</b>\n\n",
+            f"💬 Сообщений: {user_settings['user_logs']}\n",
+        ]
         
-        if user_settings:
-            check_yes = "✅"
-            check_no = "❌"
-            stats_text += f"🤖 Модель: {user_settings['preferred_model'] or 'gpt-4o'}\n"
-            stats_text += f"🔊 TTS: {check_yes if user_settings['tts_enabled'] else check_no}\n"
-            stats_text += f"🧠 Личный ассистент: {check_yes if user_settings['personal_assistant_enabled'] else check_no}\n"
+        if user_settings["user_id"] is not None:
+            parts.append(f"🤖 Модель: {user_settings['preferred_model'] or 'gpt-4o'}\n")
+            parts.append(f"🔊 TTS: {CHECK_YES if user_settings['tts_enabled'] else CHECK_NO}\n")
+            parts.append(f"🧠 Личный ассистент: {CHECK_YES if user_settings['personal_assistant_enabled'] else CHECK_NO}\n")
         
         pa_stats = await personal_assistant.get_user_stats(user_id)
         if pa_stats.get("total_memories", 0) > 0:
-            stats_text += f"\n🧠 Память: {pa_stats['total_memories']} записей"
+            parts.append(f"\n🧠 Память: {pa_stats['total_memories']} записей")
         
+        stats_text = "".join(parts)
+        _personal_stats_cache.set(user_id, stats_text)
         await message.answer(stats_text, parse_mode="HTML")
         
     except Exception as e:
-        logger.error(f"Ошибка при получении статистики: {e}")
+        logger.error("Ошибка при получении статистики: %s", e)
         await message.answer("❌ Ошибка получения статистики.")
 
 
+async def _build_stats_text() -> str:
+    """Собирает текст общей статистики бота из базы данных."""
+    async with pool.acquire() as conn:
+        # Общее число записей, уникальные пользователи и популярные команды
+        # получаем одним запросом, чтобы не платить за три round-trip
+        row = await conn.fetchrow(SQL_BOT_STATS)
+        
+    total_logs = row["total_logs"]
+    unique_users = row["unique_users"]
+    popular_commands = list(zip(row["commands"] or [], row["counts"] or []))
+        
+    parts = [
+        "📊 <b>Статистика бота:</b>\n\n",
+        f"Всего сообщений: {total_logs}\n",
+        f"Уникальных пользователей: {unique_users}\n\n",
+    ]
+    
+    if popular_commands:
+        parts.append("<b>Популярные команды:</b>\n")
+        parts.extend(f"{command}: {count} раз(а)\n" for command, count in popular_commands)
+    else:
+        parts.append("Пока нет данных для статистики.")
+    
+    return "".join(parts)
+
+
 @dp.message(Command("stats"))
 async def cmd_stats(message: types.Message) -> None:
     """Обработчик команды /stats."""
@@ -447,38 +814,22 @@ async def cmd_stats(message: types.Message) -> None:
         await message.answer("⛔ База данных недоступна. Статистика временно недоступна.")
         return
     
+    stats_text = _stats_cache.get("global")
+    if stats_text is not None:
+        await message.answer(stats_text)
+        return
+    
     try:
-        async with pool.acquire() as conn:
-            # Получаем общее количество записей в логах
-            total_logs = await conn.fetchval("SELECT COUNT(*) FROM logs")
-            
-            # Получаем количество уникальных пользователей
-            unique_users = await conn.fetchval("SELECT COUNT(DISTINCT username) FROM logs WHERE username IS NOT NULL")
-            
-            # Получаем самые популярные команды
-            popular_commands = await conn.fetch("""
-                SELECT command, COUNT(*) as count 
-                FROM logs 
-                WHERE command IS NOT NULL 
-                GROUP BY command 
-                ORDER BY count DESC 
-                LIMIT 5
-            """)
-            
-        stats_text = f"📊 <b>Статистика бота:</b>\n\n"
-        stats_text += f"Всего сообщений: {total_logs}\n"
-        stats_text += f"Уникальных пользователей: {unique_users}\n\n"
-        
-        if popular_commands:
-            stats_text += "<b>Популярные команды:</b>\n"
-            for cmd in popular_commands:
-                stats_text += f"{cmd['command']}: {cmd['count']} раз(а)\n"
-        else:
-            stats_text += "Пока нет данных для статистики."
+        # Блокировка не даёт пачке одновременных запросов пересчитывать одно и то же
+        async with _stats_lock:
+            stats_text = _stats_cache.get("global")
+            if stats_text is None:
+                stats_text = await _build_stats_text()
+                _stats_cache.set("global", stats_text)
             
         await message.answer(stats_text)
     except Exception as e:
-        logger.error(f"Ошибка при получении статистики: {e}")
+        logger.error("Ошибка при получении статистики: %s", e)
         await message.answer("❌ Произошла ошибка при получении статистики. Попробуйте позже.")
 
 
@@ -488,12 +839,17 @@ async def cmd_suggest_prompt(message: types.Message) -> None:
     if not pool:
         await message.answer("❌ Нет подключения к базе данных. Функция предложения промпта временно недоступна.")
         return
+    await message.answer("🔍 Анализирую последние запросы для предложения улучшенного промпта...")
+    run_in_background(_suggest_prompt_and_reply(message))
+
+
+async def _suggest_prompt_and_reply(message: types.Message) -> None:
+    """Генерирует улучшенный промпт и отправляет его пользователю."""
     try:
-        await message.answer("🔍 Анализирую последние запросы для предложения улучшенного промпта...")
         suggestion = await generate_prompt_from_logs(pool)
         await message.answer(f"💡 <b>Предложенный промпт:</b>\n\n{suggestion}")
     except Exception as e:
-        logger.error(f"Ошибка в suggest_prompt: {e}")
+        logger.error("Ошибка в suggest_prompt: %s", e)
         await message.answer("❌ Извините, не удалось сгенерировать предложение сейчас. Попробуйте позже.")
 
 
@@ -504,14 +860,9 @@ async def cmd_art(message: types.Message) -> None:
     text = message.text.replace("/art", "").strip()
     
     if not text:
-        size_menu = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="📱 512x512 (быстро)", callback_data="art_size_512")],
-            [InlineKeyboardButton(text="🖼️ 1024x1024 (качество)", callback_data="art_size_1024")],
-            [InlineKeyboardButton(text="❌ Отмена", callback_data="back_to_main")]
-        ])
         await message.answer(
-            "🎨 <b>Создание изображения</b>\n\nОпишите, что вы хотите нарисовать:\n\n🎆 <i>Пример: котенок на скейте в очках, стиль аниме</i>\n\nВыберите размер изображения:",
-            reply_markup=size_menu,
+            ART_MENU_TEXT,
+            reply_markup=art_size_cancel_menu,
             parse_mode="HTML"
         )
         return
@@ -519,555 +870,595 @@ async def cmd_art(message: types.Message) -> None:
     await generate_art_image(message, text)
 
 
-@dp.callback_query()
-async def process_callback(callback_query: types.CallbackQuery) -> None:
-    """Обработчик нажатий на кнопки меню."""
-    await callback_query.answer()
-    
-    # Используем новый маршрутизатор для новых callback-ов
-    if callback_query.data in ["ai_agent_pro", "back_to_main", "change_language", "set_lang_ru", "set_lang_en", "toggle_versions_lang", "show_welcome"]:
-        await route_callback(callback_query)
+# ============================================================================
+# Обработчики callback-кнопок
+# Каждая кнопка обслуживается отдельной функцией, а process_callback
+# выбирает её по таблице вместо длинной цепочки if/elif.
+# ============================================================================
+
+async def _answer_home_menu(callback_query: types.CallbackQuery, notice: str | None = None) -> None:
+    """
+    Возвращает пользователя в главное меню (админское для супер-администратора).
+
+    notice добавляется в начало того же сообщения, чтобы не тратить
+    отдельный запрос к Telegram на подтверждение.
+    """
+    menu = admin_menu if is_super_admin(callback_query.from_user.id) else main_menu
+    text = "🏠 <b>Главное меню</b>"
+    if notice:
+        text = f"{notice}\n\n{text}"
+    await callback_query.message.answer(text, reply_markup=menu)
+
+
+async def _cb_ai_chat_menu(callback_query: types.CallbackQuery) -> None:
+    """Открывает меню ИИ Чата."""
+    await callback_query.message.answer("💬 <b>ИИ Чат</b>\n\nВыберите действие:", reply_markup=ai_chat_menu, parse_mode="HTML")
+
+
+async def _cb_creative_menu(callback_query: types.CallbackQuery) -> None:
+    """Открывает меню творчества."""
+    await callback_query.message.answer("🎨 <b>Творчество</b>\n\nИскусство и создание:", reply_markup=creative_menu, parse_mode="HTML")
+
+
+async def _cb_analytics_menu(callback_query: types.CallbackQuery) -> None:
+    """Открывает меню аналитики."""
+    await callback_query.message.answer("📊 <b>Аналитика</b>\n\nСтатистика и анализ:", reply_markup=analytics_menu, parse_mode="HTML")
+
+
+async def _cb_settings_menu(callback_query: types.CallbackQuery) -> None:
+    """Открывает меню настроек."""
+    await callback_query.message.answer("🔧 <b>Настройки</b>\n\nПерсонализация работы бота:", reply_markup=settings_menu, parse_mode="HTML")
+
+
+async def _cb_start_chat(callback_query: types.CallbackQuery) -> None:
+    """Подсказывает, как начать чат."""
+    await callback_query.message.answer("💬 Просто напишите мне сообщение, и я отвечу!\n\n🎤 Можно также отправить голосовое сообщение или изображение.")
+
+
+async def _cb_create_image(callback_query: types.CallbackQuery) -> None:
+    """Показывает меню выбора размера изображения."""
+    await callback_query.message.answer(
+        ART_MENU_TEXT,
+        reply_markup=art_size_menu,
+        parse_mode="HTML"
+    )
+
+
+async def _cb_image_analysis_info(callback_query: types.CallbackQuery) -> None:
+    """Рассказывает об анализе изображений."""
+    await callback_query.message.answer(
+        "🖼️ <b>Анализ изображений</b>\n\n"
+        "🔍 Просто отправьте мне изображение, и я:\n\n"
+        "• Опишу что на нём изображено\n"
+        "• Отвечу на вопросы о контенте\n"
+        "• Помогу с анализом и интерпретацией\n\n"
+        "📷 Поддерживаются все популярные форматы изображений.",
+        parse_mode="HTML"
+    )
+
+
+async def _cb_user_stats(callback_query: types.CallbackQuery) -> None:
+    """Показывает персональную статистику."""
+    await show_user_personal_stats(
+        callback_query.message, callback_query.from_user.id, callback_query.from_user.username
+    )
+
+
+async def _cb_language_settings(callback_query: types.CallbackQuery) -> None:
+    """Показывает меню выбора языка из настроек."""
+    user_lang = await get_user_language(callback_query.from_user.id)
+    language_menu = get_language_menu(user_lang)
+    await callback_query.message.answer(
+        get_language_menu_text(user_lang),
+        reply_markup=language_menu,
+        parse_mode="HTML"
+    )
+
+
+async def _cb_notification_settings(callback_query: types.CallbackQuery) -> None:
+    """Заглушка настроек уведомлений."""
+    await callback_query.message.answer(
+        "🔔 <b>Уведомления</b>\n\n"
+        "Эта функция будет доступна в следующих обновлениях.",
+        parse_mode="HTML"
+    )
+
+
+async def _cb_reset_context(callback_query: types.CallbackQuery) -> None:
+    """Сбрасывает контекст диалога и возвращает в главное меню."""
+    # Вызываем команду сброса контекста
+    await cmd_reset_context(callback_query.message)
+    # Возвращаемся в главное меню
+    await _answer_home_menu(callback_query)
+
+
+async def _cb_help(callback_query: types.CallbackQuery) -> None:
+    """Показывает справку по интерфейсу."""
+    # Отображаем упрощённую справку
+    await callback_query.message.answer(HELP_TEXT, parse_mode="HTML")
+
+
+def _log_admin_check(name: str, user_id: int) -> None:
+    """Диагностика проверки админского доступа (только на уровне DEBUG)."""
+    if not logger.isEnabledFor(logging.DEBUG):
         return
-    
-    # 📂 Навигация по категориям меню
-    if callback_query.data == "ai_chat_menu":
-        await callback_query.message.answer("💬 <b>ИИ Чат</b>\n\nВыберите действие:", reply_markup=ai_chat_menu, parse_mode="HTML")
-    elif callback_query.data == "creative_menu":
-        await callback_query.message.answer("🎨 <b>Творчество</b>\n\nИскусство и создание:", reply_markup=creative_menu, parse_mode="HTML")
-    elif callback_query.data == "analytics_menu":
-        await callback_query.message.answer("📊 <b>Аналитика</b>\n\nСтатистика и анализ:", reply_markup=analytics_menu, parse_mode="HTML")
-    elif callback_query.data == "settings_menu":
-        await callback_query.message.answer("🔧 <b>Настройки</b>\n\nПерсонализация работы бота:", reply_markup=settings_menu, parse_mode="HTML")
-    
-    # 💬 Обработчики ИИ чата
-    elif callback_query.data == "start_chat":
-        await callback_query.message.answer("💬 Просто напишите мне сообщение, и я отвечу!\n\n🎤 Можно также отправить голосовое сообщение или изображение.")
-    
-    # 🎨 Обработчики творчества
-    elif callback_query.data == "create_image":
-        size_menu = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="📱 512x512 (быстро)", callback_data="art_size_512")],
-            [InlineKeyboardButton(text="🖼️ 1024x1024 (качество)", callback_data="art_size_1024")],
-            [InlineKeyboardButton(text="⬅️ Назад", callback_data="creative_menu")]
-        ])
-        await callback_query.message.answer(
-            "🎨 <b>Создание изображения</b>\n\nОпишите, что вы хотите нарисовать:\n\n🎆 <i>Пример: котенок на скейте в очках, стиль аниме</i>\n\nВыберите размер изображения:",
-            reply_markup=size_menu,
-            parse_mode="HTML"
-        )
-    elif callback_query.data == "image_analysis_info":
-        await callback_query.message.answer(
-            "🖼️ <b>Анализ изображений</b>\n\n"
-            "🔍 Просто отправьте мне изображение, и я:\n\n"
-            "• Опишу что на нём изображено\n"
-            "• Отвечу на вопросы о контенте\n"
-            "• Помогу с анализом и интерпретацией\n\n"
-            "📷 Поддерживаются все популярные форматы изображений.",
-            parse_mode="HTML"
-        )
-    
-    # 📊 Обработчики аналитики
-    elif callback_query.data == "user_stats":
-        await show_user_personal_stats(callback_query.message, callback_query.from_user.id)
-    
-    # 🔧 Обработчики настроек
-    elif callback_query.data == "language_settings":
-        user_lang = await get_user_language(callback_query.from_user.id)
-        language_menu = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text=get_text("russian", user_lang), callback_data="set_lang_ru"),
-             InlineKeyboardButton(text=get_text("english", user_lang), callback_data="set_lang_en")],
-            [InlineKeyboardButton(text=get_text("back", user_lang), callback_data="settings_menu")]
-        ])
-        menu_text = f"<b>{get_text('language_interface', user_lang)}</b>\n\n{get_text('select_language', user_lang)}"
-        await callback_query.message.answer(
-            menu_text,
-            reply_markup=language_menu,
-            parse_mode="HTML"
-        )
-    elif callback_query.data == "notification_settings":
+    logger.debug("🔍 Проверка доступа к %s: user_id=%s (тип: %s)", name, user_id, type(user_id))
+    logger.debug("   ADMINS=%s", settings.ADMINS)
+    logger.debug("   is_admin=%s, is_super_admin=%s", is_admin(user_id), is_super_admin(user_id))
+
+
+async def _cb_admin_panel(callback_query: types.CallbackQuery) -> None:
+    """Открывает админ-панель для супер-администратора."""
+    user_id = callback_query.from_user.id
+    _log_admin_check("admin_panel", user_id)
+
+    if is_super_admin(user_id):
+        logger.debug("✅ Доступ к admin_panel разрешён для user_id=%s", user_id)
+        await callback_query.message.answer("👑 <b>Админ-панель</b>", reply_markup=admin_commands_menu)
+    else:
+        logger.warning("❌ Доступ к admin_panel запрещён для user_id=%s", user_id)
         await callback_query.message.answer(
-            "🔔 <b>Уведомления</b>\n\n"
-            "Эта функция будет доступна в следующих обновлениях.",
-            parse_mode="HTML"
+            f"⛔ У вас нет доступа к админ-панели.\n\n"
+            f"📝 Ваш ID: {user_id}\n\n"
+            f"💡 Админ-панель доступна только основному администратору."
         )
-    elif callback_query.data.startswith("set_lang_"):
-        lang = callback_query.data.replace("set_lang_", "")
-        await set_user_language(callback_query.message, callback_query.from_user.id, lang)
-        
-        # Отображаем подтверждение на выбранном языке
-        lang_names = {"ru": "Русский", "en": "English"}
-        confirmation_text = get_text("language_set", lang, lang=lang_names.get(lang, lang))
-        
-        # Обновляем сообщение с главным меню на новом языке
-        welcome_text = get_text("welcome", lang)
-        
-        # Показываем подтверждение + обновлённое меню
-        full_text = f"{confirmation_text}\n\n{welcome_text}"
-        
-        try:
-            if is_super_admin(callback_query.from_user.id):
-                await callback_query.message.edit_text(full_text, reply_markup=get_admin_menu(lang))
-            else:
-                await callback_query.message.edit_text(full_text, reply_markup=get_main_menu(lang))
-        except Exception as e:
-            # Если редактирование не удалось
-            await callback_query.message.answer(confirmation_text)
-            if is_super_admin(callback_query.from_user.id):
-                await callback_query.message.answer(welcome_text, reply_markup=get_admin_menu(lang))
-            else:
-                await callback_query.message.answer(welcome_text, reply_markup=get_main_menu(lang))
-    elif callback_query.data == "reset_context":
-        # Вызываем команду сброса контекста
-        await cmd_reset_context(callback_query.message)
-        # Возвращаемся в главное меню
-        if is_super_admin(callback_query.from_user.id):
-            await callback_query.message.answer("🏠 <b>Главное меню</b>", reply_markup=admin_menu)
-        else:
-            await callback_query.message.answer("🏠 <b>Главное меню</b>", reply_markup=main_menu)
-    elif callback_query.data == "ai_agent_pro":
-        user_lang = await get_user_language(callback_query.from_user.id)
-        
-        # Создаём карточку с версиями AI Agent
-        versions_text = f"<b>{get_text('versions_title', user_lang)}</b>\n\n"
-        
-        # Версия FREE
-        versions_text += f"{get_text('version_free', user_lang)}\n"
-        versions_text += f"{get_text('free_features', user_lang)}\n\n"
-        
-        # Версия PRO  
-        versions_text += f"{get_text('version_pro', user_lang)}\n"
-        versions_text += f"{get_text('pro_features', user_lang)}\n\n"
-        
-        # Версия ULTRA
-        versions_text += f"{get_text('version_ultra', user_lang)}\n"
-        versions_text += f"{get_text('ultra_features', user_lang)}\n\n"
-        
-        # Разделитель
-        versions_text += "───\n\n"
-        
-        # Функционал AI Agent
-        versions_text += f"{get_text('functionality_title', user_lang)}\n\n"
-        versions_text += f"{get_text('target_users', user_lang)}"
-        
-        pro_menu = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text=get_text("back", user_lang), callback_data="back_to_main")]
-        ])
-        
-        # Используем edit_message_text вместо нового сообщения
-        try:
-            await callback_query.message.edit_text(
-                versions_text,
-                reply_markup=pro_menu,
-                parse_mode="HTML"
-            )
-        except Exception as e:
-            # Если редактирование не удалось, отправляем новое сообщение
-            await callback_query.message.answer(
-                versions_text,
-                reply_markup=pro_menu,
-                parse_mode="HTML"
-            )
-    elif callback_query.data == "change_language":
-        user_lang = await get_user_language(callback_query.from_user.id)
-        
-        language_menu = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text=get_text("russian", user_lang), callback_data="set_lang_ru"),
-             InlineKeyboardButton(text=get_text("english", user_lang), callback_data="set_lang_en")],
-            [InlineKeyboardButton(text=get_text("back", user_lang), callback_data="back_to_main")]
-        ])
-        
-        menu_text = f"<b>{get_text('language_interface', user_lang)}</b>\n\n{get_text('select_language', user_lang)}"
-        
-        # Используем edit_message_text
-        try:
-            await callback_query.message.edit_text(
-                menu_text,
-                reply_markup=language_menu,
-                parse_mode="HTML"
-            )
-        except Exception as e:
-            await callback_query.message.answer(
-                menu_text,
-                reply_markup=language_menu,
-                parse_mode="HTML"
-            )
-    elif callback_query.data == "help":
-        # Отображаем упрощённую справку
-        help_text = (
-            "ℹ️ <b>Интерфейс бота:</b>\n\n"
-            "📋 <b>Основные разделы:</b>\n"
-            "💬 ИИ Чат - Общение с ИИ\n"
-            "🔧 Настройки - Персонализация\n\n"
-            "🚀 <b>Начните с /start</b> для возвращения в главное меню!"
-        )
-        
-        await callback_query.message.answer(help_text, parse_mode="HTML")
-        # Отображаем упрощённую справку
-        help_text = (
-            "ℹ️ <b>Интерфейс бота:</b>\n\n"
-            "📋 <b>Основные разделы:</b>\n"
-            "💬 ИИ Чат - Общение с ИИ\n"
-            "🎨 Творчество - Создание изображений\n"
-            "🔧 Настройки - Персонализация\n\n"
-            "🚀 <b>Начните с /start</b> для возвращения в главное меню!"
-        )
-        
-        await callback_query.message.answer(help_text, parse_mode="HTML")
-    elif callback_query.data == "admin_panel":
-        # Проверяем, является ли пользователь супер-администратором с расширенным логированием
-        user_id = callback_query.from_user.id
-        admins_raw = os.getenv("ADMINS", "")
-        logger.info(f"👑 ДИАГНОСТИКА СУПЕР-АДМИН ДОСТУПА:")
-        logger.info(f"   user_id={user_id} (тип: {type(user_id)})")
-        logger.info(f"   ADMINS env={repr(admins_raw)}")
-        logger.info(f"   ADMINS parsed={settings.ADMINS}")
-        logger.info(f"   is_admin result={is_admin(user_id)}")
-        logger.info(f"   is_super_admin result={is_super_admin(user_id)}")
-        
-        if is_super_admin(user_id):
-            logger.info(f"✅ Супер-админский доступ РАЗРЕШЁН для user_id={user_id}")
-            await callback_query.message.answer("👑 <b>Админ-панель</b>", reply_markup=admin_commands_menu)
+
+
+async def _cb_web_search_menu(callback_query: types.CallbackQuery) -> None:
+    """Подсказка по поиску в сети."""
+    # Меню поиска в сети
+    await callback_query.message.answer(
+        "🔍 <b>Поиск в сети</b>\n\n"
+        "Используйте /search [запрос] для поиска актуальной информации в интернете.\n\n"
+        "📝 <b>Пример:</b>\n"
+        "/search погода в Москве\n"
+        "/search курс доллара сегодня",
+        parse_mode="HTML"
+    )
+
+
+async def _cb_news_search_menu(callback_query: types.CallbackQuery) -> None:
+    """Подсказка по поиску новостей."""
+    # Меню поиска новостей
+    await callback_query.message.answer(
+        "📰 <b>Поиск новостей</b>\n\n"
+        "Используйте /news [запрос] для поиска последних новостей.\n\n"
+        "📝 <b>Примеры:</b>\n"
+        "/news технологии\n"
+        "/news экономика России\n"
+        "/news (без параметров) - общие новости",
+        parse_mode="HTML"
+    )
+
+
+async def _cb_select_model(callback_query: types.CallbackQuery) -> None:
+    """Показывает меню выбора модели ИИ."""
+    await callback_query.message.answer("🤖 <b>Выберите модель ИИ</b>", reply_markup=model_selection_menu)
+
+
+async def _cb_personal_assistant(callback_query: types.CallbackQuery) -> None:
+    """Открывает меню персонального ассистента."""
+    # Показываем меню персонального ассистента
+    await show_personal_assistant_menu(callback_query.message, callback_query.from_user.id)
+
+
+async def _cb_tts_settings(callback_query: types.CallbackQuery) -> None:
+    """Показывает настройки TTS."""
+    # Показываем текущие настройки TTS и предлагаем изменить
+    await show_tts_settings(callback_query.message, callback_query.from_user.id)
+
+
+async def _cb_toggle_tts(callback_query: types.CallbackQuery) -> None:
+    """Переключает голосовые ответы."""
+    # Переключаем настройки TTS
+    await toggle_tts(callback_query.message, callback_query.from_user.id)
+    await show_tts_settings(callback_query.message, callback_query.from_user.id)
+
+
+async def _cb_change_tts_voice(callback_query: types.CallbackQuery) -> None:
+    """Показывает меню выбора голоса TTS."""
+    # Показываем меню выбора голоса
+    await callback_query.message.answer("🗣 <b>Выберите голос</b>", reply_markup=tts_voice_menu)
+
+
+async def _cb_set_voice(callback_query: types.CallbackQuery) -> None:
+    """Устанавливает голос TTS (set_voice_<голос>)."""
+    # Устанавливаем голос TTS
+    voice = callback_query.data.replace("set_voice_", "")
+    await set_tts_voice(callback_query.message, callback_query.from_user.id, voice)
+    await show_tts_settings(callback_query.message, callback_query.from_user.id)
+
+
+async def _cb_admin_stats(callback_query: types.CallbackQuery) -> None:
+    """Админская статистика."""
+    user_id = callback_query.from_user.id
+    _log_admin_check("admin_stats", user_id)
+    if is_admin(user_id):
+        logger.debug("✅ Доступ к admin_stats разрешён для user_id=%s", user_id)
+        await cmd_admin_stats(callback_query.message, pool)
+    else:
+        logger.warning("❌ Доступ к admin_stats запрещён для user_id=%s", user_id)
+        await callback_query.message.answer("⛔ У вас нет доступа к этой команде.")
+
+
+async def _cb_errors(callback_query: types.CallbackQuery) -> None:
+    """Последние ошибки (для админов)."""
+    user_id = callback_query.from_user.id
+    _log_admin_check("errors", user_id)
+    if is_admin(user_id):
+        logger.debug("✅ Доступ к errors разрешён для user_id=%s", user_id)
+        await cmd_errors(callback_query.message, pool)
+    else:
+        logger.warning("❌ Доступ к errors запрещён для user_id=%s", user_id)
+        await callback_query.message.answer("⛔ У вас нет доступа к этой команде.")
+
+
+async def _cb_bot_on(callback_query: types.CallbackQuery) -> None:
+    """Включает бота (для админов)."""
+    user_id = callback_query.from_user.id
+    _log_admin_check("bot_on", user_id)
+    if is_admin(user_id):
+        logger.debug("✅ Доступ к bot_on разрешён для user_id=%s", user_id)
+        await cmd_bot_on(callback_query.message, pool)
+    else:
+        logger.warning("❌ Доступ к bot_on запрещён для user_id=%s", user_id)
+        await callback_query.message.answer("⛔ У вас нет доступа к этой команде.")
+
+
+async def _cb_bot_off(callback_query: types.CallbackQuery) -> None:
+    """Выключает бота (для админов)."""
+    user_id = callback_query.from_user.id
+    _log_admin_check("bot_off", user_id)
+    if is_admin(user_id):
+        logger.debug("✅ Доступ к bot_off разрешён для user_id=%s", user_id)
+        await cmd_bot_off(callback_query.message, pool)
+    else:
+        logger.warning("❌ Доступ к bot_off запрещён для user_id=%s", user_id)
+        await callback_query.message.answer("⛔ У вас нет доступа к этой команде.")
+
+
+async def _cb_back_to_settings(callback_query: types.CallbackQuery) -> None:
+    """Возврат в главное меню из настроек."""
+    # Не нужно, так как settings_menu убрано
+    await _answer_home_menu(callback_query)
+
+
+async def _cb_voice_response(callback_query: types.CallbackQuery) -> None:
+    """Отвечает голосом на распознанное голосовое сообщение."""
+    # Отвечаем голосом на распознанное сообщение
+    await callback_query.message.answer("🔊 Готовлю голосовой ответ...")
+
+    # Извлекаем ключ из callback_data
+    key = callback_query.data.replace("voice_response_", "")
+    recognized_text = voice_messages_cache.get(key)
+
+    if recognized_text:
+        await process_voice_text_message(callback_query, recognized_text, voice_response=True)
+    else:
+        await callback_query.message.answer("❌ Не удалось найти распознанный текст. Попробуйте отправить голосовое сообщение снова.")
+
+
+async def _cb_text_response(callback_query: types.CallbackQuery) -> None:
+    """Отвечает текстом на распознанное голосовое сообщение."""
+    # Обычный текстовый ответ
+    await callback_query.message.answer("📝 Обрабатываю ваш запрос...")
+
+    # Извлекаем ключ из callback_data
+    key = callback_query.data.replace("text_response_", "")
+    recognized_text = voice_messages_cache.get(key)
+
+    if recognized_text:
+        await process_voice_text_message(callback_query, recognized_text, voice_response=False)
+    else:
+        await callback_query.message.answer("❌ Не удалось найти распознанный текст. Попробуйте отправить голосовое сообщение снова.")
+
+
+async def _cb_rephrase(callback_query: types.CallbackQuery) -> None:
+    """Переформулирует сохранённый ответ."""
+    # Переформулировать последний ответ
+    key = callback_query.data.replace("rephrase_", "")
+    original = response_cache.get(key) or full_response_cache.get(key)
+    if not original:
+        await callback_query.message.answer("❌ Нет текста для переформулирования. Попробуйте снова задать вопрос.")
+    else:
+        await send_chat_action(callback_query.message.chat.id, "typing")
+        run_in_background(_rephrase_and_reply(callback_query, original))
+
+
+async def _rephrase_and_reply(callback_query: types.CallbackQuery, original: str) -> None:
+    """Запрашивает у модели перефраз и отправляет его пользователю."""
+    try:
+        user_lang_cb = await get_user_language(callback_query.from_user.id)
+        prompt = "Переформулируй текст короче и проще:" if user_lang_cb == "ru" else "Rephrase the text shorter and simpler:"
+        messages = [
+            {"role": "user", "content": f"{prompt}\n\n{original}"}
+        ]
+        new_text, _ = await openai_chat_with_history(DEFAULT_SYSTEM_PROMPT, messages, None)
+        # Новая кнопка для цепочки перефраза
+        new_key = next_cache_key(callback_query.from_user.id)
+        response_cache.set(new_key, new_text)
+        rephrase_label = "🔁 Переформулировать" if user_lang_cb == "ru" else "🔁 Rephrase"
+        kb = InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text=rephrase_label, callback_data=f"rephrase_{new_key}")]])
+        await callback_query.message.answer(format_answer(user_lang_cb, new_text), reply_markup=kb, parse_mode="HTML")
+    except Exception as e:
+        logger.error("Ошибка переформулирования: %s", e)
+        await callback_query.message.answer("❌ Не удалось переформулировать. Попробуйте ещё раз позже.")
+
+
+async def _cb_show_full(callback_query: types.CallbackQuery) -> None:
+    """Показывает полный текст длинного ответа."""
+    key = callback_query.data.replace("show_full_", "")
+    full = full_response_cache.get(key)
+    if not full:
+        await callback_query.message.answer("❌ Полный текст недоступен.")
+    else:
+        user_lang_cb = await get_user_language(callback_query.from_user.id)
+        rephrase_label = "🔁 Переформулировать" if user_lang_cb == "ru" else "🔁 Rephrase"
+        kb = InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text=rephrase_label, callback_data=f"rephrase_{key}")]])
+        await callback_query.message.answer(format_answer(user_lang_cb, full), reply_markup=kb, parse_mode="HTML")
+
+
+async def _cb_smart_edit(callback_query: types.CallbackQuery) -> None:
+    """Смарт-редактура ответа: упростить или добавить примеры."""
+    is_simplify = callback_query.data.startswith("edit_simplify_")
+    key = callback_query.data.split("_", 2)[-1]
+    original = full_response_cache.get(key) or response_cache.get(key)
+    if not original:
+        await callback_query.message.answer("❌ Текст недоступен.")
+    else:
+        await send_chat_action(callback_query.message.chat.id, "typing")
+        run_in_background(_smart_edit_and_reply(callback_query, original, is_simplify))
+
+
+async def _smart_edit_and_reply(callback_query: types.CallbackQuery, original: str, is_simplify: bool) -> None:
+    """Запрашивает у модели отредактированный текст и отправляет его пользователю."""
+    try:
+        lang = await get_user_language(callback_query.from_user.id)
+        if is_simplify:
+            instruction = "Сократи и упростись до 5 пунктов, чётко и ясно." if lang == "ru" else "Shorten and simplify into 5 bullet points, clear and concise."
         else:
-            logger.warning(f"❌ Супер-админский доступ ЗАПРЕЩЁН для user_id={user_id}")
-            logger.warning(f"💡 Админ-панель доступна только основному администратору")
-            await callback_query.message.answer(
-                f"⛔ У вас нет доступа к админ-панели.\n\n"
-                f"📝 Ваш ID: {user_id}\n\n"
-                f"💡 Админ-панель доступна только основному администратору."
-            )
-    elif callback_query.data == "web_search_menu":
-        # Меню поиска в сети
-        await callback_query.message.answer(
-            "🔍 <b>Поиск в сети</b>\n\n"
-            "Используйте /search [запрос] для поиска актуальной информации в интернете.\n\n"
-            "📝 <b>Пример:</b>\n"
-            "/search погода в Москве\n"
-            "/search курс доллара сегодня",
-            parse_mode="HTML"
-        )
-    elif callback_query.data == "news_search_menu":
-        # Меню поиска новостей
-        await callback_query.message.answer(
-            "📰 <b>Поиск новостей</b>\n\n"
-            "Используйте /news [запрос] для поиска последних новостей.\n\n"
-            "📝 <b>Примеры:</b>\n"
-            "/news технологии\n"
-            "/news экономика России\n"
-            "/news (без параметров) - общие новости",
-            parse_mode="HTML"
-        )
-    elif callback_query.data == "select_model":
-        await callback_query.message.answer("🤖 <b>Выберите модель ИИ</b>", reply_markup=model_selection_menu)
-    elif callback_query.data == "personal_assistant":
-        # Показываем меню персонального ассистента
-        await show_personal_assistant_menu(callback_query.message, callback_query.from_user.id)
-    elif callback_query.data == "tts_settings":
-        # Показываем текущие настройки TTS и предлагаем изменить
-        await show_tts_settings(callback_query.message)
-    elif callback_query.data == "toggle_tts":
-        # Переключаем настройки TTS
-        await toggle_tts(callback_query.message)
-        await show_tts_settings(callback_query.message)
-    elif callback_query.data == "change_tts_voice":
-        # Показываем меню выбора голоса
-        voice_menu = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="Alloy", callback_data="set_voice_alloy")],
-            [InlineKeyboardButton(text="Echo", callback_data="set_voice_echo")],
-            [InlineKeyboardButton(text="Fable", callback_data="set_voice_fable")],
-            [InlineKeyboardButton(text="Onyx", callback_data="set_voice_onyx")],
-            [InlineKeyboardButton(text="Nova", callback_data="set_voice_nova")],
-            [InlineKeyboardButton(text="Shimmer", callback_data="set_voice_shimmer")],
-            [InlineKeyboardButton(text="⬅️ Назад", callback_data="tts_settings")],
+            instruction = "Добавь 2-3 практических примера к тексту." if lang == "ru" else "Add 2-3 practical examples to the text."
+        messages = [{"role": "user", "content": f"{instruction}\n\n{original}"}]
+        edited, _ = await openai_chat_with_history(DEFAULT_SYSTEM_PROMPT, messages, None)
+        new_key = next_cache_key(callback_query.from_user.id)
+        full_response_cache.set(new_key, edited)
+        rephrase_label = "🔁 Переформулировать" if lang == "ru" else "🔁 Rephrase"
+        kb = InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text=rephrase_label, callback_data=f"rephrase_{new_key}")]])
+        await callback_query.message.answer(format_answer(lang, edited), reply_markup=kb, parse_mode="HTML")
+    except Exception as e:
+        logger.error("Ошибка смарт-редактуры: %s", e)
+        await callback_query.message.answer("❌ Не удалось отредактировать. Попробуйте позже.")
+
+
+async def _cb_set_model(callback_query: types.CallbackQuery) -> None:
+    """Устанавливает модель ИИ (set_model_<модель>)."""
+    # Устанавливаем модель ИИ
+    model = callback_query.data.replace("set_model_", "")
+    await set_user_model(callback_query.message, callback_query.from_user.id, model)
+    # Подтверждение и главное меню одним сообщением
+    await _answer_home_menu(callback_query, f"✅ Модель ИИ успешно изменена на {model}!")
+
+
+async def _cb_art_size(callback_query: types.CallbackQuery) -> None:
+    """Запоминает выбранный размер арта."""
+    # Выбор размера для генерации арта
+    size = callback_query.data.replace("art_size_", "")
+    size_map = {"512": "512x512", "1024": "1024x1024"}
+    actual_size = size_map.get(size, "1024x1024")
+
+    await callback_query.message.answer(
+        f"🎨 Опишите, что вы хотите нарисовать:\n\n📏 Размер: {actual_size}\n\n🎆 <i>Пример: котенок на скейте в очках, стиль аниме</i>",
+        parse_mode="HTML"
+    )
+    # Сохраняем выбранный размер для следующего сообщения
+    user_art_sizes[callback_query.from_user.id] = actual_size
+
+
+async def _cb_generate_similar(callback_query: types.CallbackQuery) -> None:
+    """Генерирует арт, похожий на присланное изображение."""
+    # Генерация похожего арта на основе описания изображения
+    key = callback_query.data.replace("generate_similar_", "")
+    description = art_prompts_cache.get(key)
+
+    if description:
+        await send_chat_action(callback_query.message.chat.id, "upload_photo")
+        processing_msg = await callback_query.message.answer("🎨 Создаю похожее изображение...")
+        run_in_background(_generate_similar_and_reply(callback_query, description, processing_msg))
+    else:
+        await callback_query.message.answer("❌ Описание изображения не найдено. Попробуйте отправить изображение снова.")
+
+
+async def _generate_similar_and_reply(
+    callback_query: types.CallbackQuery, description: str, processing_msg: types.Message
+) -> None:
+    """Генерирует похожий арт и отправляет его пользователю."""
+    # Улучшаем промпт для генерации арта
+    art_prompt = f"Прекрасное художественное изображение: {description}, высокое качество, детализированное"
+
+    try:
+        image_url = await openai_image(art_prompt)
+        await processing_msg.delete()
+
+        art_key = next_cache_key()
+        art_menu = InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(text="🔄 Генерировать ещё", callback_data=f"regenerate_art_{art_key}")],
+            RESET_CONTEXT_ROW
         ])
-        await callback_query.message.answer("🗣 <b>Выберите голос</b>", reply_markup=voice_menu)
-    elif callback_query.data.startswith("set_voice_"):
-        # Устанавливаем голос TTS
-        voice = callback_query.data.replace("set_voice_", "")
-        await set_tts_voice(callback_query.message, voice)
-        await show_tts_settings(callback_query.message)
-    # Админские команды
-    elif callback_query.data == "admin_stats":
-        user_id = callback_query.from_user.id
-        logger.info(f"🔍 ПРОВЕРКА ДОСТУПА К admin_stats:")
-        logger.info(f"   user_id={user_id} (тип: {type(user_id)})")
-        logger.info(f"   is_admin result={is_admin(user_id)}")
-        if is_admin(callback_query.from_user.id):
-            logger.info(f"✅ Доступ к admin_stats РАЗРЕШЁН для user_id={user_id}")
-            await cmd_admin_stats(callback_query.message, pool)
-        else:
-            logger.warning(f"❌ Доступ к admin_stats ЗАПРЕЩЁН для user_id={user_id}")
-            await callback_query.message.answer("⛔ У вас нет доступа к этой команде.")
-    elif callback_query.data == "errors":
-        user_id = callback_query.from_user.id
-        logger.info(f"🔍 ПРОВЕРКА ДОСТУПА К errors:")
-        logger.info(f"   user_id={user_id} (тип: {type(user_id)})")
-        logger.info(f"   is_admin result={is_admin(user_id)}")
-        if is_admin(callback_query.from_user.id):
-            logger.info(f"✅ Доступ к errors РАЗРЕШЁН для user_id={user_id}")
-            await cmd_errors(callback_query.message, pool)
-        else:
-            logger.warning(f"❌ Доступ к errors ЗАПРЕЩЁН для user_id={user_id}")
-            await callback_query.message.answer("⛔ У вас нет доступа к этой команде.")
-    elif callback_query.data == "bot_on":
-        user_id = callback_query.from_user.id
-        logger.info(f"🔍 ПРОВЕРКА ДОСТУПА К bot_on:")
-        logger.info(f"   user_id={user_id} (тип: {type(user_id)})")
-        logger.info(f"   is_admin result={is_admin(user_id)}")
-        if is_admin(callback_query.from_user.id):
-            logger.info(f"✅ Доступ к bot_on РАЗРЕШЁН для user_id={user_id}")
-            await cmd_bot_on(callback_query.message, pool)
-        else:
-            logger.warning(f"❌ Доступ к bot_on ЗАПРЕЩЁН для user_id={user_id}")
-            await callback_query.message.answer("⛔ У вас нет доступа к этой команде.")
-    elif callback_query.data == "bot_off":
-        user_id = callback_query.from_user.id
-        logger.info(f"🔍 ПРОВЕРКА ДОСТУПА К bot_off:")
-        logger.info(f"   user_id={user_id} (тип: {type(user_id)})")
-        logger.info(f"   is_admin result={is_admin(user_id)}")
-        if is_admin(callback_query.from_user.id):
-            logger.info(f"✅ Доступ к bot_off РАЗРЕШЁН для user_id={user_id}")
-            await cmd_bot_off(callback_query.message, pool)
-        else:
-            logger.warning(f"❌ Доступ к bot_off ЗАПРЕЩЁН для user_id={user_id}")
-            await callback_query.message.answer("⛔ У вас нет доступа к этой команде.")
-    elif callback_query.data == "back_to_main":
-        # Возвращаемся в главное меню с редактированием сообщения
-        user_lang = await get_user_language(callback_query.from_user.id)
-        welcome_text = get_text("welcome", user_lang)
-        
-        try:
-            if is_super_admin(callback_query.from_user.id):
-                await callback_query.message.edit_text(welcome_text, reply_markup=get_admin_menu(user_lang))
-            else:
-                await callback_query.message.edit_text(welcome_text, reply_markup=get_main_menu(user_lang))
-        except Exception as e:
-            # Если редактирование не удалось
-            if is_super_admin(callback_query.from_user.id):
-                await callback_query.message.answer(welcome_text, reply_markup=get_admin_menu(user_lang))
-            else:
-                await callback_query.message.answer(welcome_text, reply_markup=get_main_menu(user_lang))
-    elif callback_query.data == "back_to_settings":
-        # Не нужно, так как settings_menu убрано
-        if is_super_admin(callback_query.from_user.id):
-            await callback_query.message.answer("🏠 <b>Главное меню</b>", reply_markup=admin_menu)
-        else:
-            await callback_query.message.answer("🏠 <b>Главное меню</b>", reply_markup=main_menu)
-    elif callback_query.data.startswith("voice_response_"):
-        # Отвечаем голосом на распознанное сообщение
-        await callback_query.message.answer("🔊 Готовлю голосовой ответ...")
-        
-        # Извлекаем ключ из callback_data
-        key = callback_query.data.replace("voice_response_", "")
-        recognized_text = voice_messages_cache.get(key)
-        
-        if recognized_text:
-            await process_voice_text_message(callback_query, recognized_text, voice_response=True)
-            # Очищаем кеш
-            voice_messages_cache.pop(key, None)
-        else:
-            await callback_query.message.answer("❌ Не удалось найти распознанный текст. Попробуйте отправить голосовое сообщение снова.")
-            
-    elif callback_query.data.startswith("text_response_"):
-        # Обычный текстовый ответ
-        await callback_query.message.answer("📝 Обрабатываю ваш запрос...")
-        
-        # Извлекаем ключ из callback_data
-        key = callback_query.data.replace("text_response_", "")
-        recognized_text = voice_messages_cache.get(key)
-        
-        if recognized_text:
-            await process_voice_text_message(callback_query, recognized_text, voice_response=False)
-            # Очищаем кеш
-            voice_messages_cache.pop(key, None)
-        else:
-            await callback_query.message.answer("❌ Не удалось найти распознанный текст. Попробуйте отправить голосовое сообщение снова.")
-    elif callback_query.data.startswith("rephrase_"):
-        # Переформулировать последний ответ
-        key = callback_query.data.replace("rephrase_", "")
-        original = response_cache.get(key)
-        if not original:
-            await callback_query.message.answer("❌ Нет текста для переформулирования. Попробуйте снова задать вопрос.")
-        else:
-            try:
-                prompt = "Переформулируй текст короче и проще:" if (await get_user_language(callback_query.from_user.id)) == "ru" else "Rephrase the text shorter and simpler:"
-                messages = [
-                    {"role": "user", "content": f"{prompt}\n\n{original}"}
-                ]
-                new_text = await openai_chat_with_history(DEFAULT_SYSTEM_PROMPT, messages, None)
-                user_lang_cb = await get_user_language(callback_query.from_user.id)
-                # Новая кнопка для цепочки перефраза
-                new_key = f"{callback_query.from_user.id}_{hash(new_text)%1000000}"
-                response_cache[new_key] = new_text
-                rephrase_label = "🔁 Переформулировать" if user_lang_cb == "ru" else "🔁 Rephrase"
-                kb = InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text=rephrase_label, callback_data=f"rephrase_{new_key}")]])
-                await callback_query.message.answer(format_answer(user_lang_cb, new_text), reply_markup=kb, parse_mode="HTML")
-            except Exception as e:
-                logger.error(f"Ошибка переформулирования: {e}")
-                await callback_query.message.answer("❌ Не удалось переформулировать. Попробуйте ещё раз позже.")
-    elif callback_query.data.startswith("show_full_"):
-        key = callback_query.data.replace("show_full_", "")
-        full = full_response_cache.get(key)
-        if not full:
-            await callback_query.message.answer("❌ Полный текст недоступен.")
-        else:
-            user_lang_cb = await get_user_language(callback_query.from_user.id)
-            rephrase_label = "🔁 Переформулировать" if user_lang_cb == "ru" else "🔁 Rephrase"
-            kb = InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text=rephrase_label, callback_data=f"rephrase_{key}")]])
-            await callback_query.message.answer(format_answer(user_lang_cb, full), reply_markup=kb, parse_mode="HTML")
-    elif callback_query.data.startswith("edit_simplify_") or callback_query.data.startswith("edit_examples_"):
-        is_simplify = callback_query.data.startswith("edit_simplify_")
-        key = callback_query.data.split("_", 2)[-1]
-        original = full_response_cache.get(key) or response_cache.get(key)
-        if not original:
-            await callback_query.message.answer("❌ Текст недоступен.")
-        else:
-            try:
-                lang = await get_user_language(callback_query.from_user.id)
-                if is_simplify:
-                    instruction = "Сократи и упростись до 5 пунктов, чётко и ясно." if lang == "ru" else "Shorten and simplify into 5 bullet points, clear and concise."
-                else:
-                    instruction = "Добавь 2-3 практических примера к тексту." if lang == "ru" else "Add 2-3 practical examples to the text."
-                messages = [{"role": "user", "content": f"{instruction}\n\n{original}"}]
-                edited = await openai_chat_with_history(DEFAULT_SYSTEM_PROMPT, messages, None)
-                new_key = f"{callback_query.from_user.id}_{hash(edited)%1000000}"
-                full_response_cache[new_key] = edited
-                response_cache[new_key] = edited
-                rephrase_label = "🔁 Переформулировать" if lang == "ru" else "🔁 Rephrase"
-                kb = InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text=rephrase_label, callback_data=f"rephrase_{new_key}")]])
-                await callback_query.message.answer(format_answer(lang, edited), reply_markup=kb, parse_mode="HTML")
-            except Exception as e:
-                logger.error(f"Ошибка смарт-редактуры: {e}")
-                await callback_query.message.answer("❌ Не удалось отредактировать. Попробуйте позже.")
-    elif callback_query.data.startswith("set_model_"):
-        # Устанавливаем модель ИИ
-        model = callback_query.data.replace("set_model_", "")
-        await set_user_model(callback_query.message, model)
-        await callback_query.message.answer(f"✅ Модель ИИ успешно изменена на {model}!")
-        # Возвращаемся в главное меню
-        if is_super_admin(callback_query.from_user.id):
-            await callback_query.message.answer("🏠 <b>Главное меню</b>", reply_markup=admin_menu)
-        else:
-            await callback_query.message.answer("🏠 <b>Главное меню</b>", reply_markup=main_menu)
-    
-    # 🎨 Обработчики для генерации изображений
-    elif callback_query.data.startswith("art_size_"):
-        # Выбор размера для генерации арта
-        size = callback_query.data.replace("art_size_", "")
-        size_map = {"512": "512x512", "1024": "1024x1024"}
-        actual_size = size_map.get(size, "1024x1024")
-        
-        await callback_query.message.answer(
-            f"🎨 Опишите, что вы хотите нарисовать:\n\n📏 Размер: {actual_size}\n\n🎆 <i>Пример: котенок на скейте в очках, стиль аниме</i>",
+
+        art_prompts_cache.set(art_key, art_prompt)
+
+        await callback_query.message.answer_photo(
+            image_url,
+            caption=f"⚡ <b>Похожий арт создан!</b>\n\n🎨 Основа: <i>{description[:100]}...</i>",
+            reply_markup=art_menu,
             parse_mode="HTML"
         )
-        # Сохраняем выбранный размер для следующего сообщения
-        user_art_sizes[callback_query.from_user.id] = actual_size
-        
-    elif callback_query.data.startswith("generate_similar_"):
-        # Генерация похожего арта на основе описания изображения
-        key = callback_query.data.replace("generate_similar_", "")
-        description = art_prompts_cache.get(key)
-        
-        if description:
-            await bot.send_chat_action(callback_query.message.chat.id, "upload_photo")
-            processing_msg = await callback_query.message.answer("🎨 Создаю похожее изображение...")
-            
-            # Улучшаем промпт для генерации арта
-            art_prompt = f"Прекрасное художественное изображение: {description}, высокое качество, детализированное"
-            
-            try:
-                image_url = await openai_image(art_prompt)
-                await processing_msg.delete()
-                
-                art_menu = InlineKeyboardMarkup(inline_keyboard=[
-                    [InlineKeyboardButton(text="🔄 Генерировать ещё", callback_data=f"regenerate_art_{hash(art_prompt)%10000}")],
-                    [InlineKeyboardButton(text="🔄 Сбросить диалог", callback_data="reset_context")]
-                ])
-                
-                art_prompts_cache[f"{hash(art_prompt)%10000}"] = art_prompt
-                
-                await callback_query.message.answer_photo(
-                    image_url,
-                    caption=f"⚡ <b>Похожий арт создан!</b>\n\n🎨 Основа: <i>{description[:100]}...</i>",
-                    reply_markup=art_menu,
-                    parse_mode="HTML"
-                )
-                
-                # Очищаем кеш
-                art_prompts_cache.pop(key, None)
-                
-            except Exception as e:
-                await processing_msg.delete()
-                logger.error(f"Ошибка генерации похожего арта: {e}")
-                await callback_query.message.answer("❌ Не удалось сгенерировать похожее изображение. Попробуйте позже.")
-        else:
-            await callback_query.message.answer("❌ Описание изображения не найдено. Попробуйте отправить изображение снова.")
+
+    except Exception as e:
+        await processing_msg.delete()
+        logger.error("Ошибка генерации похожего арта: %s", e)
+        await callback_query.message.answer("❌ Не удалось сгенерировать похожее изображение. Попробуйте позже.")
+
+
+async def _cb_regenerate_art(callback_query: types.CallbackQuery) -> None:
+    """Повторно генерирует арт по сохранённому промпту."""
+    # Повторная генерация арта
+    key = callback_query.data.replace("regenerate_art_", "")
+    prompt = art_prompts_cache.get(key)
+
+    if prompt:
+        await generate_art_image(callback_query.message, prompt)
+    else:
+        await callback_query.message.answer("❌ Промпт не найден. Попробуйте создать новое изображение через /art.")
+
+
+async def _cb_pa_add_memory(callback_query: types.CallbackQuery) -> None:
+    """Переводит пользователя в режим добавления памяти."""
+    await callback_query.message.answer(PA_ADD_MEMORY_TEXT, parse_mode="HTML")
+    # Переключаем пользователя в режим добавления памяти
+    # Будем обрабатывать следующее сообщение как память
+    user_states[callback_query.from_user.id] = "adding_memory"
+
+
+async def _cb_pa_view_stats(callback_query: types.CallbackQuery) -> None:
+    """Показывает статистику памяти."""
+    # Показываем статистику памяти пользователя
+    await show_personal_memory_stats(callback_query.message, callback_query.from_user.id)
+
+
+async def _cb_pa_clear_memory(callback_query: types.CallbackQuery) -> None:
+    """Запрашивает подтверждение очистки памяти."""
+    # Подтверждение очистки памяти
+    await callback_query.message.answer(
+        "⚠️ <b>Внимание!</b>\n\n"
+        "Вы уверены, что хотите удалить всю персональную память?\n"
+        "Это действие необратимо.",
+        reply_markup=pa_clear_confirm_menu,
+        parse_mode="HTML"
+    )
+
+
+async def _cb_pa_confirm_clear(callback_query: types.CallbackQuery) -> None:
+    """Очищает память пользователя."""
+    # Очищаем память пользователя
+    await personal_assistant.clear_user_memory(callback_query.from_user.id)
+    # Подтверждение и главное меню одним сообщением
+    await _answer_home_menu(
+        callback_query,
+        "🗑️ <b>Память очищена</b>\n\n"
+        "Вся ваша персональная память была удалена."
+    )
+
+
+async def _cb_pa_toggle_mode(callback_query: types.CallbackQuery) -> None:
+    """Переключает персональный режим."""
+    # Переключаем режим персонального ассистента
+    await toggle_personal_assistant_mode(callback_query.message, callback_query.from_user.id)
+
+
+async def _cb_back_to_pa(callback_query: types.CallbackQuery) -> None:
+    """Возврат в меню персонального ассистента."""
+    # Возвращаемся в меню персонального ассистента
+    await show_personal_assistant_menu(callback_query.message, callback_query.from_user.id)
+
+# callback_data, которые обслуживает маршрутизатор из app.handlers
+ROUTED_CALLBACKS = frozenset({
+    "ai_agent_pro", "back_to_main", "change_language", "set_lang_ru", "set_lang_en",
+    "toggle_versions_lang", "show_welcome",
+})
+
+# Обработчики по точному совпадению callback_data
+CALLBACK_HANDLERS: Dict[str, Callable[[types.CallbackQuery], Awaitable[None]]] = {
+    "ai_chat_menu": _cb_ai_chat_menu,
+    "creative_menu": _cb_creative_menu,
+    "analytics_menu": _cb_analytics_menu,
+    "settings_menu": _cb_settings_menu,
+    "start_chat": _cb_start_chat,
+    "create_image": _cb_create_image,
+    "image_analysis_info": _cb_image_analysis_info,
+    "user_stats": _cb_user_stats,
+    "language_settings": _cb_language_settings,
+    "notification_settings": _cb_notification_settings,
+    "reset_context": _cb_reset_context,
+    "help": _cb_help,
+    "admin_panel": _cb_admin_panel,
+    "web_search_menu": _cb_web_search_menu,
+    "news_search_menu": _cb_news_search_menu,
+    "select_model": _cb_select_model,
+    "personal_assistant": _cb_personal_assistant,
+    "tts_settings": _cb_tts_settings,
+    "toggle_tts": _cb_toggle_tts,
+    "change_tts_voice": _cb_change_tts_voice,
+    "admin_stats": _cb_admin_stats,
+    "errors": _cb_errors,
+    "bot_on": _cb_bot_on,
+    "bot_off": _cb_bot_off,
+    "back_to_settings": _cb_back_to_settings,
+    "pa_add_memory": _cb_pa_add_memory,
+    "pa_view_stats": _cb_pa_view_stats,
+    "pa_clear_memory": _cb_pa_clear_memory,
+    "pa_confirm_clear": _cb_pa_confirm_clear,
+    "pa_toggle_mode": _cb_pa_toggle_mode,
+    "back_to_pa": _cb_back_to_pa,
+}
+
+# Обработчики по префиксу callback_data (параметр идёт после префикса)
+CALLBACK_PREFIX_HANDLERS: Dict[str, Callable[[types.CallbackQuery], Awaitable[None]]] = {
+    "set_voice_": _cb_set_voice,
+    "voice_response_": _cb_voice_response,
+    "text_response_": _cb_text_response,
+    "rephrase_": _cb_rephrase,
+    "show_full_": _cb_show_full,
+    "edit_simplify_": _cb_smart_edit,
+    "edit_examples_": _cb_smart_edit,
+    "set_model_": _cb_set_model,
+    "art_size_": _cb_art_size,
+    "generate_similar_": _cb_generate_similar,
+    "regenerate_art_": _cb_regenerate_art,
+}
+
+# Все префиксы проверяются одним регулярным выражением вместо цикла startswith
+_CALLBACK_PREFIX_RE = re.compile("|".join(map(re.escape, CALLBACK_PREFIX_HANDLERS)))
+
+
+async def _answer_callback(callback_query: types.CallbackQuery) -> None:
+    """Подтверждает нажатие кнопки, не роняя обработку при ошибке сети."""
+    try:
+        await callback_query.answer()
+    except Exception as e:
+        logger.warning("Не удалось подтвердить callback %s: %s", callback_query.id, e)
+
+
+@dp.callback_query()
+async def process_callback(callback_query: types.CallbackQuery) -> None:
+    """Обработчик нажатий на кнопки меню."""
+    data = callback_query.data or ""
     
-    elif callback_query.data.startswith("regenerate_art_"):
-        # Повторная генерация арта
-        key = callback_query.data.replace("regenerate_art_", "")
-        prompt = art_prompts_cache.get(key)
-        
-        if prompt:
-            await generate_art_image(callback_query.message, prompt)
-        else:
-            await callback_query.message.answer("❌ Промпт не найден. Попробуйте создать новое изображение через /art.")
+    # Используем новый маршрутизатор для новых callback-ов; его обработчики
+    # сами отвечают на callback (в том числе текстом или alert), а Telegram
+    # принимает только первый ответ
+    if data in ROUTED_CALLBACKS:
+        await route_callback(callback_query)
+        return
     
-    # 🧠 Обработчики для персонального ассистента
-    elif callback_query.data == "pa_add_memory":
-        await callback_query.message.answer(
-            "🧠 <b>Добавить память</b>\n\n"
-            "📝 Напишите что-то, что вы хотите, чтобы я запомнил о вас:\n\n"
-            "💡 <i>Примеры:</i>\n"
-            "• Мне нравится стиль минимализм\n"
-            "• Я работаю программистом\n"
-            "• Предпочитаю краткие ответы\n"
-            "• Я изучаю Python",
-            parse_mode="HTML"
-        )
-        # Переключаем пользователя в режим добавления памяти
-        # Будем обрабатывать следующее сообщение как память
-        user_states[callback_query.from_user.id] = "adding_memory"
-    
-    elif callback_query.data == "pa_view_stats":
-        # Показываем статистику памяти пользователя
-        await show_personal_memory_stats(callback_query.message, callback_query.from_user.id)
-    
-    elif callback_query.data == "pa_clear_memory":
-        # Подтверждение очистки памяти
-        confirm_menu = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="✅ Да, очистить всё", callback_data="pa_confirm_clear")],
-            [InlineKeyboardButton(text="❌ Отмена", callback_data="personal_assistant")]
-        ])
-        await callback_query.message.answer(
-            "⚠️ <b>Внимание!</b>\n\n"
-            "Вы уверены, что хотите удалить всю персональную память?\n"
-            "Это действие необратимо.",
-            reply_markup=confirm_menu,
-            parse_mode="HTML"
-        )
+    # Подтверждение отправляем параллельно с обработкой, не дожидаясь ответа Telegram
+    spawn(_answer_callback(callback_query))
     
-    elif callback_query.data == "pa_confirm_clear":
-        # Очищаем память пользователя
-        await personal_assistant.clear_user_memory(callback_query.from_user.id)
-        await callback_query.message.answer(
-            "🗑️ <b>Память очищена</b>\n\n"
-            "Вся ваша персональная память была удалена.",
-            parse_mode="HTML"
-        )
-        # Возвращаемся в главное меню
-        if is_super_admin(callback_query.from_user.id):
-            await callback_query.message.answer("🏠 <b>Главное меню</b>", reply_markup=admin_menu)
-        else:
-            await callback_query.message.answer("🏠 <b>Главное меню</b>", reply_markup=main_menu)
+    handler = CALLBACK_HANDLERS.get(data)
+    if handler is None:
+        match = _CALLBACK_PREFIX_RE.match(data)
+        if match:
+            handler = CALLBACK_PREFIX_HANDLERS[match.group()]
     
-    elif callback_query.data == "pa_toggle_mode":
-        # Переключаем режим персонального ассистента
-        await toggle_personal_assistant_mode(callback_query.message, callback_query.from_user.id)
+    if handler is None:
+        logger.warning("Необработанный callback: %s", data)
+        return
     
-    elif callback_query.data == "back_to_pa":
-        # Возвращаемся в меню персонального ассистента
-        await show_personal_assistant_menu(callback_query.message, callback_query.from_user.id)
+    # Ошибка одной кнопки не должна уходить в общий обработчик aiogram
+    try:
+        await handler(callback_query)
+    except Exception:
+        logger.exception("Ошибка в обработчике callback %s", data)
 
 
 @dp.message(Command("admin_stats"))
@@ -1109,9 +1500,10 @@ async def cmd_reset_context_handler(message: types.Message) -> None:
 
 async def generate_art_image(message: types.Message, text: str, size: str = "1024x1024") -> None:
     """Генерирует изображение с указанным размером."""
+    processing_msg = None
     try:
         # Показываем индикатор обработки
-        await bot.send_chat_action(message.chat.id, "upload_photo")
+        await send_chat_action(message.chat.id, "upload_photo")
         processing_msg = await message.answer(f"🎨 Генерирую изображение {size}...")
         
         # Генерируем изображение
@@ -1119,15 +1511,17 @@ async def generate_art_image(message: types.Message, text: str, size: str = "102
         
         # Удаляем сообщение об обработке
         await processing_msg.delete()
+        processing_msg = None
         
         # Кнопки для дополнительных действий
+        art_key = next_cache_key()
         art_menu = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="🔄 Генерировать ещё", callback_data=f"regenerate_art_{hash(text)%10000}")],
-            [InlineKeyboardButton(text="🔄 Сбросить диалог", callback_data="reset_context")]
+            [InlineKeyboardButton(text="🔄 Генерировать ещё", callback_data=f"regenerate_art_{art_key}")],
+            RESET_CONTEXT_ROW
         ])
         
         # Сохраняем промпт для повторной генерации
-        art_prompts_cache[f"{hash(text)%10000}"] = text
+        art_prompts_cache.set(art_key, text)
         
         # Отправляем изображение
         await message.answer_photo(
@@ -1139,44 +1533,30 @@ async def generate_art_image(message: types.Message, text: str, size: str = "102
         
         # Записываем в базу
         if pool:
-            try:
-                async with pool.acquire() as conn:
-                    await conn.execute(
-                        "INSERT INTO logs (username, command, args, answer) VALUES ($1, $2, $3, $4)",
-                        message.from_user.username,
-                        "art",
-                        f"{text} ({size})",
-                        f"Сгенерировано: {image_url}",
-                    )
-            except Exception as e:
-                logger.error(f"Ошибка записи в БД: {e}")
-                
+            await database_service.log_command(
+                message.from_user.username,
+                "art",
+                f"{text} ({size})",
+                f"Сгенерировано: {image_url}"
+            )
     except Exception as e:
-        if 'processing_msg' in locals():
-            await processing_msg.delete()
-        logger.error(f"Ошибка генерации изображения: {e}")
+        if processing_msg is not None:
+            with contextlib.suppress(Exception):
+                await processing_msg.delete()
+        logger.error("Ошибка генерации изображения: %s", e)
         await message.answer("❌ Произошла ошибка при генерации изображения. Попробуйте упростить описание.")
 
 
 async def cmd_reset_context(message: types.Message) -> None:
     """Обработчик команды /reset_context для сброса контекста диалога."""
-    global pool
-    
-    if not pool:
+    if not database_service.is_available():
         await message.answer("❌ База данных недоступна. Контекст не может быть сброшен.")
         return
     
-    try:
-        async with pool.acquire() as conn:
-            # Удаляем историю диалога для этого пользователя
-            await conn.execute(
-                "DELETE FROM dialog_history WHERE user_id = $1",
-                message.from_user.id
-            )
-        
+    # Удаляем историю диалога для этого пользователя
+    if await database_service.clear_dialog_history(message.from_user.id):
         await message.answer("✅ Контекст диалога успешно сброшен. Начнём с чистого листа!")
-    except Exception as e:
-        logger.error(f"Ошибка при сбросе контекста: {e}")
+    else:
         await message.answer("❌ Произошла ошибка при сбросе контекста. Попробуйте позже.")
 
 
@@ -1197,9 +1577,11 @@ async def cmd_search(message: types.Message, command: CommandObject) -> None:
         await message.answer(f"ℹ️ {help_text}")
         return
     
-    # Показываем индикатор печати
-    await bot.send_chat_action(message.chat.id, "typing")
-    processing_msg = await message.answer("🔍 Выполняю поиск в интернете...")
+    # Показываем индикатор печати и сообщение о поиске одновременно
+    _, processing_msg = await asyncio.gather(
+        send_chat_action(message.chat.id, "typing"),
+        message.answer("🔍 Выполняю поиск в интернете...")
+    )
     
     try:
         # Выполняем поиск
@@ -1213,21 +1595,16 @@ async def cmd_search(message: types.Message, command: CommandObject) -> None:
         
         # Записываем в базу данных
         if pool:
-            try:
-                async with pool.acquire() as conn:
-                    await conn.execute(
-                        "INSERT INTO logs (username, command, args, answer) VALUES ($1, $2, $3, $4)",
-                        message.from_user.username,
-                        "search",
-                        query,
-                        f"Поиск выполнен: {query[:100]}..."
-                    )
-            except Exception as e:
-                logger.error(f"Ошибка записи поиска в БД: {e}")
+            await database_service.log_command(
+                message.from_user.username,
+                "search",
+                query,
+                f"Поиск выполнен: {query[:100]}..."
+            )
         
     except Exception as e:
         await processing_msg.delete()
-        logger.error(f"Ошибка поиска: {e}")
+        logger.error("Ошибка поиска: %s", e)
         await message.answer("❌ Произошла ошибка при выполнении поиска. Попробуйте позже.")
 
 
@@ -1236,9 +1613,11 @@ async def cmd_news(message: types.Message, command: CommandObject) -> None:
     """Обработчик команды /news для поиска новостей."""
     query = command.args if command.args else "последние новости"
     
-    # Показываем индикатор печати
-    await bot.send_chat_action(message.chat.id, "typing")
-    processing_msg = await message.answer("📰 Ищу последние новости...")
+    # Показываем индикатор печати и сообщение о поиске одновременно
+    _, processing_msg = await asyncio.gather(
+        send_chat_action(message.chat.id, "typing"),
+        message.answer("📰 Ищу последние новости...")
+    )
     
     try:
         # Выполняем поиск новостей
@@ -1252,21 +1631,16 @@ async def cmd_news(message: types.Message, command: CommandObject) -> None:
         
         # Записываем в базу данных
         if pool:
-            try:
-                async with pool.acquire() as conn:
-                    await conn.execute(
-                        "INSERT INTO logs (username, command, args, answer) VALUES ($1, $2, $3, $4)",
-                        message.from_user.username,
-                        "news",
-                        query,
-                        f"Поиск новостей: {query[:100]}..."
-                    )
-            except Exception as e:
-                logger.error(f"Ошибка записи новостей в БД: {e}")
+            await database_service.log_command(
+                message.from_user.username,
+                "news",
+                query,
+                f"Поиск новостей: {query[:100]}..."
+            )
         
     except Exception as e:
         await processing_msg.delete()
-        logger.error(f"Ошибка поиска новостей: {e}")
+        logger.error("Ошибка поиска новостей: %s", e)
         await message.answer("❌ Произошла ошибка при поиске новостей. Попробуйте позже.")
 
 
@@ -1277,37 +1651,12 @@ async def cmd_admin(message: types.Message) -> None:
         await message.answer("⛔ У вас нет доступа к админ-панели.")
         return
     
-    admin_panel_text = (
-        "👑 <b>Админ-панель</b>\n\n"
-        "Доступные команды:\n"
-        "/admin_stats - Статистика бота\n"
-        "/errors - Последние ошибки\n"
-        "/bot_on - Включить бота\n"
-        "/bot_off - Выключить бота\n\n"
-        "Используйте эти команды для управления ботом."
-    )
-    await message.answer(admin_panel_text)
-
-
-@dp.message()
-async def handle_message(message: types.Message) -> None:
-    """Обработчик всех текстовых сообщений."""
-    global pool
-    
-    # Обрабатываем голосовые сообщения
-    if message.voice:
-        await handle_voice_message(message)
-        return
-    
-    # Обрабатываем изображения
-    if message.photo:
-        await handle_image_message(message)
-        return
-    
-    # Обрабатываем текстовые сообщения
-    await process_text_message(message)
+    await message.answer(ADMIN_PANEL_TEXT)
 
 
+# Сообщения разводятся по обработчикам фильтрами aiogram: обработчик
+# не вызывается для апдейтов, которые он всё равно пропустил бы
+@dp.message(F.voice)
 async def handle_voice_message(message: types.Message) -> None:
     """Улучшенный обработчик голосовых сообщений с индикатором обработки."""
     global pool
@@ -1317,116 +1666,65 @@ async def handle_voice_message(message: types.Message) -> None:
         await message.answer("⛔ Бот временно отключён администратором.")
         return
     
-    # Показываем индикатор "печатает"
-    await bot.send_chat_action(message.chat.id, "typing")
-    processing_msg = await message.answer("⚙️ Обрабатываю голосовое сообщение...")
+    # Индикатор, сообщение об обработке и данные файла не зависят друг
+    # от друга, поэтому запрашиваем их у Telegram одновременно
+    _, processing_msg, file_info = await asyncio.gather(
+        send_chat_action(message.chat.id, "typing"),
+        message.answer("⚙️ Обрабатываю голосовое сообщение..."),
+        bot.get_file(message.voice.file_id),
+        return_exceptions=True
+    )
+    if isinstance(processing_msg, Exception):
+        processing_msg = None
     
+    # Текст ошибки для пользователя зависит от этапа, на котором она случилась
+    error_text = "❌ Произошла ошибка при обработке голосового сообщения. Попробуйте ещё раз."
+    recognized_text = None
     try:
-        # Получаем файл голосового сообщения
-        file_info = await bot.get_file(message.voice.file_id)
-        file_path = file_info.file_path
-        
-        # Скачиваем голосовое сообщение
-        file_url = f"https://api.telegram.org/file/bot{settings.TELEGRAM_BOT_TOKEN}/{file_path}"
-        
-        # Создаем временное имя файла
-        import tempfile
-        import aiohttp
-        import os
+        if isinstance(file_info, Exception):
+            raise file_info
         
-        with tempfile.NamedTemporaryFile(suffix=".ogg", delete=False) as temp_file:
-            temp_filename = temp_file.name
-            
-        # Скачиваем файл
-        try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(file_url) as response:
-                    if response.status == 200:
-                        with open(temp_filename, 'wb') as f:
-                            f.write(await response.read())
-                    else:
-                        raise Exception(f"Не удалось скачать голосовое сообщение: {response.status}")
-        except Exception as e:
-            await processing_msg.delete()
-            logger.error(f"Ошибка скачивания голосового файла: {e}")
-            await message.answer("❌ Не удалось скачать голосовое сообщение. Попробуйте ещё раз.")
-            return
+        # Скачиваем файл через сессию бота прямо в память: голосовые
+        # сообщения небольшие, а Whisper принимает OGG как есть
+        error_text = "❌ Не удалось скачать голосовое сообщение. Попробуйте ещё раз."
+        buffer = io.BytesIO()
+        await bot.download_file(file_info.file_path, destination=buffer, chunk_size=DOWNLOAD_CHUNK_SIZE)
         
         # Распознаем речь с помощью OpenAI Whisper
-        try:
-            await bot.send_chat_action(message.chat.id, "typing")
-            recognized_text = await openai_stt(temp_filename)
-            
-            if not recognized_text or len(recognized_text.strip()) == 0:
-                raise Exception("Пустой результат распознавания")
-                
-        except Exception as e:
-            await processing_msg.delete()
-            logger.error(f"Ошибка распознавания речи: {e}")
-            # Удаляем временный файл
-            try:
-                os.unlink(temp_filename)
-            except Exception:
-                pass
-            await message.answer("❌ Не удалось распознать голосовое сообщение. Проверьте качество записи или попробуйте снова.")
-            return
-        
-        # Удаляем временный файл
-        try:
-            os.unlink(temp_filename)
-        except Exception:
-            pass
-        
-        # Удаляем сообщение об обработке
-        await processing_msg.delete()
-        
-        # Отправляем пользователю распознанный текст и кнопки выбора ответа
-        voice_menu = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="🔊 Ответить голосом", callback_data=f"voice_response_{message.from_user.id}_{hash(recognized_text)%10000}")],
-            [InlineKeyboardButton(text="📝 Текстовый ответ", callback_data=f"text_response_{message.from_user.id}_{hash(recognized_text)%10000}")],
-            [InlineKeyboardButton(text="🔄 Сбросить диалог", callback_data="reset_context")]
-        ])
-        
-        # Сохраняем распознанный текст в кеше
-        cache_key = f"{message.from_user.id}_{hash(recognized_text)%10000}"
-        voice_messages_cache[cache_key] = recognized_text
-        
-        await message.answer(
-            f"🎤 <b>Распознано:</b>\n\n<i>{recognized_text}</i>\n\n🤔 Как ответить?",
-            reply_markup=voice_menu,
-            parse_mode="HTML"
-        )
-        
-    except Exception as e:
-        await processing_msg.delete()
-        logger.error(f"Общая ошибка при обработке голосового сообщения: {e}")
-        await message.answer("❌ Произошла ошибка при обработке голосового сообщения. Попробуйте ещё раз.")
-
-
-async def set_user_language(message: types.Message, user_id: int, language: str) -> None:
-    """Устанавливает предпочитаемый язык интерфейса для пользователя."""
-    if not database_service.is_available():
-        await message.answer("❌ База данных недоступна. Настройки не могут быть сохранены.")
+        error_text = "❌ Не удалось распознать голосовое сообщение. Проверьте качество записи или попробуйте снова."
+        await send_chat_action(message.chat.id, "typing")
+        recognized_text = await openai_stt(buffer.getvalue())
+        if not recognized_text or not recognized_text.strip():
+            recognized_text = None
+            raise Exception("Пустой результат распознавания")
+    except Exception:
+        logger.exception("Ошибка при обработке голосового сообщения")
+    finally:
+        # Сообщение об обработке удаляем ровно один раз при любом исходе
+        if processing_msg is not None:
+            with contextlib.suppress(Exception):
+                await processing_msg.delete()
+    
+    if recognized_text is None:
+        await message.answer(error_text)
         return
     
-    try:
-        # Получаем текущие настройки
-        current_settings = await database_service.get_user_settings(user_id) or {}
-        
-        # Обновляем язык
-        current_settings["language"] = language
-        
-        # Сохраняем настройки
-        success = await database_service.save_user_settings(user_id, current_settings)
-        
-        if success:
-            logger.info(f"Пользователь {user_id} изменил язык на {language}")
-        else:
-            await message.answer("❌ Произошла ошибка при сохранении настроек.")
-            
-    except Exception as e:
-        logger.error(f"Ошибка при сохранении языка пользователя: {e}")
-        await message.answer("❌ Произошла ошибка при сохранении настроек. Попробуйте позже.")
+    # Сохраняем распознанный текст в кеше
+    cache_key = next_cache_key(message.from_user.id)
+    voice_messages_cache.set(cache_key, recognized_text)
+    
+    # Отправляем пользователю распознанный текст и кнопки выбора ответа
+    voice_menu = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="🔊 Ответить голосом", callback_data=f"voice_response_{cache_key}")],
+        [InlineKeyboardButton(text="📝 Текстовый ответ", callback_data=f"text_response_{cache_key}")],
+        RESET_CONTEXT_ROW
+    ])
+    
+    await message.answer(
+        f"🎤 <b>Распознано:</b>\n\n<i>{recognized_text}</i>\n\n🤔 Как ответить?",
+        reply_markup=voice_menu,
+        parse_mode="HTML"
+    )
 
 
 async def get_user_language(user_id: int) -> str:
@@ -1435,73 +1733,46 @@ async def get_user_language(user_id: int) -> str:
         return "ru"  # Язык по умолчанию
     
     try:
-        settings = await database_service.get_user_settings(user_id)
-        if settings and settings.get("language"):
-            return settings["language"]
+        return await user_service.get_user_language(user_id)
     except Exception as e:
-        logger.error(f"Ошибка при получении языка пользователя: {e}")
+        logger.error("Ошибка при получении языка пользователя: %s", e)
     
     return "ru"  # Язык по умолчанию
 
 
-async def set_user_model(message: types.Message, model: str) -> None:
+async def set_user_model(message: types.Message, user_id: int, model: str) -> None:
     """Устанавливает предпочитаемую модель ИИ для пользователя."""
     if not database_service.is_available():
         await message.answer("❌ База данных недоступна. Настройки не могут быть сохранены.")
         return
     
     try:
-        # Получаем текущие настройки
-        current_settings = await database_service.get_user_settings(message.from_user.id) or {}
-        
-        # Обновляем модель
-        current_settings["preferred_model"] = model
-        
-        # Сохраняем настройки
-        success = await database_service.save_user_settings(message.from_user.id, current_settings)
+        success = await database_service.update_user_setting(user_id, "preferred_model", model)
         
         if success:
-            logger.info(f"Пользователь {message.from_user.id} изменил модель на {model}")
+            _personal_stats_cache.pop(user_id)
+            logger.info("Пользователь %s изменил модель на %s", user_id, model)
         else:
             await message.answer("❌ Произошла ошибка при сохранении настроек.")
             
     except Exception as e:
-        logger.error(f"Ошибка при сохранении модели пользователя: {e}")
+        logger.error("Ошибка при сохранении модели пользователя: %s", e)
         await message.answer("❌ Произошла ошибка при сохранении настроек. Попробуйте позже.")
 
 
 
-async def show_tts_settings(message: types.Message) -> None:
+async def show_tts_settings(message: types.Message, user_id: int) -> None:
     """Показывает текущие настройки TTS."""
-    global pool
-    
-    tts_enabled = False
-    tts_voice = "alloy"
-    
-    if pool:
-        try:
-            async with pool.acquire() as conn:
-                row = await conn.fetchrow(
-                    "SELECT tts_enabled, tts_voice FROM user_settings WHERE user_id = $1",
-                    message.from_user.id
-                )
-                if row:
-                    tts_enabled = row["tts_enabled"]
-                    tts_voice = row["tts_voice"]
-        except Exception as e:
-            logger.error(f"Ошибка при получении настроек TTS: {e}")
+    user_settings = await database_service.get_user_settings(user_id) or {}
+    tts_enabled = user_settings.get("tts_enabled") or False
+    tts_voice = user_settings.get("tts_voice") or "alloy"
     
-    status = "Включены" if tts_enabled else "Выключены"
-    tts_menu = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text=f"🔊 Голосовые ответы: {status}", callback_data="toggle_tts")],
-        [InlineKeyboardButton(text=f"🗣 Голос: {tts_voice.title()}", callback_data="change_tts_voice")],
-        [InlineKeyboardButton(text="⬅️ Назад", callback_data="back_to_main")],
-    ])
+    tts_menu = get_tts_settings_menu(tts_enabled, tts_voice)
     
     await message.answer("🔊 <b>Настройки голосовых ответов</b>", reply_markup=tts_menu)
 
 
-async def toggle_tts(message: types.Message) -> None:
+async def toggle_tts(message: types.Message, user_id: int) -> None:
     """Переключает настройки TTS."""
     global pool
     
@@ -1510,46 +1781,21 @@ async def toggle_tts(message: types.Message) -> None:
         return
     
     try:
-        async with pool.acquire() as conn:
-            # Получаем текущие настройки
-            row = await conn.fetchrow(
-                "SELECT tts_enabled FROM user_settings WHERE user_id = $1",
-                message.from_user.id
-            )
-            
-            current_tts = False
-            if row:
-                current_tts = row["tts_enabled"]
-            
-            new_tts = not current_tts
-            
-            # Проверяем, есть ли уже настройки пользователя
-            existing = await conn.fetchrow(
-                "SELECT user_id FROM user_settings WHERE user_id = $1",
-                message.from_user.id
-            )
-            
-            if existing:
-                # Обновляем существующие настройки
-                await conn.execute(
-                    "UPDATE user_settings SET tts_enabled = $1, updated_at = now() WHERE user_id = $2",
-                    new_tts, message.from_user.id
-                )
-            else:
-                # Создаем новые настройки с всеми полями по умолчанию
-                await conn.execute(
-                    "INSERT INTO user_settings (user_id, tts_enabled, preferred_model, tts_voice, created_at, updated_at) VALUES ($1, $2, $3, $4, now(), now())",
-                    message.from_user.id, new_tts, "gpt-4o", "alloy"
-                )
+        # Переключаем флаг одним запросом и получаем новое значение
+        new_tts = await database_service.toggle_user_setting(user_id, "tts_enabled")
+        if new_tts is None:
+            await message.answer("❌ Произошла ошибка при изменении настроек. Попробуйте позже.")
+            return
         
+        _personal_stats_cache.pop(user_id)
         status = "включены" if new_tts else "выключены"
-        logger.info(f"Пользователь {message.from_user.id} изменил TTS на {status}")
+        logger.info("Пользователь %s изменил TTS на %s", user_id, status)
     except Exception as e:
-        logger.error(f"Ошибка при переключении TTS: {e}")
+        logger.error("Ошибка при переключении TTS: %s", e)
         await message.answer("❌ Произошла ошибка при изменении настроек. Попробуйте позже.")
 
 
-async def set_tts_voice(message: types.Message, voice: str) -> None:
+async def set_tts_voice(message: types.Message, user_id: int, voice: str) -> None:
     """Устанавливает голос для TTS."""
     global pool
     
@@ -1558,32 +1804,17 @@ async def set_tts_voice(message: types.Message, voice: str) -> None:
         return
     
     try:
-        async with pool.acquire() as conn:
-            # Проверяем, есть ли уже настройки пользователя
-            existing = await conn.fetchrow(
-                "SELECT user_id FROM user_settings WHERE user_id = $1",
-                message.from_user.id
-            )
-            
-            if existing:
-                # Обновляем существующие настройки
-                await conn.execute(
-                    "UPDATE user_settings SET tts_voice = $1, updated_at = now() WHERE user_id = $2",
-                    voice, message.from_user.id
-                )
-            else:
-                # Создаем новые настройки с всеми полями по умолчанию
-                await conn.execute(
-                    "INSERT INTO user_settings (user_id, tts_voice, preferred_model, tts_enabled, created_at, updated_at) VALUES ($1, $2, $3, $4, now(), now())",
-                    message.from_user.id, voice, "gpt-4o", False
-                )
+        if not await database_service.update_user_setting(user_id, "tts_voice", voice):
+            await message.answer("❌ Произошла ошибка при сохранении настроек. Попробуйте позже.")
+            return
         
-        logger.info(f"Пользователь {message.from_user.id} изменил голос TTS на {voice}")
+        logger.info("Пользователь %s изменил голос TTS на %s", user_id, voice)
     except Exception as e:
-        logger.error(f"Ошибка при сохранении голоса TTS: {e}")
+        logger.error("Ошибка при сохранении голоса TTS: %s", e)
         await message.answer("❌ Произошла ошибка при сохранении настроек. Попробуйте позже.")
 
 
+@dp.message(F.photo)
 async def handle_image_message(message: types.Message) -> None:
     """Обработчик сообщений с изображениями."""
     # Проверяем, активен ли бот
@@ -1595,63 +1826,55 @@ async def handle_image_message(message: types.Message) -> None:
         # Получаем самое большое изображение из присланных
         photo = message.photo[-1]
         
-        # Получаем файл изображения
-        file_info = await bot.get_file(photo.file_id)
-        file_path = file_info.file_path
-        
-        # Создаем URL для скачивания
-        file_url = f"https://api.telegram.org/file/bot{settings.TELEGRAM_BOT_TOKEN}/{file_path}"
+        # Изображение нужно целиком для OpenAI Vision, поэтому размер
+        # проверяем до скачивания по данным Telegram
+        if photo.file_size and photo.file_size > settings.MAX_IMAGE_BYTES:
+            raise Exception(f"Изображение больше {settings.MAX_IMAGE_BYTES} байт")
         
         # Получаем текст сообщения (если есть)
         caption = message.caption or "Что изображено на этой картинке?"
         
-        await message.answer("👀 Анализирую изображение...")
+        # Данные файла запрашиваем одновременно с сообщением о статусе
+        file_info, _ = await asyncio.gather(
+            bot.get_file(photo.file_id),
+            message.answer("👀 Анализирую изображение...")
+        )
         
-        # Скачиваем файл изображения
-        import aiohttp
-        async with aiohttp.ClientSession() as session:
-            async with session.get(file_url) as resp:
-                if resp.status != 200:
-                    raise Exception(f"Не удалось скачать изображение: {resp.status}")
-                image_data = await resp.read()
+        # Скачиваем файл изображения через сессию бота
+        buffer = io.BytesIO()
+        await bot.download_file(file_info.file_path, destination=buffer, chunk_size=DOWNLOAD_CHUNK_SIZE)
+        image_data = buffer.getvalue()
         
         # Анализируем изображение через OpenAI Vision
         try:
             response = await openai_vision(image_data, caption)
         except Exception as e:
-            logger.error(f"Ошибка анализа изображения: {e}")
+            logger.error("Ошибка анализа изображения: %s", e)
             response = "❌ Извините, не удалось проанализировать изображение. Попробуйте отправить другое изображение или опишите что на нём текстом."
         
         # Усечение длинных ответов для Telegram
-        if len(response) > settings.MAX_TG_REPLY:
-            response = response[: settings.MAX_TG_REPLY] + "... (ответ усечён)"
+        response = truncate_reply(response)
         
         # Отправляем ответ пользователю
         await message.answer(response)
         
         # Записываем взаимодействие в базу
         if database_service.is_available():
-            try:
-                await database_service.log_command(
-                    message.from_user.username or str(message.from_user.id),
-                    "vision",
-                    caption,
-                    response
-                )
-                # Сохраняем в истории диалога
-                await database_service.save_dialog_message(
-                    message.from_user.id, "user", f"[Изображение] {caption}"
-                )
-                await database_service.save_dialog_message(
-                    message.from_user.id, "assistant", response
-                )
-            except Exception as e:
-                logger.error(f"Ошибка при записи в базу данных: {e}")
+            # Лог и история диалога одним запросом, в фоне: ответ уже отправлен
+            spawn(database_service.log_exchange(
+                message.from_user.username or str(message.from_user.id),
+                "vision",
+                caption,
+                response,
+                message.from_user.id,
+                f"[Изображение] {caption}",
+                response
+            ))
         else:
             logger.warning("Нет подключения к базе данных, пропускаем запись лога")
     
     except Exception as e:
-        logger.error(f"Ошибка при анализе изображения: {e}")
+        logger.error("Ошибка при анализе изображения: %s", e)
         await message.answer("❌ Извините, произошла ошибка при анализе изображения.")
 
 
@@ -1664,13 +1887,11 @@ async def process_voice_text_message(callback_query: types.CallbackQuery, text:
         await callback_query.message.answer("⛔ Бот временно отключён администратором.")
         return
     
-    text_lower = text.lower()
-    
     # Обрабатываем автоматический поиск
-    if search_service.detect_search_intent(text, SEARCH_KEYWORDS):
+    if search_service.detect_search_intent(text):
         try:
             # Показываем индикатор поиска
-            await bot.send_chat_action(callback_query.message.chat.id, "typing")
+            await send_chat_action(callback_query.message.chat.id, "typing")
             search_msg = await callback_query.message.answer("🔍 Поиск актуальной информации...")
             
             # Выполняем поиск
@@ -1682,205 +1903,172 @@ async def process_voice_text_message(callback_query: types.CallbackQuery, text:
             
             # Записываем в базу данных
             if pool:
-                try:
-                    async with pool.acquire() as conn:
-                        await conn.execute(
-                            "INSERT INTO logs (username, command, args, answer) VALUES ($1, $2, $3, $4)",
-                            callback_query.from_user.username,
-                            "auto_search",
-                            text,
-                            f"Автоматический поиск: {text[:100]}...",
-                        )
-                        # Сохраняем сообщение в истории диалога
-                        await conn.execute(
-                            "INSERT INTO dialog_history (user_id, role, content) VALUES ($1, $2, $3)",
-                            callback_query.from_user.id, "user", text
-                        )
-                        await conn.execute(
-                            "INSERT INTO dialog_history (user_id, role, content) VALUES ($1, $2, $3)",
-                            callback_query.from_user.id, "assistant", search_results
-                        )
-                except Exception as e:
-                    logger.error(f"Ошибка при записи авто-поиска в БД: {e}")
+                # Лог и история диалога одним запросом, в фоне: ответ уже отправлен
+                spawn(database_service.log_exchange(
+                    callback_query.from_user.username,
+                    "auto_search",
+                    text,
+                    f"Автоматический поиск: {text[:100]}...",
+                    callback_query.from_user.id,
+                    text,
+                    search_results
+                ))
             return
         except Exception as e:
-            logger.error(f"Ошибка автоматического поиска: {e}")
+            logger.error("Ошибка автоматического поиска: %s", e)
             # Продолжаем с обычным ответом AI
     
-    text_lower = text.lower()
-    
     # Обрабатываем автоматическую генерацию изображений
-    if any(word in text_lower for word in IMAGE_KEYWORDS):
+    if IMAGE_KEYWORDS_RE.search(text):
         try:
             image_url = await openai_image(text)
             await callback_query.message.answer_photo(image_url, caption=f"✨ Вот что получилось!")
             
             # Записываем в базу
             if pool:
-                try:
-                    async with pool.acquire() as conn:
-                        await conn.execute(
-                            "INSERT INTO logs (username, command, args, answer) VALUES ($1, $2, $3, $4)",
-                            callback_query.from_user.username,
-                            "voice_art",
-                            text,
-                            f"Сгенерировано изображение из голосового: {image_url}",
-                        )
-                except Exception as e:
-                    logger.error(f"Ошибка при записи в базу данных: {e}")
+                await database_service.log_command(
+                    callback_query.from_user.username,
+                    "voice_art",
+                    text,
+                    f"Сгенерировано изображение из голосового: {image_url}"
+                )
             return
         except Exception as e:
-            logger.error(f"Ошибка при генерации изображения: {e}")
+            logger.error("Ошибка при генерации изображения: %s", e)
             await callback_query.message.answer("❌ Извините, произошла ошибка при генерации изображения.")
             return
     
     try:
-        # Получаем модель пользователя
-        user_model = None
-        if pool:
-            try:
-                async with pool.acquire() as conn:
-                    row = await conn.fetchrow(
-                        "SELECT preferred_model FROM user_settings WHERE user_id = $1",
-                        callback_query.from_user.id
-                    )
-                    if row:
-                        user_model = row["preferred_model"]
-            except Exception as e:
-                logger.error(f"Ошибка при получении настроек пользователя: {e}")
-        
-        # Получаем историю диалога
-        dialog_history = []
-        if pool:
-            try:
-                async with pool.acquire() as conn:
-                    rows = await conn.fetch(
-                        "SELECT role, content FROM dialog_history WHERE user_id = $1 ORDER BY id DESC LIMIT 10",
-                        callback_query.from_user.id
-                    )
-                    dialog_history = [{"role": row["role"], "content": row["content"]} for row in reversed(rows)]
-            except Exception as e:
-                logger.error(f"Ошибка при получении истории диалога: {e}")
+        # Настройки (обычно из кеша) и историю диалога читаем одновременно
+        user_settings, dialog_history = await asyncio.gather(
+            database_service.get_user_settings(callback_query.from_user.id),
+            database_service.get_dialog_history(callback_query.from_user.id, limit=10)
+        )
+        user_settings = user_settings or {}
+        # Модель и язык берём из той же строки настроек
+        user_model = user_settings.get("preferred_model")
         
         # Добавляем текущее сообщение
         dialog_history.append({"role": "user", "content": text})
         
-        # Получаем ответ от OpenAI
+        # Получаем ответ от OpenAI; признак обрыва по лимиту нужен только
+        # для приписки в сообщении, в историю и кеш уходит чистый текст
+        cut_off = False
         try:
-            system_prompt = DEFAULT_SYSTEM_PROMPT + get_mode_instruction(callback_query.from_user.id)
-            response = await openai_chat_with_history(system_prompt, dialog_history, user_model)
+            system_prompt = get_system_prompt(callback_query.from_user.id)
+            response, cut_off = await openai_chat_with_history(
+                system_prompt, dialog_history, user_model, max_tokens=settings.MAX_RESPONSE_TOKENS
+            )
         except Exception as e:
-            logger.error(f"Ошибка OpenAI API: {e}")
+            logger.error("Ошибка OpenAI API: %s", e)
             response = "❌ Извините, сейчас проблемы с AI сервисом. Попробуйте позже."
         
         # Ограничиваем длину
-        if len(response) > settings.MAX_TG_REPLY:
-            response = response[:settings.MAX_TG_REPLY] + "... (ответ усечён)"
+        response = truncate_reply(response)
         
         # Отправляем ответ (голосовой или текстовый) с оформлением
         if voice_response and len(response) < MAX_TTS_LENGTH:  # Ограничение для TTS
             try:
                 # Получаем настройки голоса
-                tts_voice = "alloy"
-                if pool:
-                    try:
-                        async with pool.acquire() as conn:
-                            row = await conn.fetchrow(
-                                "SELECT tts_voice FROM user_settings WHERE user_id = $1",
-                                callback_query.from_user.id
-                            )
-                            if row:
-                                tts_voice = row["tts_voice"]
-                    except Exception as e:
-                        logger.error(f"Ошибка при получении настроек TTS: {e}")
+                tts_voice = user_settings.get("tts_voice") or "alloy"
                 
                 # Генерируем голосовое сообщение
                 audio_content = await openai_tts(response, tts_voice)
                 
-                # Создаем временный файл
-                import tempfile
-                import os
-                
-                with tempfile.NamedTemporaryFile(suffix=".mp3", delete=False) as temp_file:
-                    temp_filename = temp_file.name
-                    temp_file.write(audio_content)
-                
-                # Отправляем голосовое сообщение
-                from aiogram.types import FSInputFile
-                audio = FSInputFile(temp_filename, filename="response.mp3")
-                caption = response[:1000] + "..." if len(response) > 1000 else response
-                await callback_query.message.answer_voice(audio, caption=caption)
-                
-                # Удаляем временный файл
-                os.unlink(temp_filename)
+                # Отправляем голосовое сообщение прямо из памяти
+                audio = BufferedInputFile(audio_content, filename="response.mp3")
+                await callback_query.message.answer_voice(audio, caption=voice_caption(response, cut_off))
             except Exception as e:
-                logger.error(f"Ошибка при генерации голосового ответа: {e}")
+                logger.error("Ошибка при генерации голосового ответа: %s", e)
                 # Отправляем текстовый ответ в случае ошибки
-                await callback_query.message.answer(format_answer("ru", response), parse_mode="HTML")
+                await callback_query.message.answer(
+                    format_answer("ru", with_length_note(response, cut_off)), parse_mode="HTML"
+                )
         else:
             # Отправляем текстовый ответ
-            user_lang_cb = await get_user_language(callback_query.from_user.id)
+            user_lang_cb = user_settings.get("language") or "ru"
             # Кешируем полный ответ
-            full_key = f"{callback_query.from_user.id}_{hash(response)%1000000}"
-            full_response_cache[full_key] = response
-            response_cache[full_key] = response
+            full_key = next_cache_key(callback_query.from_user.id)
+            full_response_cache.set(full_key, response)
             # Если длинный — показать превью + кнопка "Показать полностью"
             preview_limit = 800
             if len(response) > preview_limit:
                 preview = response[:preview_limit] + "…"
-                buttons = [
-                    [InlineKeyboardButton(text=("🔎 Показать полностью" if user_lang_cb == "ru" else "🔎 Show full"), callback_data=f"show_full_{full_key}")],
-                    [InlineKeyboardButton(text=("🔁 Переформулировать" if user_lang_cb == "ru" else "🔁 Rephrase"), callback_data=f"rephrase_{full_key}")],
-                    [InlineKeyboardButton(text=("✨ Упростить" if user_lang_cb == "ru" else "✨ Simplify"), callback_data=f"edit_simplify_{full_key}"),
-                     InlineKeyboardButton(text=("📌 Примеры" if user_lang_cb == "ru" else "📌 Examples"), callback_data=f"edit_examples_{full_key}")]
-                ]
-                kb = InlineKeyboardMarkup(inline_keyboard=buttons)
-                await callback_query.message.answer(format_answer(user_lang_cb, preview), reply_markup=kb, parse_mode="HTML")
+                kb = get_answer_menu(user_lang_cb, full_key, show_full=True)
+                await callback_query.message.answer(format_answer(user_lang_cb, with_length_note(preview, cut_off)), reply_markup=kb, parse_mode="HTML")
             else:
-                buttons = [
-                    [InlineKeyboardButton(text=("🔁 Переформулировать" if user_lang_cb == "ru" else "🔁 Rephrase"), callback_data=f"rephrase_{full_key}")],
-                    [InlineKeyboardButton(text=("✨ Упростить" if user_lang_cb == "ru" else "✨ Simplify"), callback_data=f"edit_simplify_{full_key}"),
-                     InlineKeyboardButton(text=("📌 Примеры" if user_lang_cb == "ru" else "📌 Examples"), callback_data=f"edit_examples_{full_key}")]
-                ]
-                kb = InlineKeyboardMarkup(inline_keyboard=buttons)
-                await callback_query.message.answer(format_answer(user_lang_cb, response), reply_markup=kb, parse_mode="HTML")
+                kb = get_answer_menu(user_lang_cb, full_key)
+                await callback_query.message.answer(format_answer(user_lang_cb, with_length_note(response, cut_off)), reply_markup=kb, parse_mode="HTML")
         
         # Записываем в базу
         if pool:
-            try:
-                async with pool.acquire() as conn:
-                    await conn.execute(
-                        "INSERT INTO logs (username, command, args, answer) VALUES ($1, $2, $3, $4)",
-                        callback_query.from_user.username,
-                        "voice_message",
-                        text,
-                        response,
-                    )
-                    # Сохраняем в истории диалога
-                    await conn.execute(
-                        "INSERT INTO dialog_history (user_id, role, content) VALUES ($1, $2, $3)",
-                        callback_query.from_user.id, "user", text
-                    )
-                    await conn.execute(
-                        "INSERT INTO dialog_history (user_id, role, content) VALUES ($1, $2, $3)",
-                        callback_query.from_user.id, "assistant", response
-                    )
-            except Exception as e:
-                logger.error(f"Ошибка при записи в базу данных: {e}")
-                
+            # Лог и история диалога одним запросом, в фоне: ответ уже отправлен
+            spawn(database_service.log_exchange(
+                callback_query.from_user.username,
+                "voice_message",
+                text,
+                response,
+                callback_query.from_user.id,
+                text,
+                response
+            ))
     except Exception as e:
-        logger.error(f"Ошибка обработки голосового сообщения: {e}")
+        logger.error("Ошибка обработки голосового сообщения: %s", e)
         await callback_query.message.answer("❌ Извините, произошла ошибка при обработке вашего сообщения.")
 
 
-async def process_text_message(message) -> None:
-    """Обрабатывает текстовое сообщение (обычное или из голосового)."""
-    global pool
-    
-    # Игнорируем сообщения без текста
-    if not message.text:
+def is_image_request(message: types.Message) -> bool:
+    """
+    Фильтр: пользователь явно просит "нарисуй", "сделай картинку", "создай арт".
+
+    Текст, который пользователь сейчас сохраняет в память ассистента,
+    картинкой не считается.
+    """
+    return (
+        user_states.get(message.from_user.id) != "adding_memory"
+        and IMAGE_KEYWORDS_RE.search(message.text) is not None
+    )
+
+
+@dp.message(F.text, is_image_request)
+async def handle_image_request(message: types.Message) -> None:
+    """Генерирует изображение по текстовой просьбе пользователя."""
+    # Проверяем, активен ли бот
+    if not await is_bot_active(pool):
+        await message.answer("⛔ Бот временно отключён администратором.")
         return
     
+    try:
+        # Генерируем изображение через OpenAI
+        image_url = await openai_image(message.text)
+        # Отправляем изображение пользователю
+        await message.answer_photo(image_url, caption=f"✨ Вот что получилось!")
+        
+        # Записываем взаимодействие в базу
+        if pool:
+            # Лог и история диалога одним запросом, в фоне: ответ уже отправлен
+            art_answer = f"Сгенерировано изображение: {image_url}"
+            spawn(database_service.log_exchange(
+                message.from_user.username,
+                "auto_art",
+                message.text,
+                art_answer,
+                message.from_user.id,
+                message.text,
+                art_answer
+            ))
+        else:
+            logger.warning("Нет подключения к базе данных, пропускаем запись лога")
+    except Exception as e:
+        logger.error("Ошибка при генерации изображения: %s", e)
+        await message.answer("❌ Извините, произошла ошибка при генерации изображения.")
+
+
+@dp.message(F.text)
+async def process_text_message(message: types.Message) -> None:
+    """Обработчик всех текстовых сообщений."""
+    global pool
+    
     # Проверяем состояние пользователя для персонального ассистента
     user_id = message.from_user.id
     user_state = user_states.get(user_id)
@@ -1907,7 +2095,7 @@ async def process_text_message(message) -> None:
             return
             
         except Exception as e:
-            logger.error(f"Ошибка при добавлении памяти: {e}")
+            logger.error("Ошибка при добавлении памяти: %s", e)
             user_states.pop(user_id, None)  # Убираем состояние
             await message.answer(
                 "❌ Произошла ошибка при сохранении памяти. Попробуйте позже."
@@ -1919,218 +2107,114 @@ async def process_text_message(message) -> None:
         await message.answer("⛔ Бот временно отключён администратором.")
         return
     
-    text = message.text.lower()
-    
-    # Если пользователь явно просит "нарисуй", "сделай картинку", "создай арт"
-    if any(word in text for word in IMAGE_KEYWORDS):
-        try:
-            # Генерируем изображение через OpenAI
-            image_url = await openai_image(message.text)
-            # Отправляем изображение пользователю
-            await message.answer_photo(image_url, caption=f"✨ Вот что получилось!")
-            
-            # Записываем взаимодействие в базу
-            if pool:
-                try:
-                    async with pool.acquire() as conn:
-                        await conn.execute(
-                            "INSERT INTO logs (username, command, args, answer) VALUES ($1, $2, $3, $4)",
-                            message.from_user.username,
-                            "auto_art",
-                            message.text,
-                            f"Сгенерировано изображение: {image_url}",
-                        )
-                        # Сохраняем сообщение в истории диалога
-                        await conn.execute(
-                            "INSERT INTO dialog_history (user_id, role, content) VALUES ($1, $2, $3)",
-                            message.from_user.id, "user", message.text
-                        )
-                        await conn.execute(
-                            "INSERT INTO dialog_history (user_id, role, content) VALUES ($1, $2, $3)",
-                            message.from_user.id, "assistant", f"Сгенерировано изображение: {image_url}"
-                        )
-                except Exception as e:
-                    logger.error(f"Ошибка при записи в базу данных: {e}")
-                    # Продолжаем работу, даже если не удалось записать в БД
-            else:
-                logger.warning("Нет подключения к базе данных, пропускаем запись лога")
-            return
-        except Exception as e:
-            logger.error(f"Ошибка при генерации изображения: {e}")
-            await message.answer("❌ Извините, произошла ошибка при генерации изображения.")
-            return
-    
     try:
-        # Получаем выбранную пользователем модель
-        user_model = None
-        if pool:
-            try:
-                async with pool.acquire() as conn:
-                    row = await conn.fetchrow(
-                        "SELECT preferred_model FROM user_settings WHERE user_id = $1",
-                        message.from_user.id
-                    )
-                    if row:
-                        user_model = row["preferred_model"]
-            except Exception as e:
-                logger.error(f"Ошибка при получении настроек пользователя: {e}")
-        
-        # Получаем историю диалога
-        dialog_history = []
-        if pool:
-            try:
-                async with pool.acquire() as conn:
-                    rows = await conn.fetch(
-                        "SELECT role, content FROM dialog_history WHERE user_id = $1 ORDER BY id DESC LIMIT 10",
-                        message.from_user.id
-                    )
-                    # Переворачиваем историю, чтобы она была в хронологическом порядке
-                    dialog_history = [{"role": row["role"], "content": row["content"]} for row in reversed(rows)]
-            except Exception as e:
-                logger.error(f"Ошибка при получении истории диалога: {e}")
+        # Настройки пользователя (модель, язык, TTS, персональный режим) одной
+        # строкой, обычно из кеша в памяти
+        user_settings = await database_service.get_user_settings(user_id) or {}
+        user_model = user_settings.get("preferred_model")
+        pa_enabled = user_settings.get("personal_assistant_enabled") or False
+        
+        # История диалога (уже в хронологическом порядке) и персональный контекст
+        # из векторной памяти не зависят друг от друга, запрашиваем их одновременно
+        user_context = ""
+        if pa_enabled:
+            dialog_history, user_context = await asyncio.gather(
+                database_service.get_dialog_history(user_id, limit=10),
+                personal_assistant.get_user_context(user_id, message.text)
+            )
+        else:
+            dialog_history = await database_service.get_dialog_history(user_id, limit=10)
         
         # Добавляем текущее сообщение в историю
         dialog_history.append({"role": "user", "content": message.text})
         
-        # Проверяем, включён ли персональный режим
-        pa_enabled = await get_personal_assistant_mode(user_id)
-        
-        # Получаем ответ от OpenAI с учётом истории и персонального контекста
+        # Получаем ответ от OpenAI с учётом истории и персонального контекста;
+        # признак обрыва по лимиту нужен только для приписки в сообщении
+        cut_off = False
         try:
-            system_prompt = DEFAULT_SYSTEM_PROMPT + get_mode_instruction(user_id)
+            system_prompt = get_system_prompt(user_id)
             if pa_enabled:
-                # Получаем персональный контекст для пользователя
-                user_context = await personal_assistant.get_user_context(user_id, message.text)
-                
                 # Используем персональный контекст
-                response = await openai_chat_with_personal_context(
+                response, cut_off = await openai_chat_with_personal_context(
                     system_prompt, 
                     dialog_history, 
                     user_context,
-                    user_model
+                    user_model,
+                    max_tokens=settings.MAX_RESPONSE_TOKENS
                 )
                 
-                # Обучаем персонального ассистента на основе диалога
-                await personal_assistant.learn_from_dialogue(user_id, message.text, response)
+                # Обучаем персонального ассистента на основе диалога в фоне:
+                # эмбеддинги не должны задерживать ответ пользователю
+                run_in_background(personal_assistant.learn_from_dialogue(user_id, message.text, response))
             else:
                 # Обычный режим без персонального контекста
-                response = await openai_chat_with_history(system_prompt, dialog_history, user_model)
+                response, cut_off = await openai_chat_with_history(
+                    system_prompt, dialog_history, user_model, max_tokens=settings.MAX_RESPONSE_TOKENS
+                )
         except Exception as e:
-            logger.error(f"Ошибка OpenAI API: {e}")
+            logger.error("Ошибка OpenAI API: %s", e)
             # Fallback на простой ответ
             response = "❌ Извините, сейчас проблемы с AI сервисом. Попробуйте позже или обратитесь к администратору."
             # Записываем ошибку в логи для мониторинга
             if pool:
-                try:
-                    async with pool.acquire() as conn:
-                        await conn.execute(
-                            "INSERT INTO logs (username, command, args, answer) VALUES ($1, $2, $3, $4)",
-                            message.from_user.username,
-                            "error_api",
-                            str(e),
-                            "❌ OpenAI API недоступен"
-                        )
-                except Exception:
-                    pass  # Игнорируем ошибки логирования
+                await database_service.log_command(
+                    message.from_user.username,
+                    "error_api",
+                    str(e),
+                    "❌ OpenAI API недоступен"
+                )
         
         # Усечение длинных ответов для Telegram
-        if len(response) > settings.MAX_TG_REPLY:
-            response = response[: settings.MAX_TG_REPLY] + "... (ответ усечён)"
+        response = truncate_reply(response)
         
         # Отправляем ответ пользователю
         # Проверяем, включены ли голосовые ответы
-        tts_enabled = False
-        tts_voice = "alloy"
-        if pool:
-            try:
-                async with pool.acquire() as conn:
-                    row = await conn.fetchrow(
-                        "SELECT tts_enabled, tts_voice FROM user_settings WHERE user_id = $1",
-                        message.from_user.id
-                    )
-                    if row:
-                        tts_enabled = row["tts_enabled"]
-                        tts_voice = row["tts_voice"]
-            except Exception as e:
-                logger.error(f"Ошибка при получении настроек TTS: {e}")
+        # Длину проверяем первой: слишком длинный ответ всё равно уйдёт текстом
+        tts_enabled = len(response) < MAX_TTS_LENGTH and bool(user_settings.get("tts_enabled"))
         
-        if tts_enabled and len(response) < 4000:  # Ограничение на длину для TTS
+        if tts_enabled:
+            tts_voice = user_settings.get("tts_voice") or "alloy"
             try:
                 # Генерируем голосовое сообщение
                 audio_content = await openai_tts(response, tts_voice)
                 
-                # Создаем временный файл для аудио
-                import tempfile
-                import os
-                
-                with tempfile.NamedTemporaryFile(suffix=".mp3", delete=False) as temp_file:
-                    temp_filename = temp_file.name
-                    temp_file.write(audio_content)
-                
-                # Отправляем голосовое сообщение
-                from aiogram.types import FSInputFile
-                audio = FSInputFile(temp_filename, filename="response.mp3")
-                await message.answer_voice(audio, caption=response[:1000] + "..." if len(response) > 1000 else response)
-                
-                # Удаляем временный файл
-                os.unlink(temp_filename)
+                # Отправляем голосовое сообщение прямо из памяти
+                audio = BufferedInputFile(audio_content, filename="response.mp3")
+                await message.answer_voice(audio, caption=voice_caption(response, cut_off))
             except Exception as e:
-                logger.error(f"Ошибка при генерации голосового ответа: {e}")
+                logger.error("Ошибка при генерации голосового ответа: %s", e)
                 # Отправляем текстовый ответ в случае ошибки
-                user_lang_msg = await get_user_language(message.from_user.id)
-                await message.answer(format_answer(user_lang_msg, response), parse_mode="HTML")
+                user_lang_msg = user_settings.get("language") or "ru"
+                await message.answer(format_answer(user_lang_msg, with_length_note(response, cut_off)), parse_mode="HTML")
         else:
             # Отправляем текстовый ответ + кнопки
-            user_lang_msg = await get_user_language(message.from_user.id)
-            full_key = f"{message.from_user.id}_{hash(response)%1000000}"
-            full_response_cache[full_key] = response
-            response_cache[full_key] = response
+            user_lang_msg = user_settings.get("language") or "ru"
+            full_key = next_cache_key(message.from_user.id)
+            full_response_cache.set(full_key, response)
             if len(response) > 800:
                 preview = response[:800] + "…"
-                buttons = [
-                    [InlineKeyboardButton(text=("🔎 Показать полностью" if user_lang_msg == "ru" else "🔎 Show full"), callback_data=f"show_full_{full_key}")],
-                    [InlineKeyboardButton(text=("🔁 Переформулировать" if user_lang_msg == "ru" else "🔁 Rephrase"), callback_data=f"rephrase_{full_key}")],
-                    [InlineKeyboardButton(text=("✨ Упростить" if user_lang_msg == "ru" else "✨ Simplify"), callback_data=f"edit_simplify_{full_key}"),
-                     InlineKeyboardButton(text=("📌 Примеры" if user_lang_msg == "ru" else "📌 Examples"), callback_data=f"edit_examples_{full_key}")]
-                ]
-                kb = InlineKeyboardMarkup(inline_keyboard=buttons)
-                await message.answer(format_answer(user_lang_msg, preview), reply_markup=kb, parse_mode="HTML")
+                kb = get_answer_menu(user_lang_msg, full_key, show_full=True)
+                await message.answer(format_answer(user_lang_msg, with_length_note(preview, cut_off)), reply_markup=kb, parse_mode="HTML")
             else:
-                buttons = [
-                    [InlineKeyboardButton(text=("🔁 Переформулировать" if user_lang_msg == "ru" else "🔁 Rephrase"), callback_data=f"rephrase_{full_key}")],
-                    [InlineKeyboardButton(text=("✨ Упростить" if user_lang_msg == "ru" else "✨ Simplify"), callback_data=f"edit_simplify_{full_key}"),
-                     InlineKeyboardButton(text=("📌 Примеры" if user_lang_msg == "ru" else "📌 Examples"), callback_data=f"edit_examples_{full_key}")]
-                ]
-                kb = InlineKeyboardMarkup(inline_keyboard=buttons)
-                await message.answer(format_answer(user_lang_msg, response), reply_markup=kb, parse_mode="HTML")
+                kb = get_answer_menu(user_lang_msg, full_key)
+                await message.answer(format_answer(user_lang_msg, with_length_note(response, cut_off)), reply_markup=kb, parse_mode="HTML")
         
         # Записываем взаимодействие в базу
         if pool:
-            try:
-                async with pool.acquire() as conn:
-                    await conn.execute(
-                        "INSERT INTO logs (username, command, args, answer) VALUES ($1, $2, $3, $4)",
-                        message.from_user.username,
-                        "message",
-                        message.text,
-                        response,
-                    )
-                    # Сохраняем сообщение в истории диалога
-                    await conn.execute(
-                        "INSERT INTO dialog_history (user_id, role, content) VALUES ($1, $2, $3)",
-                        message.from_user.id, "user", message.text
-                    )
-                    await conn.execute(
-                        "INSERT INTO dialog_history (user_id, role, content) VALUES ($1, $2, $3)",
-                        message.from_user.id, "assistant", response
-                    )
-            except Exception as e:
-                logger.error(f"Ошибка при записи в базу данных: {e}")
-                # Продолжаем работу, даже если не удалось записать в БД
+            # Лог и история диалога одним запросом, в фоне: ответ уже отправлен
+            spawn(database_service.log_exchange(
+                message.from_user.username,
+                "message",
+                message.text,
+                response,
+                message.from_user.id,
+                message.text,
+                response
+            ))
         else:
             logger.warning("Нет подключения к базе данных, пропускаем запись лога")
     except Exception as e:
-        logger.error(f"Ошибка обработки сообщения: {e}")
+        logger.error("Ошибка обработки сообщения: %s", e)
         await message.answer("❌ Извините, произошла ошибка при обработке вашего сообщения.")
 
 
@@ -2166,7 +2250,7 @@ async def show_personal_assistant_menu(message: types.Message, user_id: int) ->
         )
         
     except Exception as e:
-        logger.error(f"Ошибка при отображении меню персонального ассистента: {e}")
+        logger.error("Ошибка при отображении меню персонального ассистента: %s", e)
         await message.answer("❌ Ошибка при загрузке меню персонального ассистента.")
 
 
@@ -2177,55 +2261,33 @@ async def show_personal_memory_stats(message: types.Message, user_id: int) -> No
         total_memories = stats.get("total_memories", 0)
         by_type = stats.get("by_type", {})
         
-        stats_text = f"📊 <b>Статистика памяти</b>\n\n"
-        stats_text += f"📦 <b>Всего записей:</b> {total_memories}\n\n"
+        parts = [
+            "📊 <b>Статистика памяти</b>\n\n",
+            f"📦 <b>Всего записей:</b> {total_memories}\n\n",
+        ]
         
         if by_type:
-            stats_text += "📊 <b>По типам:</b>\n"
+            parts.append("📊 <b>По типам:</b>\n")
             for memory_type, count in by_type.items():
-                type_names = {
-                    "dialogue": "💬 Диалоги",
-                    "preference": "❤️ Предпочтения",
-                    "fact": "📝 Факты",
-                    "custom": "🏷️ Пользовательские"
-                }
-                type_name = type_names.get(memory_type, memory_type.title())
-                stats_text += f"• {type_name}: {count}\n"
+                type_name = MEMORY_TYPE_NAMES.get(memory_type, memory_type.title())
+                parts.append(f"• {type_name}: {count}\n")
         else:
-            stats_text += "😊 Пока нет сохранённых воспоминаний."
-        
-        stats_text += "\n\n💡 Добавляйте новые воспоминания, чтобы я лучше вас понимал!"
+            parts.append("😊 Пока нет сохранённых воспоминаний.")
         
-        back_menu = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="⬅️ Назад к меню", callback_data="back_to_pa")]
-        ])
+        parts.append("\n\n💡 Добавляйте новые воспоминания, чтобы я лучше вас понимал!")
+        stats_text = "".join(parts)
         
-        await message.answer(stats_text, reply_markup=back_menu, parse_mode="HTML")
+        await message.answer(stats_text, reply_markup=pa_stats_back_menu, parse_mode="HTML")
         
     except Exception as e:
-        logger.error(f"Ошибка при получении статистики памяти: {e}")
+        logger.error("Ошибка при получении статистики памяти: %s", e)
         await message.answer("❌ Ошибка при получении статистики.")
 
 
 async def get_personal_assistant_mode(user_id: int) -> bool:
     """Получает статус персонального режима для пользователя."""
-    global pool
-    
-    if not pool:
-        return False
-    
-    try:
-        async with pool.acquire() as conn:
-            row = await conn.fetchrow(
-                "SELECT personal_assistant_enabled FROM user_settings WHERE user_id = $1",
-                user_id
-            )
-            if row:
-                return row["personal_assistant_enabled"] or False
-            return False
-    except Exception as e:
-        logger.error(f"Ошибка при получении статуса персонального ассистента: {e}")
-        return False
+    user_settings = await database_service.get_user_settings(user_id) or {}
+    return user_settings.get("personal_assistant_enabled") or False
 
 
 async def set_personal_assistant_mode(user_id: int, enabled: bool) -> None:
@@ -2236,35 +2298,21 @@ async def set_personal_assistant_mode(user_id: int, enabled: bool) -> None:
         return
     
     try:
-        async with pool.acquire() as conn:
-            # Проверяем, есть ли уже настройки пользователя
-            existing = await conn.fetchrow(
-                "SELECT user_id FROM user_settings WHERE user_id = $1",
-                user_id
-            )
-            
-            if existing:
-                # Обновляем существующие настройки
-                await conn.execute(
-                    "UPDATE user_settings SET personal_assistant_enabled = $1, updated_at = now() WHERE user_id = $2",
-                    enabled, user_id
-                )
-            else:
-                # Создаём новые настройки
-                await conn.execute(
-                    "INSERT INTO user_settings (user_id, personal_assistant_enabled, preferred_model, tts_enabled, tts_voice) VALUES ($1, $2, $3, $4, $5)",
-                    user_id, enabled, "gpt-4o", False, "alloy"
-                )
+        await database_service.update_user_setting(user_id, "personal_assistant_enabled", enabled)
+        _personal_stats_cache.pop(user_id)
     except Exception as e:
-        logger.error(f"Ошибка при сохранении режима персонального ассистента: {e}")
+        logger.error("Ошибка при сохранении режима персонального ассистента: %s", e)
 
 
 async def toggle_personal_assistant_mode(message: types.Message, user_id: int) -> None:
     """Переключает режим персонального ассистента."""
     try:
-        current_mode = await get_personal_assistant_mode(user_id)
-        new_mode = not current_mode
-        await set_personal_assistant_mode(user_id, new_mode)
+        # Переключаем режим одним запросом и получаем новое значение
+        new_mode = await database_service.toggle_user_setting(user_id, "personal_assistant_enabled")
+        if new_mode is None:
+            await message.answer("❌ Ошибка при переключении режима.")
+            return
+        _personal_stats_cache.pop(user_id)
         
         status = "🟢 включён" if new_mode else "🔴 выключен"
         await message.answer(f"🎛️ Персональный режим {status}!")
@@ -2273,14 +2321,12 @@ async def toggle_personal_assistant_mode(message: types.Message, user_id: int) -
         await show_personal_assistant_menu(message, user_id)
         
     except Exception as e:
-        logger.error(f"Ошибка при переключении режима персонального ассистента: {e}")
+        logger.error("Ошибка при переключении режима персонального ассистента: %s", e)
         await message.answer("❌ Ошибка при переключении режима.")
 
 
 async def main() -> None:
     """Главная функция для запуска бота."""
-    import os
-    
     logger.info("Запуск Telegram-бота...")
     
     # Настройка хендлеров запуска и остановки
@@ -2299,17 +2345,23 @@ async def main() -> None:
         port  # Railway автоматически ставит PORT
     )
     
-    logger.info(f"🔍 Проверка переменных:")
-    logger.info(f"   WEBHOOK_URL: {webhook_url}")
-    logger.info(f"   PORT: {port}")
-    logger.info(f"   Используем webhook: {use_webhook}")
+    logger.info("🔍 Проверка переменных:")
+    logger.info("   WEBHOOK_URL: %s", webhook_url)
+    logger.info("   PORT: %s", port)
+    logger.info("   Используем webhook: %s", use_webhook)
     
     if use_webhook:
-        logger.info(f"🌐 Используется WEBHOOK режим (безопасно для Railway): {webhook_url}")
+        logger.info("🌐 Используется WEBHOOK режим (безопасно для Railway): %s", webhook_url)
+        started = False
         try:
             # Создаем webhook менеджер
             webhook_manager = WebhookManager(bot, dp)
             
+            # В webhook-режиме aiogram сам не вызывает startup/shutdown
+            # (это делает только start_polling), поэтому запускаем их явно
+            await dp.emit_startup(bot=bot)
+            started = True
+            
             # Запускаем webhook сервер
             runner = await webhook_manager.run_webhook_server()
             
@@ -2318,45 +2370,75 @@ async def main() -> None:
             # Проверяем статус webhook
             webhook_info = await webhook_manager.get_telegram_webhook_info()
             if webhook_info:
-                logger.info(f"📊 Webhook URL: {webhook_info.url}")
+                logger.info("📊 Webhook URL: %s", webhook_info.url)
                 if webhook_info.last_error_date:
-                    logger.warning(f"⚠️ Последняя ошибка: {webhook_info.last_error_message}")
+                    logger.warning("⚠️ Последняя ошибка: %s", webhook_info.last_error_message)
                 else:
                     logger.info("✅ Webhook работает без ошибок")
             
-            # Ожидаем завершения
+            # Ожидаем сигнала остановки вместо периодических пробуждений
+            stop_event = asyncio.Event()
+            loop = asyncio.get_running_loop()
+            for sig in (signal.SIGINT, signal.SIGTERM):
+                # На Windows обработчики сигналов в цикле событий недоступны
+                with contextlib.suppress(NotImplementedError):
+                    loop.add_signal_handler(sig, stop_event.set)
+            
             try:
-                while True:
-                    await asyncio.sleep(3600)  # Просыпаемся каждый час
+                await stop_event.wait()
+                logger.info("👋 Получен сигнал остановки")
             except KeyboardInterrupt:
                 logger.info("👋 Бот остановлен пользователем")
             finally:
-                # Останавливаем сервер
+                for sig in (signal.SIGINT, signal.SIGTERM):
+                    with contextlib.suppress(NotImplementedError):
+                        loop.remove_signal_handler(sig)
+                # Останавливаем сервер, затем сервисы (пул БД дописывает очередь логов)
                 await runner.cleanup()
                 logger.info("📊 Webhook сервер остановлен")
+                started = False
+                await dp.emit_shutdown(bot=bot)
+                await bot.session.close()
                 
         except Exception as e:
-            logger.error(f"💥 Ошибка в webhook режиме: {e}")
+            logger.error("💥 Ошибка в webhook режиме: %s", e)
+            if started:
+                # Polling заново вызовет startup, поэтому сервисы сначала останавливаем
+                with contextlib.suppress(Exception):
+                    await dp.emit_shutdown(bot=bot)
             logger.info("🔄 Переходим на polling режим...")
             use_webhook = False
     
     if not use_webhook:
         logger.info("🔄 Используется POLLING режим (для локальной разработки)")
         try:
-            # Удаляем webhook перед поллингом
+            # Удаляем webhook перед поллингом; накопившиеся апдейты
+            # отбрасываются здесь же, отдельный пропуск при старте не нужен
             await bot.delete_webhook(drop_pending_updates=True)
             logger.info("🗑️ Webhook удален перед polling")
             
-            # Запуск бота в polling режиме
-            await dp.start_polling(bot, skip_updates=True)
+            # Запуск бота в polling режиме; aiogram сам ставит обработчики
+            # SIGINT/SIGTERM, останавливает polling и вызывает on_shutdown
+            await dp.start_polling(bot, handle_signals=True)
         except KeyboardInterrupt:
             logger.info("👋 Бот остановлен пользователем")
         except Exception as e:
-            logger.error(f"💥 Критическая ошибка при запуске бота: {e}")
+            logger.error("💥 Критическая ошибка при запуске бота: %s", e)
         finally:
             logger.info("🏁 Завершение работы бота...")
+    
+    # Клиент OpenAI закрываем в самом конце: после ошибки webhook-режима
+    # shutdown уже отработал, а polling ещё пользуется клиентом
+    await close_openai_client()
 
 
 if __name__ == "__main__":
+    # Цикл событий на libuv быстрее стандартного; если uvloop нет, работаем на asyncio
+    try:
+        import uvloop
+        uvloop.install()
+    except ImportError:
+        pass
+    
     # Запуск бота
     asyncio.run(main())
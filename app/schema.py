@@ -0,0 +1,47 @@
+"""
+Схема базы данных бота.
+
+schema.sql содержит только команды, которые можно выполнить внутри
+транзакции, и отправляется в базу целиком одним запросом, без разбора на
+отдельные команды. Индексы строятся CONCURRENTLY, чтобы не блокировать
+запись в таблицы при каждом запуске, а такие команды внутри транзакции
+запрещены, поэтому они перечислены здесь и выполняются по одной.
+"""
+
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# schema.sql лежит в корне проекта, рядом с пакетом app
+SCHEMA_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "schema.sql")
+
+
+def _read_schema() -> str:
+    """Читает schema.sql; без файла возвращает пустую строку."""
+    try:
+        with open(SCHEMA_PATH, "r", encoding="utf-8") as f:
+            return f.read()
+    except OSError as e:
+        logger.error("❌ Не удалось прочитать %s: %s", SCHEMA_PATH, e)
+        return ""
+
+
+# Текст схемы читается один раз при импорте
+SCHEMA_SQL = _read_schema()
+
+# Индексы, каждый выполняется отдельной командой вне транзакции
+SCHEMA_INDEXES = (
+    # Последние сообщения пользователя читаются по индексу, без сортировки
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_dialog_history_user_id_id "
+    "ON dialog_history (user_id, id DESC)",
+    # Индексы для статистики: подсчёт сообщений пользователя и группировка по командам
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_logs_username ON logs (username)",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_logs_command_notnull "
+    "ON logs (command) WHERE command IS NOT NULL",
+    # Уникальные индексы нужны для REFRESH MATERIALIZED VIEW CONCURRENTLY
+    "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS idx_logs_popular_commands_command "
+    "ON logs_popular_commands (command)",
+    "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS idx_logs_unique_users_id "
+    "ON logs_unique_users (id)",
+)
@@ -5,8 +5,6 @@ AI service for OpenAI interactions.
 
 import asyncio
 import logging
-import tempfile
-import os
 from typing import Dict, List, Optional, Any
 
 from ..ai import (
@@ -17,7 +15,7 @@ from ..ai import (
 from ..constants import DEFAULT_SYSTEM_PROMPT, MAX_TTS_LENGTH, TTS_VOICES
 from .database_service import database_service
 from .user_service import user_service
-from ..config import settings
+from ..utils.text import truncate_reply
 
 logger = logging.getLogger(__name__)
 
@@ -52,19 +50,18 @@ class AIService:
                 dialog_history.append({"role": "user", "content": user_message})
                 
                 # Генерируем ответ с историей
-                response = await openai_chat_with_history(prompt, dialog_history, user_model)
+                response, _ = await openai_chat_with_history(prompt, dialog_history, user_model)
             else:
                 # Генерируем простой ответ
                 response = await openai_chat(user_message, user_model)
             
             # Ограничиваем длину ответа
-            if len(response) > settings.MAX_TG_REPLY:
-                response = response[:settings.MAX_TG_REPLY] + "... (ответ усечён)"
+            response = truncate_reply(response)
             
             return response
             
         except Exception as e:
-            logger.error(f"Error generating text response: {e}")
+            logger.error("Error generating text response: %s", e)
             return "❌ Извините, сейчас проблемы с AI сервисом. Попробуйте позже."
     
     async def generate_image(self, prompt: str, size: str = "1024x1024") -> Optional[str]:
@@ -72,7 +69,7 @@ class AIService:
         try:
             return await openai_image(prompt, size)
         except Exception as e:
-            logger.error(f"Error generating image: {e}")
+            logger.error("Error generating image: %s", e)
             return None
     
     async def analyze_image(self, image_data: bytes) -> Optional[str]:
@@ -80,7 +77,7 @@ class AIService:
         try:
             return await openai_vision(image_data)
         except Exception as e:
-            logger.error(f"Error analyzing image: {e}")
+            logger.error("Error analyzing image: %s", e)
             return None
     
     async def generate_voice_response(self, user_id: int, text: str) -> Optional[bytes]:
@@ -96,7 +93,7 @@ class AIService:
             return await openai_tts(text, tts_voice)
             
         except Exception as e:
-            logger.error(f"Error generating voice response: {e}")
+            logger.error("Error generating voice response: %s", e)
             return None
     
     async def transcribe_voice(self, audio_data: bytes) -> Optional[str]:
@@ -104,7 +101,7 @@ class AIService:
         try:
             return await openai_stt(audio_data)
         except Exception as e:
-            logger.error(f"Error transcribing voice: {e}")
+            logger.error("Error transcribing voice: %s", e)
             return None
     
     async def process_voice_message(
@@ -142,7 +139,7 @@ class AIService:
             return result
             
         except Exception as e:
-            logger.error(f"Error processing voice message: {e}")
+            logger.error("Error processing voice message: %s", e)
             return {
                 "success": False,
                 "error": "Ошибка при обработке голосового сообщения"
@@ -156,16 +153,11 @@ class AIService:
     ) -> bool:
         """Сохраняет взаимодействие в историю диалога."""
         try:
-            # Сохраняем сообщение пользователя
-            await database_service.save_dialog_message(user_id, "user", user_message)
-            
-            # Сохраняем ответ ассистента
-            await database_service.save_dialog_message(user_id, "assistant", ai_response)
-            
-            return True
+            # Реплика пользователя и ответ сохраняются одним запросом
+            return await database_service.save_dialog_pair(user_id, user_message, ai_response)
             
         except Exception as e:
-            logger.error(f"Error saving dialog interaction: {e}")
+            logger.error("Error saving dialog interaction: %s", e)
             return False
     
     async def generate_personal_response(
@@ -179,34 +171,20 @@ class AIService:
             user_model = await user_service.get_user_model(user_id)
             
             # Используем персональный контекст
-            response = await openai_chat_with_personal_context(
+            response, _ = await openai_chat_with_personal_context(
                 user_id, 
                 user_message, 
                 user_model
             )
             
             # Ограничиваем длину ответа
-            if len(response) > settings.MAX_TG_REPLY:
-                response = response[:settings.MAX_TG_REPLY] + "... (ответ усечён)"
+            response = truncate_reply(response)
             
             return response
             
         except Exception as e:
-            logger.error(f"Error generating personal response: {e}")
+            logger.error("Error generating personal response: %s", e)
             return "❌ Извините, сейчас проблемы с персональным ассистентом. Попробуйте позже."
-    
-    def create_temp_audio_file(self, audio_data: bytes) -> str:
-        """Создает временный аудио файл."""
-        with tempfile.NamedTemporaryFile(suffix=".mp3", delete=False) as temp_file:
-            temp_file.write(audio_data)
-            return temp_file.name
-    
-    def cleanup_temp_file(self, file_path: str) -> None:
-        """Удаляет временный файл."""
-        try:
-            os.unlink(file_path)
-        except Exception as e:
-            logger.error(f"Error cleaning up temp file: {e}")
 
 
 # Глобальный экземпляр сервиса
@@ -11,9 +11,58 @@ from datetime import datetime
 import asyncpg
 
 from ..config import settings
+from ..constants import (
+    USER_SETTINGS_CACHE_TTL, LOG_BATCH_SIZE, LOG_FLUSH_INTERVAL, LOG_QUEUE_MAXSIZE
+)
+from ..utils.cache import TTLCache
 
 logger = logging.getLogger(__name__)
 
+# Частые вставки: один текст запроса на процесс, чтобы asyncpg переиспользовал
+# подготовленное выражение на каждом соединении пула
+SQL_INSERT_LOG = "INSERT INTO logs (username, command, args, answer) VALUES ($1, $2, $3, $4)"
+LOG_COLUMNS = ["username", "command", "args", "answer"]
+SQL_INSERT_DIALOG_MESSAGE = "INSERT INTO dialog_history (user_id, role, content) VALUES ($1, $2, $3)"
+SQL_INSERT_DIALOG_PAIR = (
+    "INSERT INTO dialog_history (user_id, role, content) "
+    "VALUES ($1, 'user', $2), ($1, 'assistant', $3)"
+)
+# Последние $2 сообщений берутся по индексу (user_id, id DESC) и сразу
+# возвращаются в хронологическом порядке
+SQL_DIALOG_HISTORY = """
+SELECT role, content FROM (
+    SELECT id, role, content FROM dialog_history
+    WHERE user_id = $1 ORDER BY id DESC LIMIT $2
+) AS recent ORDER BY id
+"""
+SQL_CLEAR_DIALOG_HISTORY = "DELETE FROM dialog_history WHERE user_id = $1"
+
+SQL_USER_SETTINGS = """
+SELECT preferred_model, tts_enabled, tts_voice, personal_assistant_enabled, language
+FROM user_settings WHERE user_id = $1
+"""
+
+# Изменение одного поля настроек пользователя одним UPSERT-запросом
+# (без предварительного SELECT и без гонки между проверкой и вставкой)
+SQL_UPSERT_USER_SETTING = {
+    field: f"""
+    INSERT INTO user_settings (user_id, {field}) VALUES ($1, $2)
+    ON CONFLICT (user_id) DO UPDATE SET {field} = EXCLUDED.{field}, updated_at = now()
+    """
+    for field in ("preferred_model", "tts_enabled", "tts_voice", "personal_assistant_enabled", "language")
+}
+
+# Переключение булевого поля настроек; новая запись получает TRUE,
+# так как по умолчанию в схеме эти поля выключены
+SQL_TOGGLE_USER_SETTING = {
+    field: f"""
+    INSERT INTO user_settings (user_id, {field}) VALUES ($1, TRUE)
+    ON CONFLICT (user_id) DO UPDATE SET {field} = NOT user_settings.{field}, updated_at = now()
+    RETURNING {field}
+    """
+    for field in ("tts_enabled", "personal_assistant_enabled")
+}
+
 
 class DatabaseService:
     """Сервис для работы с базой данных PostgreSQL."""
@@ -21,24 +70,52 @@ class DatabaseService:
     def __init__(self):
         """Инициализация сервиса базы данных."""
         self.pool: Optional[asyncpg.Pool] = None
+        # Настройки читаются почти в каждом обработчике, а меняются редко;
+        # пустой dict означает, что строки в user_settings нет
+        self._settings_cache = TTLCache(ttl=USER_SETTINGS_CACHE_TTL, maxsize=10000)
+        # Очередь логов команд и фоновая задача, которая пишет их пакетами
+        self._log_queue: Optional[asyncio.Queue] = None
+        self._log_writer: Optional[asyncio.Task] = None
     
     async def initialize_pool(self) -> bool:
         """Инициализация пула подключений к базе данных."""
         try:
             self.pool = await asyncpg.create_pool(
                 settings.DATABASE_URL,
-                min_size=2,
-                max_size=10,
-                command_timeout=30
+                min_size=settings.DB_POOL_MIN_SIZE,
+                max_size=max(settings.DB_POOL_MIN_SIZE, settings.DB_POOL_MAX_SIZE),
+                command_timeout=30,
+                # Простаивающие соединения держим дольше, чтобы не переподключаться после пауз
+                max_inactive_connection_lifetime=600,
+                # Кеш подготовленных выражений на каждом соединении;
+                # планы не вытесняются по времени, только по размеру кеша
+                statement_cache_size=256,
+                max_cached_statement_lifetime=0
             )
             logger.info("✅ Database pool initialized successfully")
+            self._log_queue = asyncio.Queue(maxsize=LOG_QUEUE_MAXSIZE)
+            self._log_writer = asyncio.create_task(self._log_writer_loop())
             return True
         except Exception as e:
-            logger.error(f"❌ Failed to initialize database pool: {e}")
+            logger.error("❌ Failed to initialize database pool: %s", e)
             return False
     
     async def close_pool(self) -> None:
         """Закрытие пула подключений."""
+        if self._log_writer:
+            # Задача дописывает текущий пакет при отмене, остаток очереди пишем здесь
+            self._log_writer.cancel()
+            try:
+                await self._log_writer
+            except asyncio.CancelledError:
+                pass
+            self._log_writer = None
+            pending = []
+            while not self._log_queue.empty():
+                pending.append(self._log_queue.get_nowait())
+            if pending:
+                await self._flush_logs(pending)
+            self._log_queue = None
         if self.pool:
             await self.pool.close()
             logger.info("📊 Database pool closed")
@@ -58,7 +135,7 @@ class DatabaseService:
                 await conn.execute(query, *args)
                 return True
         except Exception as e:
-            logger.error(f"Database execute error: {e}")
+            logger.error("Database execute error: %s", e)
             return False
     
     async def fetch_one(self, query: str, *args) -> Optional[asyncpg.Record]:
@@ -70,7 +147,7 @@ class DatabaseService:
             async with self.pool.acquire() as conn:
                 return await conn.fetchrow(query, *args)
         except Exception as e:
-            logger.error(f"Database fetch_one error: {e}")
+            logger.error("Database fetch_one error: %s", e)
             return None
     
     async def fetch_many(self, query: str, *args) -> List[asyncpg.Record]:
@@ -82,24 +159,32 @@ class DatabaseService:
             async with self.pool.acquire() as conn:
                 return await conn.fetch(query, *args)
         except Exception as e:
-            logger.error(f"Database fetch_many error: {e}")
+            logger.error("Database fetch_many error: %s", e)
             return []
     
     # === User Management ===
     
     async def get_user_settings(self, user_id: int) -> Optional[Dict[str, Any]]:
-        """Получает настройки пользователя."""
-        row = await self.fetch_one(
-            "SELECT preferred_model, tts_voice, language FROM user_settings WHERE user_id = $1",
-            user_id
-        )
-        if row:
-            return {
-                "preferred_model": row["preferred_model"],
-                "tts_voice": row["tts_voice"],
-                "language": row["language"]
-            }
-        return None
+        """Получает настройки пользователя (с кешем в памяти процесса)."""
+        cached = self._settings_cache.get(user_id)
+        if cached is None:
+            if not self.is_available():
+                return None
+            try:
+                async with self.pool.acquire() as conn:
+                    row = await conn.fetchrow(SQL_USER_SETTINGS, user_id)
+            except Exception as e:
+                # Ошибку не кешируем, чтобы следующий вызов повторил запрос
+                logger.error("Failed to load user settings for %s: %s", user_id, e)
+                return None
+            cached = dict(row) if row else {}
+            self._settings_cache.set(user_id, cached)
+        # Копия, чтобы вызывающий код мог менять словарь, не портя кеш
+        return dict(cached) if cached else None
+    
+    def forget_user_settings(self, user_id: int) -> None:
+        """Сбрасывает закешированные настройки пользователя."""
+        self._settings_cache.pop(user_id)
     
     async def save_user_settings(self, user_id: int, settings_data: Dict[str, Any]) -> bool:
         """Сохраняет настройки пользователя."""
@@ -112,46 +197,113 @@ class DatabaseService:
             language = EXCLUDED.language,
             updated_at = NOW()
         """
-        return await self.execute_query(
+        success = await self.execute_query(
             query,
             user_id,
             settings_data.get("preferred_model"),
             settings_data.get("tts_voice"),
             settings_data.get("language")
         )
+        self.forget_user_settings(user_id)
+        return success
+    
+    async def update_user_setting(self, user_id: int, field: str, value: Any) -> bool:
+        """Сохраняет одно поле настроек пользователя."""
+        success = await self.execute_query(SQL_UPSERT_USER_SETTING[field], user_id, value)
+        self.forget_user_settings(user_id)
+        return success
+    
+    async def toggle_user_setting(self, user_id: int, field: str) -> Optional[bool]:
+        """Переключает булево поле настроек и возвращает новое значение (None при ошибке)."""
+        row = await self.fetch_one(SQL_TOGGLE_USER_SETTING[field], user_id)
+        self.forget_user_settings(user_id)
+        return row[field] if row else None
     
     # === Dialog History ===
     
     async def get_dialog_history(self, user_id: int, limit: int = 10) -> List[Dict[str, str]]:
         """Получает историю диалога пользователя."""
-        rows = await self.fetch_many(
-            "SELECT role, content FROM dialog_history WHERE user_id = $1 ORDER BY id DESC LIMIT $2",
-            user_id, limit
-        )
-        return [{"role": row["role"], "content": row["content"]} for row in reversed(rows)]
+        rows = await self.fetch_many(SQL_DIALOG_HISTORY, user_id, limit)
+        return [{"role": row["role"], "content": row["content"]} for row in rows]
     
     async def save_dialog_message(self, user_id: int, role: str, content: str) -> bool:
         """Сохраняет сообщение в истории диалога."""
         return await self.execute_query(
-            "INSERT INTO dialog_history (user_id, role, content) VALUES ($1, $2, $3)",
+            SQL_INSERT_DIALOG_MESSAGE,
             user_id, role, content
         )
     
-    async def clear_dialog_history(self, user_id: int) -> bool:
-        """Очищает историю диалога пользователя."""
+    async def save_dialog_pair(self, user_id: int, user_content: str, assistant_content: str) -> bool:
+        """Сохраняет реплику пользователя и ответ ассистента одной вставкой."""
         return await self.execute_query(
-            "DELETE FROM dialog_history WHERE user_id = $1",
-            user_id
+            SQL_INSERT_DIALOG_PAIR,
+            user_id, user_content, assistant_content
         )
     
+    async def clear_dialog_history(self, user_id: int) -> bool:
+        """Очищает историю диалога пользователя."""
+        return await self.execute_query(SQL_CLEAR_DIALOG_HISTORY, user_id)
+    
     # === Logging ===
     
     async def log_command(self, username: str, command: str, args: str, answer: str) -> bool:
-        """Записывает лог команды."""
-        return await self.execute_query(
-            "INSERT INTO logs (username, command, args, answer) VALUES ($1, $2, $3, $4)",
-            username, command, args, answer
-        )
+        """
+        Записывает лог команды.
+
+        Запись ставится в очередь и попадает в таблицу пакетом из фоновой
+        задачи; без очереди (пул не создан) пишется сразу.
+        """
+        if self._log_queue is None:
+            return await self.execute_query(
+                SQL_INSERT_LOG,
+                username, command, args, answer
+            )
+        try:
+            self._log_queue.put_nowait((username, command, args, answer))
+            return True
+        except asyncio.QueueFull:
+            logger.warning("Log queue is full, dropping log record")
+            return False
+    
+    async def _log_writer_loop(self) -> None:
+        """Забирает логи из очереди и пишет их пакетами через COPY."""
+        while True:
+            batch = [await self._log_queue.get()]
+            try:
+                # Даём накопиться пакету
+                await asyncio.sleep(LOG_FLUSH_INTERVAL)
+            finally:
+                # Забираем всё, что успело прийти, и пишем даже при остановке
+                while len(batch) < LOG_BATCH_SIZE and not self._log_queue.empty():
+                    batch.append(self._log_queue.get_nowait())
+                await self._flush_logs(batch)
+    
+    async def _flush_logs(self, batch: List[Tuple[str, str, str, str]]) -> None:
+        """Записывает пакет логов одной командой COPY."""
+        try:
+            async with self.pool.acquire() as conn:
+                await conn.copy_records_to_table("logs", records=batch, columns=LOG_COLUMNS)
+        except Exception as e:
+            logger.error("Database log batch error (%s records): %s", len(batch), e)
+    
+    async def log_exchange(
+        self,
+        username: str,
+        command: str,
+        args: str,
+        answer: str,
+        user_id: int,
+        user_content: str,
+        assistant_content: str
+    ) -> bool:
+        """
+        Записывает лог команды и пару сообщений диалога.
+
+        Строка лога уходит в очередь пакетной записи (как у log_command),
+        в базу сразу пишется только пара сообщений диалога одной вставкой.
+        """
+        await self.log_command(username, command, args, answer)
+        return await self.save_dialog_pair(user_id, user_content, assistant_content)
     
     # === Admin Functions ===
     
@@ -194,7 +346,7 @@ class DatabaseService:
             
             return stats
         except Exception as e:
-            logger.error(f"Error getting stats: {e}")
+            logger.error("Error getting stats: %s", e)
             return None
     
     async def get_recent_errors(self, limit: int = 10) -> List[Dict[str, Any]]:
@@ -5,17 +5,28 @@ Search service using Tavily API.
 
 import asyncio
 import logging
-from typing import Dict, List, Optional
+import re
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence
 
 from ..config import settings
 from ..constants import (
     MAX_SEARCH_RESULTS, MAX_NEWS_RESULTS, MAX_CONTENT_PREVIEW_LENGTH,
-    NEWS_DOMAINS, ERROR_MESSAGES, HEADERS
+    NEWS_DOMAINS, ERROR_MESSAGES, HEADERS, SEARCH_KEYWORDS
 )
 
 logger = logging.getLogger(__name__)
 
 
+@lru_cache(maxsize=8)
+def _compile_keywords(keywords: Sequence[str]) -> "re.Pattern[str]":
+    """Собирает ключевые слова в одно регулярное выражение (поиск подстроки за один проход)."""
+    return re.compile("|".join(map(re.escape, keywords)), re.IGNORECASE)
+
+
+_SEARCH_RE = _compile_keywords(tuple(SEARCH_KEYWORDS))
+
+
 class SearchService:
     """Сервис для работы с Tavily API поиском."""
     
@@ -57,7 +68,7 @@ class SearchService:
             results = await asyncio.to_thread(self.client.search, **search_params)
             return self._format_search_results(results)
         except Exception as e:
-            logger.error(f"Search error: {e}")
+            logger.error("Search error: %s", e)
             return ERROR_MESSAGES["search_error"]
     
     async def search_news(self, query: str, max_results: int = MAX_NEWS_RESULTS) -> str:
@@ -88,7 +99,7 @@ class SearchService:
             
             return formatted_results
         except Exception as e:
-            logger.error(f"News search error: {e}")
+            logger.error("News search error: %s", e)
             return ERROR_MESSAGES["news_error"]
     
     def _format_search_results(self, results: Dict) -> str:
@@ -123,13 +134,12 @@ class SearchService:
         
         return formatted_text
     
-    def detect_search_intent(self, text: str, search_keywords: List[str]) -> bool:
+    def detect_search_intent(self, text: str, search_keywords: Optional[List[str]] = None) -> bool:
         """Определяет намерение поиска в тексте."""
-        text_lower = text.lower()
-        return (
-            any(keyword in text_lower for keyword in search_keywords) 
-            and len(text) > 20
-        )
+        if len(text) <= 20:
+            return False
+        pattern = _SEARCH_RE if search_keywords is None else _compile_keywords(tuple(search_keywords))
+        return pattern.search(text) is not None
 
 
 # Глобальный экземпляр сервиса
@@ -36,10 +36,7 @@ class UserService:
         if language not in ["ru", "en"]:
             return False
         
-        current_settings = await database_service.get_user_settings(user_id) or {}
-        current_settings.update({"language": language})
-        
-        return await database_service.save_user_settings(user_id, current_settings)
+        return await database_service.update_user_setting(user_id, "language", language)
     
     async def get_user_model(self, user_id: int) -> str:
         """Получает предпочитаемую модель пользователя."""
@@ -58,10 +55,7 @@ class UserService:
         if model not in valid_models:
             return False
         
-        current_settings = await database_service.get_user_settings(user_id) or {}
-        current_settings.update({"preferred_model": model})
-        
-        return await database_service.save_user_settings(user_id, current_settings)
+        return await database_service.update_user_setting(user_id, "preferred_model", model)
     
     async def get_user_tts_voice(self, user_id: int) -> str:
         """Получает голос TTS пользователя."""
@@ -75,10 +69,7 @@ class UserService:
         if voice not in TTS_VOICES:
             return False
         
-        current_settings = await database_service.get_user_settings(user_id) or {}
-        current_settings.update({"tts_voice": voice})
-        
-        return await database_service.save_user_settings(user_id, current_settings)
+        return await database_service.update_user_setting(user_id, "tts_voice", voice)
     
     async def get_user_profile(self, user_id: int) -> Dict[str, Any]:
         """Получает полный профиль пользователя."""
@@ -144,7 +135,7 @@ class UserService:
             return stats
             
         except Exception as e:
-            logger.error(f"Error getting user statistics: {e}")
+            logger.error("Error getting user statistics: %s", e)
             return {"total_commands": 0, "commands_breakdown": {}}
 
 
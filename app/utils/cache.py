@@ -0,0 +1,68 @@
+"""
+Простые in-memory кеши для Telegram бота.
+Используются для данных, которые меняются редко, но запрашиваются часто.
+"""
+
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+
+class TTLCache:
+    """
+    Кеш с временем жизни записей и необязательным ограничением размера.
+
+    При превышении maxsize вытесняется запись, к которой дольше всего
+    не обращались (LRU).
+    """
+
+    def __init__(self, ttl: float, maxsize: Optional[int] = None):
+        """
+        Args:
+            ttl: Время жизни записи в секундах
+            maxsize: Максимальное количество записей (None - без ограничения)
+        """
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Возвращает значение по ключу или default, если записи нет или она устарела."""
+        entry = self._data.get(key)
+        if entry is None:
+            return default
+
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return default
+
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """Сохраняет значение по ключу."""
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+
+        if self.maxsize is not None:
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """Удаляет запись и возвращает её значение (без учёта срока жизни)."""
+        entry = self._data.pop(key, None)
+        return default if entry is None else entry[1]
+
+    def clear(self) -> None:
+        """Очищает кеш."""
+        self._data.clear()
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+_MISSING = object()
@@ -4,13 +4,36 @@
 """
 
 import logging
+import os
 from typing import Optional, List
 # Note: These imports may show errors in IDE but work at runtime
 from aiogram import types
-from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+from aiogram.types import FSInputFile, InlineKeyboardMarkup, InlineKeyboardButton
 
 logger = logging.getLogger(__name__)
 
+# Изображение приветствия: наличие файла проверяется один раз при загрузке,
+# а после первой отправки Telegram отдаёт file_id, по которому картинка
+# уходит повторно без загрузки файла
+WELCOME_IMAGE_PATH = "assets/images/welcome_screen.png"
+WELCOME_IMAGE_AVAILABLE = os.path.isfile(WELCOME_IMAGE_PATH)
+_welcome_photo_id: Optional[str] = None
+
+
+async def answer_welcome_photo(message: types.Message, reply_markup: InlineKeyboardMarkup) -> None:
+    """Отправляет изображение приветствия в чат сообщения."""
+    global _welcome_photo_id
+
+    if _welcome_photo_id is None and not WELCOME_IMAGE_AVAILABLE:
+        raise FileNotFoundError("Изображение приветствия не найдено")
+
+    sent = await message.answer_photo(
+        _welcome_photo_id or FSInputFile(WELCOME_IMAGE_PATH),
+        reply_markup=reply_markup
+    )
+    if _welcome_photo_id is None and sent.photo:
+        _welcome_photo_id = sent.photo[-1].file_id
+
 
 async def safe_edit_message(
     callback_query: types.CallbackQuery,
@@ -36,11 +59,11 @@ async def safe_edit_message(
             reply_markup=reply_markup,
             parse_mode=parse_mode
         )
-        logger.debug(f"✅ Message edited successfully for user {callback_query.from_user.id}")
+        logger.debug("✅ Message edited successfully for user %s", callback_query.from_user.id)
         return True
         
     except Exception as e:
-        logger.warning(f"⚠️ Edit failed, using fallback: {e}")
+        logger.warning("⚠️ Edit failed, using fallback: %s", e)
         
         # Fallback к новому сообщению
         try:
@@ -49,16 +72,16 @@ async def safe_edit_message(
                 reply_markup=reply_markup,
                 parse_mode=parse_mode
             )
-            logger.debug(f"✅ Fallback message sent for user {callback_query.from_user.id}")
+            logger.debug("✅ Fallback message sent for user %s", callback_query.from_user.id)
             # Пытаемся удалить предыдущее сообщение, чтобы меню было "исчезающим"
             try:
                 await callback_query.message.delete()
             except Exception as del_err:
-                logger.debug(f"(ignore) failed to delete previous message: {del_err}")
+                logger.debug("(ignore) failed to delete previous message: %s", del_err)
             return False
             
         except Exception as fallback_error:
-            logger.error(f"❌ Both edit and fallback failed: {fallback_error}")
+            logger.error("❌ Both edit and fallback failed: %s", fallback_error)
             await callback_query.answer("❌ Произошла ошибка. Попробуйте /start", show_alert=True)
             return False
 
@@ -206,45 +229,40 @@ class MessageFlow:
     
     async def show_language_menu(self, callback_query: types.CallbackQuery, user_lang: str = "ru"):
         """Показать меню выбора языка."""
-        from ..main import get_text
+        from ..main import get_texts, get_language_menu_text
         
-        menu_text = f"<b>{get_text('language_interface', user_lang)}</b>\n\n{get_text('select_language', user_lang)}"
+        russian, english, back = get_texts(user_lang, "russian", "english", "back")
         
         language_buttons = [
             [
-                InlineKeyboardButton(text=get_text("russian", user_lang), callback_data="set_lang_ru"),
-                InlineKeyboardButton(text=get_text("english", user_lang), callback_data="set_lang_en")
+                InlineKeyboardButton(text=russian, callback_data="set_lang_ru"),
+                InlineKeyboardButton(text=english, callback_data="set_lang_en")
             ]
         ]
         
         return await safe_edit_with_navigation(
             callback_query=callback_query,
-            content_text=menu_text,
+            content_text=get_language_menu_text(user_lang),
             additional_buttons=language_buttons,
             back_callback="back_to_main",
-            back_text=get_text("back", user_lang)
+            back_text=back
         )
 
     async def show_welcome_screen(self, callback_query: types.CallbackQuery, user_lang: str = "ru"):
         """Показать современный экран приветствия с изображением и кнопками."""
-        try:
-            # Пытаемся отправить изображение приветствия
-            await self.send_welcome_image(callback_query, user_lang)
-        except Exception as e:
-            logger.error(f"Ошибка при отправке изображения приветствия: {e}")
-            # Fallback на текстовое приветствие
-            await self.show_welcome_text(callback_query, user_lang)
+        if WELCOME_IMAGE_AVAILABLE:
+            try:
+                # Пытаемся отправить изображение приветствия
+                await self.send_welcome_image(callback_query, user_lang)
+                return
+            except Exception as e:
+                logger.error("Ошибка при отправке изображения приветствия: %s", e)
+        
+        # Fallback на текстовое приветствие
+        await self.show_welcome_text(callback_query, user_lang)
     
     async def send_welcome_image(self, callback_query: types.CallbackQuery, user_lang: str = "ru"):
         """Отправить изображение приветствия."""
-        import os
-        
-        # Путь к изображению приветствия
-        image_path = "assets/images/welcome_screen.png"
-        
-        if not os.path.exists(image_path):
-            raise FileNotFoundError("Изображение приветствия не найдено")
-        
         # Формируем кнопки
         if user_lang == "en":
             start_button = "🚀 Start"
@@ -262,11 +280,7 @@ class MessageFlow:
         reply_markup = InlineKeyboardMarkup(inline_keyboard=keyboard)
         
         # Отправляем изображение
-        with open(image_path, "rb") as photo:
-            await callback_query.message.answer_photo(
-                photo,
-                reply_markup=reply_markup
-            )
+        await answer_welcome_photo(callback_query.message, reply_markup)
         
         # Удаляем предыдущее сообщение
         try:
@@ -326,4 +340,4 @@ class MessageFlow:
 
 
 # Глобальный экземпляр для использования в handlers
-message_flow = MessageFlow()v
+message_flow = MessageFlow()
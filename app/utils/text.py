@@ -0,0 +1,40 @@
+"""
+Утилиты для подготовки текста ответов к отправке в Telegram.
+"""
+
+from typing import Optional
+
+from ..config import settings
+
+# Хвост, который добавляется к усечённому ответу, и его длина в единицах UTF-16
+TRUNCATED_SUFFIX = "... (ответ усечён)"
+TRUNCATED_SUFFIX_UNITS = len(TRUNCATED_SUFFIX.encode("utf-16-le")) // 2
+
+
+def truncate_reply(text: str, limit: Optional[int] = None) -> str:
+    """
+    Усекает ответ до limit кодовых единиц UTF-16 (по умолчанию MAX_TG_REPLY),
+    включая хвост TRUNCATED_SUFFIX.
+
+    Символы вне BMP (например, эмодзи) занимают в Telegram две единицы,
+    поэтому обрезка по len() может превысить лимит. Короткий ответ
+    возвращается как есть, без копирования.
+    """
+    if limit is None:
+        limit = settings.MAX_TG_REPLY
+
+    # Каждый символ занимает не больше двух единиц UTF-16
+    if len(text) * 2 <= limit:
+        return text
+
+    encoded = text.encode("utf-16-le")
+    if len(encoded) // 2 <= limit:
+        return text
+
+    # Место под хвост резервируем внутри лимита; errors="ignore" отбрасывает
+    # половину суррогатной пары на границе среза
+    if limit < TRUNCATED_SUFFIX_UNITS:
+        # Хвост не помещается - просто обрезаем
+        return encoded[: limit * 2].decode("utf-16-le", errors="ignore")
+    cut = (limit - TRUNCATED_SUFFIX_UNITS) * 2
+    return encoded[:cut].decode("utf-16-le", errors="ignore") + TRUNCATED_SUFFIX
@@ -8,6 +8,7 @@
 import logging
 import os
 import hashlib
+import re
 from typing import List, Dict, Optional, Tuple
 import asyncio
 from concurrent.futures import ThreadPoolExecutor
@@ -22,6 +23,17 @@ from .ai import client as openai_client
 
 logger = logging.getLogger(__name__)
 
+# Признаки высказанного предпочтения; ищутся одним регулярным выражением
+# без учёта регистра, без копии сообщения в нижнем регистре
+PREFERENCE_INDICATORS_RE = re.compile(
+    "|".join(map(re.escape, [
+        "мне нравится", "я люблю", "предпочитаю", "не люблю",
+        "ненавижу", "мой стиль", "я всегда", "я никогда",
+        "i like", "i love", "i prefer", "i hate", "i always", "i never"
+    ])),
+    re.IGNORECASE
+)
+
 
 class PersonalAssistant:
     """Класс для управления персональным ассистентом с векторной памятью."""
@@ -60,7 +72,7 @@ class PersonalAssistant:
             logger.info("✅ Векторная база данных инициализирована")
             
         except Exception as e:
-            logger.error(f"❌ Ошибка инициализации векторной БД: {e}")
+            logger.error("❌ Ошибка инициализации векторной БД: %s", e)
             self.chroma_client = None
             self.collection = None
     
@@ -83,7 +95,7 @@ class PersonalAssistant:
             return response.data[0].embedding
             
         except Exception as e:
-            logger.error(f"❌ Ошибка создания эмбеддинга: {e}")
+            logger.error("❌ Ошибка создания эмбеддинга: %s", e)
             return None
     
     async def add_user_memory(self, user_id: int, content: str, memory_type: str = "dialogue", metadata: Dict = None):
@@ -127,10 +139,10 @@ class PersonalAssistant:
                 )
             )
             
-            logger.info(f"✅ Добавлена память для пользователя {user_id}: {memory_type}")
+            logger.info("✅ Добавлена память для пользователя %s: %s", user_id, memory_type)
             
         except Exception as e:
-            logger.error(f"❌ Ошибка добавления памяти: {e}")
+            logger.error("❌ Ошибка добавления памяти: %s", e)
     
     async def search_user_memory(self, user_id: int, query: str, limit: int = 5) -> List[Dict]:
         """
@@ -171,11 +183,11 @@ class PersonalAssistant:
                     }
                     memories.append(memory)
             
-            logger.info(f"🔍 Найдено {len(memories)} воспоминаний для пользователя {user_id}")
+            logger.info("🔍 Найдено %s воспоминаний для пользователя %s", len(memories), user_id)
             return memories
             
         except Exception as e:
-            logger.error(f"❌ Ошибка поиска памяти: {e}")
+            logger.error("❌ Ошибка поиска памяти: %s", e)
             return []
     
     async def get_user_context(self, user_id: int, current_message: str) -> str:
@@ -213,7 +225,7 @@ class PersonalAssistant:
             return ""
             
         except Exception as e:
-            logger.error(f"❌ Ошибка получения контекста: {e}")
+            logger.error("❌ Ошибка получения контекста: %s", e)
             return ""
     
     async def add_user_preference(self, user_id: int, preference: str):
@@ -265,26 +277,25 @@ class PersonalAssistant:
         """
         try:
             # Используем простую эвристику для извлечения предпочтений
-            preference_indicators = [
-                "мне нравится", "я люблю", "предпочитаю", "не люблю", 
-                "ненавижу", "мой стиль", "я всегда", "я никогда",
-                "i like", "i love", "i prefer", "i hate", "i always", "i never"
-            ]
-            
             preferences = []
-            message_lower = message.lower()
-            
-            for indicator in preference_indicators:
-                if indicator in message_lower:
-                    # Простое извлечение предпочтения
-                    start_idx = message_lower.find(indicator)
-                    preference_text = message[start_idx:start_idx + 100]  # Берем до 100 символов
-                    preferences.append(f"Предпочтение: {preference_text.strip()}")
+            seen = set()
+            
+            for match in PREFERENCE_INDICATORS_RE.finditer(message):
+                # Каждый признак учитываем по первому вхождению
+                indicator = match.group().casefold()
+                if indicator in seen:
+                    continue
+                seen.add(indicator)
+                
+                # Простое извлечение предпочтения: позиция совпадения уже известна
+                start_idx = match.start()
+                preference_text = message[start_idx:start_idx + 100]  # Берем до 100 символов
+                preferences.append(f"Предпочтение: {preference_text.strip()}")
             
             return preferences
             
         except Exception as e:
-            logger.error(f"❌ Ошибка извлечения предпочтений: {e}")
+            logger.error("❌ Ошибка извлечения предпочтений: %s", e)
             return []
     
     async def get_user_stats(self, user_id: int) -> Dict:
@@ -318,7 +329,7 @@ class PersonalAssistant:
             return stats
             
         except Exception as e:
-            logger.error(f"❌ Ошибка получения статистики: {e}")
+            logger.error("❌ Ошибка получения статистики: %s", e)
             return {"total_memories": 0, "by_type": {}}
     
     async def clear_user_memory(self, user_id: int, memory_type: Optional[str] = None):
@@ -349,10 +360,10 @@ class PersonalAssistant:
                     lambda: self.collection.delete(ids=results['ids'])
                 )
                 
-                logger.info(f"🗑️ Очищена память пользователя {user_id}: {len(results['ids'])} записей")
+                logger.info("🗑️ Очищена память пользователя %s: %s записей", user_id, len(results['ids']))
             
         except Exception as e:
-            logger.error(f"❌ Ошибка очистки памяти: {e}")
+            logger.error("❌ Ошибка очистки памяти: %s", e)
 
 
 # Глобальный экземпляр персонального ассистента
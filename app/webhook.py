@@ -6,6 +6,7 @@
 import logging
 import os
 from aiohttp import web
+from aiogram import types
 
 logger = logging.getLogger(__name__)
 
@@ -37,10 +38,10 @@ class WebhookManager:
                 secret_token=webhook_secret,
                 allowed_updates=["message", "callback_query", "inline_query"]
             )
-            logger.info(f"✅ Webhook установлен: {webhook_url}")
+            logger.info("✅ Webhook установлен: %s", webhook_url)
             return True
         except Exception as e:
-            logger.error(f"❌ Ошибка установки webhook: {e}")
+            logger.error("❌ Ошибка установки webhook: %s", e)
             return False
     
     async def remove_webhook(self) -> None:
@@ -49,7 +50,7 @@ class WebhookManager:
             await self.bot.delete_webhook(drop_pending_updates=True)
             logger.info("Webhook удален")
         except Exception as e:
-            logger.error(f"Ошибка удаления webhook: {e}")
+            logger.error("Ошибка удаления webhook: %s", e)
     
     def create_webhook_app(self) -> web.Application:
         """
@@ -67,7 +68,7 @@ class WebhookManager:
         async def handle_webhook(request):
             """Обработчик webhook запросов."""
             try:
-                logger.info(f"🌐 Получен webhook {request.method} запрос на {request.path}")
+                logger.info("🌐 Получен webhook %s запрос на %s", request.method, request.path)
                 
                 # Проверяем method
                 if request.method != 'POST':
@@ -75,7 +76,7 @@ class WebhookManager:
                 
                 # Получаем данные
                 try:
-                    data = await request.json()
+                    data = await request.json(loads=self.bot.session.json_loads)
                 except Exception:
                     return web.Response(status=400)
                 
@@ -83,10 +84,9 @@ class WebhookManager:
                 if not isinstance(data, dict) or 'update_id' not in data:
                     return web.Response(status=400)
                 
-                logger.info(f"📄 Update ID: {data.get('update_id')}")
+                logger.info("📄 Update ID: %s", data.get('update_id'))
                 
                 # Обрабатываем через aiogram
-                from aiogram import types
                 update = types.Update(**data)
                 await self.dp.feed_update(self.bot, update)
                 
@@ -94,7 +94,7 @@ class WebhookManager:
                 return web.Response(status=200)
                 
             except Exception as e:
-                logger.error(f"❌ Ошибка webhook: {e}")
+                logger.error("❌ Ошибка webhook: %s", e)
                 return web.Response(status=500)
         
         # Health check для мониторинга
@@ -130,7 +130,7 @@ class WebhookManager:
         site = web.TCPSite(runner, host, port)
         await site.start()
         
-        logger.info(f"🌐 Webhook сервер запущен на {host}:{port}")
+        logger.info("🌐 Webhook сервер запущен на %s:%s", host, port)
         
         # Настраиваем webhook
         webhook_set = await self.setup_webhook()
@@ -143,10 +143,10 @@ class WebhookManager:
         """Получаем информацию о webhook от Telegram."""
         try:
             webhook_info = await self.bot.get_webhook_info()
-            logger.info(f"📊 Webhook статус: {webhook_info}")
+            logger.info("📊 Webhook статус: %s", webhook_info)
             return webhook_info
         except Exception as e:
-            logger.error(f"❌ Ошибка получения webhook инфо: {e}")
+            logger.error("❌ Ошибка получения webhook инфо: %s", e)
             return None
     
     @staticmethod
@@ -14,6 +14,8 @@ import asyncpg
 import os
 from dotenv import load_dotenv
 
+from app.schema import SCHEMA_INDEXES, SCHEMA_SQL
+
 # Загружаем переменные окружения из файла .env
 load_dotenv()
 
@@ -41,39 +43,26 @@ async def initialize_database():
             )
         """)
         
-        # Читаем SQL-скрипт
-        print("📖 Чтение schema.sql...")
-        try:
-            with open("schema.sql", "r", encoding="utf-8") as f:
-                schema_sql = f.read()
-        except FileNotFoundError:
-            print("❌ Файл schema.sql не найден")
-            await conn.close()
-            return False
-        except Exception as e:
-            print(f"❌ Ошибка при чтении schema.sql: {e}")
+        # Схема целиком одним запросом, затем индексы по одному
+        # (CREATE INDEX CONCURRENTLY нельзя выполнять внутри транзакции)
+        if not SCHEMA_SQL:
+            print("❌ Файл schema.sql не найден или пуст")
             await conn.close()
             return False
         
-        # Выполняем SQL-скрипт
-        print("⚙️ Выполнение SQL-скрипта...")
-        # Разделяем скрипт на отдельные команды по точке с запятой
-        commands = schema_sql.split(";")
+        print("⚙️ Выполнение schema.sql...")
+        await conn.execute(SCHEMA_SQL)
         
-        success_count = 0
-        for i, command in enumerate(commands):
-            command = command.strip()
-            if command:
-                try:
-                    await conn.execute(command)
-                    print(f"✅ Выполнена команда {i+1}: {command[:50]}...")
-                    success_count += 1
-                except Exception as e:
-                    print(f"⚠️ Ошибка при выполнении команды {i+1}: {command[:50]}... Ошибка: {e}")
+        for statement in SCHEMA_INDEXES:
+            try:
+                await conn.execute(statement)
+                print(f"✅ {statement[:70]}...")
+            except Exception as e:
+                print(f"⚠️ Ошибка при создании индекса: {statement[:70]}... Ошибка: {e}")
         
         # Закрываем соединение
         await conn.close()
-        print(f"✅ Таблицы успешно созданы! Успешно выполнено команд: {success_count}")
+        print("✅ Таблицы успешно созданы!")
         return True
         
     except Exception as e:
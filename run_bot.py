@@ -24,11 +24,10 @@ try:
 except ImportError:
     print("⚠️  Библиотека python-dotenv не установлена. Переменные окружения будут читаться из системы.")
 
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+from app.logging_setup import setup_logging
+
+# Настройка логирования (запись в поток вывода выполняется в отдельном потоке)
+setup_logging(level=logging.INFO)
 
 logger = logging.getLogger(__name__)
 
@@ -48,7 +47,7 @@ def check_environment():
     if missing_vars:
         logger.error("❌ Отсутствуют необходимые переменные окружения:")
         for var in missing_vars:
-            logger.error(f"   - {var}")
+            logger.error("   - %s", var)
         logger.error("💡 Создайте файл .env и добавьте необходимые переменные.")
         return False
     
@@ -68,14 +67,21 @@ async def main():
         from app.main import main as bot_main
         await bot_main()
     except Exception as e:
-        logger.error(f"💥 Критическая ошибка при запуске бота: {e}")
+        logger.error("💥 Критическая ошибка при запуске бота: %s", e)
         raise
 
 if __name__ == "__main__":
+    try:
+        # Цикл событий на libuv быстрее стандартного; если uvloop нет, работаем на asyncio
+        import uvloop
+        uvloop.install()
+    except ImportError:
+        pass
+
     try:
         asyncio.run(main())
     except KeyboardInterrupt:
         logger.info("👋 Бот остановлен пользователем")
     except Exception as e:
-        logger.error(f"💥 Неожиданная ошибка: {e}")
+        logger.error("💥 Неожиданная ошибка: %s", e)
         sys.exit(1)
\ No newline at end of file
@@ -43,3 +43,21 @@ CREATE TABLE IF NOT EXISTS dialog_history (
     content TEXT NOT NULL,                    -- Содержание сообщения
     created_at TIMESTAMP DEFAULT now()        -- Время создания записи
 );
+
+-- Популярные команды для /stats (обновляется ботом в фоне)
+CREATE MATERIALIZED VIEW IF NOT EXISTS logs_popular_commands AS
+SELECT command, COUNT(*) AS count
+FROM logs
+WHERE command IS NOT NULL
+GROUP BY command
+ORDER BY count DESC
+LIMIT 5;
+
+-- Число уникальных пользователей для /stats (одна строка, обновляется вместе
+-- с популярными командами)
+CREATE MATERIALIZED VIEW IF NOT EXISTS logs_unique_users AS
+SELECT 1 AS id, COUNT(DISTINCT username) AS unique_users
+FROM logs;
+
+-- Индексы создаются CONCURRENTLY, а такие команды нельзя выполнять
+-- внутри транзакции; их список - SCHEMA_INDEXES в app/schema.py
@@ -0,0 +1,69 @@
+"""Тесты TTLCache: срок жизни, вытеснение по LRU и базовые операции."""
+
+import pytest
+
+from app.utils.cache import TTLCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Управляемые часы вместо time.monotonic, чтобы не ждать sleep."""
+    now = [1000.0]
+    monkeypatch.setattr("app.utils.cache.time.monotonic", lambda: now[0])
+    return now
+
+
+def test_entry_expires_after_ttl(clock):
+    cache = TTLCache(ttl=10)
+    cache.set("a", 1)
+
+    clock[0] += 10
+    assert cache.get("a") == 1
+
+    clock[0] += 0.5
+    assert cache.get("a") is None
+    assert "a" not in cache
+    assert len(cache) == 0
+
+
+def test_expired_entry_returns_default(clock):
+    cache = TTLCache(ttl=1)
+    cache.set("a", 1)
+    clock[0] += 2
+    assert cache.get("a", "default") == "default"
+
+
+def test_least_recently_used_entry_is_evicted(clock):
+    cache = TTLCache(ttl=60, maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    # Обращение к "a" делает самой старой запись "b"
+    assert cache.get("a") == 1
+
+    cache.set("c", 3)
+
+    assert len(cache) == 2
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_set_overwrites_value_and_refreshes_ttl(clock):
+    cache = TTLCache(ttl=10, maxsize=2)
+    cache.set("a", 1)
+    clock[0] += 8
+    cache.set("a", 2)
+
+    assert len(cache) == 1
+    clock[0] += 8
+    assert cache.get("a") == 2
+
+
+def test_pop_missing_key_returns_default(clock):
+    cache = TTLCache(ttl=10)
+    assert cache.pop("missing") is None
+    assert cache.pop("missing", "default") == "default"
+
+    cache.set("a", 1)
+    assert cache.pop("a") == 1
+    assert "a" not in cache
@@ -0,0 +1,35 @@
+"""Тесты усечения ответов под лимиты Telegram."""
+
+import pytest
+
+from app.utils.text import TRUNCATED_SUFFIX, truncate_reply
+
+
+def utf16_units(text: str) -> int:
+    return len(text.encode("utf-16-le")) // 2
+
+
+def test_short_reply_is_returned_as_is():
+    text = "Привет 🙂"
+    assert truncate_reply(text, limit=100) is text
+
+
+@pytest.mark.parametrize("text", [
+    "я" * 5000,
+    "😀" * 5000,
+    "a😀" * 3000,
+    "𝔘𝔫𝔦𝔠𝔬𝔡𝔢 " * 1000,
+])
+@pytest.mark.parametrize("limit", [4096, 3500, 21, 5])
+def test_truncated_reply_fits_limit(text, limit):
+    result = truncate_reply(text, limit=limit)
+    assert utf16_units(result) <= limit
+    if limit >= utf16_units(TRUNCATED_SUFFIX):
+        assert result.endswith(TRUNCATED_SUFFIX)
+    # На границе среза не остаётся половины суррогатной пары
+    result.encode("utf-8")
+
+
+def test_reply_exactly_at_limit_is_not_truncated():
+    text = "😀" * 2048
+    assert truncate_reply(text, limit=4096) == text